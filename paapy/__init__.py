@@ -1,9 +1,70 @@
 #!/usr/bin/env
 # -*- coding: utf-8 -*-
-from paapy.productadvertising import *
-from paapy.api import *
-from paapy.exceptions import *
+"""
+paapy loads its submodules on first use, so importing the package (for
+the exceptions, say) stays cheap.  Python 3.7+ resolves the names below
+through a module __getattr__, older versions through a module subclass
+that replaces paapy in sys.modules.
+"""
+import importlib
 import logging
+import sys
+import types
+
+from paapy.exceptions import *
+
+# public name -> module it is imported from
+_LAZY_NAMES = dict(
+    [(name, 'paapy.productadvertising') for name in ['ProductAdvertisingAPI', 'Signer']] +
+    [(name, 'paapy.api') for name in [
+        'Amazon', 'AmazonCart', 'CartItems', 'LookupResult', 'CART_ITEM_FIELDS',
+        'FOUND', 'INVALID', 'NOT_ACCESSIBLE', 'NOT_FOUND', 'THROTTLED',
+        'ITEM_ERROR_STATUS', 'NEGATIVE_TTL', 'is_throttled', 'merge_items']]
+)
+
+# the tools, paapy.standin and paapy.loadgen, are only loaded by importing them
+_SUBMODULES = ['api', 'cache', 'cartmanager', 'changes', 'columnar', 'crawler', 'deadline',
+               'exceptions', 'fields', 'hedging', 'idplanner', 'parsing', 'pipeline', 'pool',
+               'productadvertising', 'quota', 'ratelimit', 'scheduler', 'transport']
+
+def _load(name):
+    """the submodule or lazy name called name"""
+    if name in _SUBMODULES:
+        return importlib.import_module('paapy.' + name)
+    if name not in _LAZY_NAMES:
+        raise AttributeError("module 'paapy' has no attribute '%s'" % name)
+    return getattr(importlib.import_module(_LAZY_NAMES[name]), name)
+
+
+if sys.version_info >= (3, 7):
+
+    def __getattr__(name):
+        value = _load(name)
+        globals()[name] = value
+        return value
+
+    def __dir__():
+        return sorted(set(globals()) | set(_LAZY_NAMES) | set(_SUBMODULES))
+
+else:
+
+    class _LazyModule(types.ModuleType):
+
+        """paapy where there is no module __getattr__"""
+
+        def __getattr__(self, name):
+            value = _load(name)
+            setattr(self, name, value)
+            return value
+
+        def __dir__(self):
+            return sorted(set(self.__dict__) | set(_LAZY_NAMES) | set(_SUBMODULES))
+
+    _module = _LazyModule(__name__, __doc__)
+    _module.__dict__.update(globals())
+    # Python 2 clears the globals of a module once it is freed, keep this one
+    _module._original = sys.modules[__name__]
+    sys.modules[__name__] = _module
 
 try:
     from logging import NullHandler
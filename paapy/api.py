@@ -9,16 +9,47 @@ CartId is returned in Response from CartCreate.
 AssociateTag is required along with AWSAccessKeyId and AWSAccessKeySecret
 """
 from __future__ import print_function
-from collections import OrderedDict
+from collections import OrderedDict, namedtuple
 import logging
 import json
 
-from paapy.productadvertising import ProductAdvertisingAPI
-from paapy.exceptions import CartException
+from paapy.productadvertising import ProductAdvertisingAPI, Signer, STRING_TYPES
+from paapy.cache import ItemCache, NegativeCache
+from paapy.columnar import ColumnBuilder, DEFAULT_COLUMNS
+from paapy.fields import fields_covered, merge_items, plan_response_groups
+from paapy.idplanner import isbn10_to_13, normalize_id, plan_ids
+from paapy.ratelimit import RateLimiter
+from paapy.transport import RequestsTransport
+from paapy.exceptions import AmazonException, CacheException, CartException
 
 
 LOGGER = logging.getLogger(__name__)
 
+CART_ITEM_FIELDS = ('ASIN', 'CartItemId', 'Quantity', 'Price', 'Title')
+
+# ItemLookup status of a single ItemId
+FOUND = 'Found'
+INVALID = 'Invalid'
+NOT_ACCESSIBLE = 'NotAccessible'
+NOT_FOUND = 'NotFound'
+THROTTLED = 'Throttled'
+
+# per-item error codes; any other error fails the whole request
+ITEM_ERROR_STATUS = {
+    'AWS.InvalidParameterValue': INVALID,
+    'AWS.ECommerceService.ItemNotAccessible': NOT_ACCESSIBLE,
+    'AWS.ECommerceService.NoExactMatches': NOT_FOUND
+}
+
+# seconds an ItemId with each status is skipped by lookups, see NegativeCache
+NEGATIVE_TTL = {
+    INVALID: 7 * 24 * 3600,
+    NOT_ACCESSIBLE: 24 * 3600,
+    NOT_FOUND: 6 * 3600
+}
+
+LookupResult = namedtuple('LookupResult', ['item_id', 'status', 'item', 'error'])
+
 
 class Amazon(ProductAdvertisingAPI):
 
@@ -29,25 +60,63 @@ class Amazon(ProductAdvertisingAPI):
     """
 
     def __init__(self, AssociateTag, AWSAccessKeyId, AWSAccessKeySecret, **kwargs):
+        item_cache = kwargs.pop('item_cache', None)
+        negative_cache = kwargs.pop('negative_cache', None)
+        negative_ttl = dict(NEGATIVE_TTL, **kwargs.pop('negative_ttl', {}))
+        cache = kwargs.pop('cache', None)
+        cache_ttl = kwargs.pop('cache_ttl', 3600)
         super(Amazon, self).__init__(AssociateTag, AWSAccessKeyId, AWSAccessKeySecret, **kwargs)
         # self.cart = AmazonCart(AssociateTag, AWSAccessKeyId, AWSAccessKeySecret)
         self.item_lookup_max = 10
+        # merged items of lookup_fields and when each ResponseGroup was fetched
+        self.item_cache = item_cache if item_cache is not None else ItemCache()
+        # ItemIds reported missing, skipped until their entry expires; True enables it
+        if negative_cache is True:
+            negative_cache = NegativeCache(negative_ttl)
+        self.negative_cache = negative_cache if negative_cache is not False else None
+        # CacheBackend for lookup results, shared by every client using it
+        self.cache = cache
+        self.cache_ttl = cache_ttl
 
     def lookup(self, ItemId, **kwargs):
         """
         lookup a list of items from ItemId, if trying to lookup multiple
         ItemId, lookup will execute requests in batches of 10.
         """
-        if isinstance(ItemId, str):
+        self._start_deadline(kwargs)
+        if isinstance(ItemId, STRING_TYPES):
             ItemId = ItemId.split(',') if ',' in ItemId else ItemId
         ItemId = ItemId if isinstance(ItemId, list) else [ItemId]
 
         resp_group = kwargs.pop('ResponseGroup', 'ItemAttributes,OfferFull,Offers,Images,Large')
+        raise_errors = kwargs.pop('raise_errors', True)
+
+        known = OrderedDict()
+        for item_id in ItemId:
+            entry = self._known_missing(item_id)
+            if entry:
+                known[item_id] = entry
+        if known:
+            if raise_errors:
+                self._raise_known_missing(known)
+            LOGGER.info('Skipping %s ItemIds known to be missing: %s', len(known), ','.join(known))
+            ItemId = [i for i in ItemId if i not in known]
+
+        cached, keys = {}, {}
+        if self.cache is not None and kwargs.get('ItemIdType', 'ASIN') == 'ASIN':
+            keys = OrderedDict((i, self._cache_key(i, resp_group, kwargs)) for i in ItemId)
+            cached = self._cache_get(keys)
+            requested, ItemId = ItemId, [i for i in ItemId if i not in cached]
 
         items = []
         for i in xrange(0, len(ItemId), self.item_lookup_max):
-            response = self.ItemLookup(ItemId=','.join(ItemId[i : i + self.item_lookup_max]),
-                                       ResponseGroup=resp_group, **kwargs)
+            batch = ItemId[i : i + self.item_lookup_max]
+            response = self.ItemLookup(ItemId=','.join(batch), ResponseGroup=resp_group,
+                                       raise_errors=False, **kwargs)
+            request = response['Items']['Request']
+            self._remember_missing(batch, self._parse_errors(request))
+            if raise_errors:
+                self._handle_errors(request)
             try:
                 xml = response['Items']['Item']
             except KeyError:
@@ -55,8 +124,367 @@ class Amazon(ProductAdvertisingAPI):
             xml = [xml] if not isinstance(xml, list) else xml
             items.extend(xml)
 
+        if keys:
+            self._cache_set(dict((keys[i['ASIN']], i) for i in items if i.get('ASIN') in keys))
+            found = dict((i['ASIN'], i) for i in items)
+            found.update(cached)
+            items = [found[i] for i in requested if i in found]
         return items
 
+    def _cache_key(self, item_id, ResponseGroup, kwargs):
+        params = sorted((k, v) for k, v in kwargs.items() if k not in ('deadline', 'priority'))
+        params = '&'.join('%s=%s' % param for param in params)
+        return 'item:%s:%s:%s:%s' % (self.Region, ResponseGroup, params, item_id)
+
+    def _cache_get(self, keys):
+        """cached items of keys (ItemId -> cache key), a cache failure is a miss"""
+        try:
+            values = self.cache.get_many(keys.values())
+        except CacheException as err:
+            LOGGER.warning('Cache read failed: %s', err)
+            return {}
+        return dict((item_id, values[key]) for item_id, key in keys.items() if key in values)
+
+    def _cache_set(self, values):
+        try:
+            self.cache.set_many(values, self.cache_ttl)
+        except CacheException as err:
+            LOGGER.warning('Cache write failed: %s', err)
+
+    def lookup_results(self, ItemId, **kwargs):
+        """
+        lookup ItemId in batches of 10 like lookup(), but report a
+        LookupResult for every ItemId instead of raising when some of a
+        batch fail.  Returns an OrderedDict of ItemId to LookupResult with
+        status FOUND, INVALID, NOT_ACCESSIBLE, NOT_FOUND or THROTTLED.
+        Malformed ASINs are marked INVALID without a request.
+        """
+        self._start_deadline(kwargs)
+        ItemId = self._parse_multiple_items(ItemId)
+        kwargs.setdefault('ResponseGroup', 'ItemAttributes,OfferFull,Offers,Images,Large')
+        results = OrderedDict((item_id, None) for item_id in ItemId)
+        valid = []
+        for item_id in results:
+            try:
+                self._check_valid_asin(item_id)
+            except ValueError as err:
+                results[item_id] = LookupResult(item_id, INVALID, None, str(err))
+                continue
+            known = self._known_missing(item_id)
+            if known:
+                results[item_id] = LookupResult(item_id, known[0], None, known[1])
+            else:
+                valid.append(item_id)
+        for i in xrange(0, len(valid), self.item_lookup_max):
+            batch = self._lookup_batch(valid[i : i + self.item_lookup_max], kwargs)
+            if self.negative_cache is not None:
+                for result in batch.values():
+                    self.negative_cache.put(self.Region, result.item_id, result.status,
+                                            result.error)
+            results.update(batch)
+        return results
+
+    def _known_missing(self, item_id):
+        """(status, error) if item_id is in the negative cache"""
+        if self.negative_cache is None:
+            return None
+        return self.negative_cache.get(self.Region, item_id)
+
+    def _raise_known_missing(self, known):
+        """raise the cached errors of known (ItemId -> (status, error)) like Amazon's"""
+        error_output = []
+        for item_id, (status, error) in known.items():
+            error = error or '%s  -  %s' % (status, item_id)
+            LOGGER.error('%s (cached)', error)
+            error_output.append(error)
+        raise AmazonException(' , '.join(error_output))
+
+    def _remember_missing(self, ItemId, errors):
+        """add the ItemIds named by per-item errors to the negative cache"""
+        if self.negative_cache is None:
+            return
+        for code, message in errors:
+            status = ITEM_ERROR_STATUS.get(code)
+            for item_id in ItemId if status else []:
+                if item_id in message:
+                    self.negative_cache.put(self.Region, item_id, status,
+                                            '%s  -  %s' % (code, message))
+
+    def _lookup_batch(self, ItemId, kwargs):
+        """
+        LookupResults for one batch.  Errors naming an ItemId are applied to
+        it, errors that don't are matched to the ItemIds missing from the
+        response, bisecting the batch only if that match is ambiguous.
+        """
+        try:
+            response = self.ItemLookup(ItemId=ItemId, raise_errors=False, **kwargs)
+        except AmazonException as err:
+            if not is_throttled(err):
+                raise
+            return OrderedDict((i, LookupResult(i, THROTTLED, None, str(err))) for i in ItemId)
+
+        xml = response['Items'].get('Item') or []
+        xml = [xml] if not isinstance(xml, list) else xml
+        results = OrderedDict()
+        for item in xml:
+            if item.get('ASIN') in ItemId:
+                results[item['ASIN']] = LookupResult(item['ASIN'], FOUND, item, None)
+
+        unattributed = []
+        for code, message in self._parse_errors(response['Items']['Request']):
+            status = ITEM_ERROR_STATUS.get(code)
+            if status is None:
+                raise AmazonException('%s  -  %s' % (code, message))
+            named = [i for i in ItemId if i not in results and i in message]
+            for item_id in named:
+                results[item_id] = LookupResult(item_id, status, None,
+                                                '%s  -  %s' % (code, message))
+            if not named:
+                unattributed.append((status, '%s  -  %s' % (code, message)))
+
+        missing = [i for i in ItemId if i not in results]
+        statuses = set(status for status, _ in unattributed)
+        if missing and (len(missing) == 1 or len(statuses) <= 1 and
+                        len(unattributed) in (0, len(missing))):
+            status, error = unattributed[0] if unattributed else (NOT_FOUND, None)
+            for item_id in missing:
+                results[item_id] = LookupResult(item_id, status, None, error)
+        elif missing:
+            LOGGER.warning('Bisecting %s ItemIds to attribute their errors.', len(missing))
+            half = len(missing) // 2
+            results.update(self._lookup_batch(missing[:half], kwargs))
+            results.update(self._lookup_batch(missing[half:], kwargs))
+
+        return OrderedDict((i, results[i]) for i in ItemId)
+
+    def lookup_ids(self, ItemId, SearchIndex=None, **kwargs):
+        """
+        lookup a mixed list of ASINs, UPCs, EANs and ISBNs.  Ids are
+        normalized, deduplicated and grouped into one batch of up to 10 per
+        ItemIdType.  ISBNs are looked up in the Books SearchIndex, which
+        Amazon requires for them, other types in SearchIndex (default All).
+        Returns an OrderedDict of each input id to the list of items found
+        for it; ids that are invalid or not found map to [].
+        """
+        self._start_deadline(kwargs)
+        plan = plan_ids(self._parse_multiple_items(ItemId), self.item_lookup_max)
+        results = OrderedDict((item_id, []) for item_id in self._parse_multiple_items(ItemId))
+        for id_type, codes in plan.batches():
+            params = dict(kwargs, raise_errors=False)
+            if id_type != 'ASIN':
+                params.update(ItemIdType=id_type, SearchIndex=SearchIndex or
+                              ('Books' if id_type == 'ISBN' else 'All'))
+                groups = params.get('ResponseGroup', 'ItemAttributes,OfferFull,Offers,Images,Large')
+                if 'ItemAttributes' not in groups and 'Large' not in groups:
+                    params['ResponseGroup'] = groups + ',ItemAttributes'
+            wanted = set(codes)
+            for item in self.lookup(codes, **params):
+                matches = set([item.get('ASIN')]) if id_type == 'ASIN' else _item_codes(item)
+                for code in matches & wanted:
+                    for item_id in plan.originals[code]:
+                        results[item_id].append(item)
+        return results
+
+    def lookup_fields(self, ItemId, fields, **kwargs):
+        """
+        lookup ItemId requesting only the smallest set of ResponseGroups that
+        returns the fields (names from paapy.fields.FIELD_GROUPS).  Items are
+        merged into self.item_cache (an ItemCache), so later calls only fetch
+        the groups an item is missing or that have gone stale.  Returns the
+        merged items.
+        """
+        self._start_deadline(kwargs)
+        ItemId = self._parse_multiple_items(ItemId)
+        fields = set(self._parse_multiple_items(fields))
+        batches = OrderedDict()
+        for asin in OrderedDict.fromkeys(ItemId):
+            missing = fields - fields_covered(self.item_cache.fresh_groups(asin))
+            if missing:
+                groups = tuple(plan_response_groups(missing))
+                batches.setdefault(groups, []).append(asin)
+
+        merged = {}
+        for groups, asins in batches.items():
+            for item in self.lookup(asins, ResponseGroup=','.join(groups), **kwargs):
+                merged[item['ASIN']] = self.item_cache.merge(item, groups)
+        for asin in ItemId:
+            if asin not in merged:
+                item = self.item_cache.get(asin)
+                if item is not None:
+                    merged[asin] = item
+        return [merged[asin] for asin in ItemId if asin in merged]
+
+    def lookup_columns(self, ItemId, columns=None, **kwargs):
+        """
+        lookup ItemId like lookup(), but add each batch of items to a
+        ColumnBuilder as it arrives instead of returning a list of items.
+        Pass builder to keep filling an existing ColumnBuilder.
+        """
+        self._start_deadline(kwargs)
+        builder = kwargs.pop('builder', None) or ColumnBuilder(columns or DEFAULT_COLUMNS)
+        ItemId = self._parse_multiple_items(ItemId)
+        for i in xrange(0, len(ItemId), self.item_lookup_max):
+            builder.extend(self.lookup(ItemId[i : i + self.item_lookup_max], **kwargs))
+        return builder
+
+
+def is_throttled(err):
+    """True if the AmazonException err means the request was throttled"""
+    return getattr(err, 'code', None) == 'RequestThrottled' or \
+        getattr(err, 'status_code', None) == 503
+
+
+def _item_codes(item):
+    """every UPC, EAN and ISBN of an item, in the forms plan_ids produces"""
+    attributes = item.get('ItemAttributes') or {}
+    values = []
+    for key, list_key in (('UPC', 'UPCList'), ('EAN', 'EANList'),
+                          ('ISBN', None), ('EISBN', None)):
+        values.append(attributes.get(key))
+        if list_key and isinstance(attributes.get(list_key), dict):
+            values.append(attributes[list_key].get(list_key + 'Element'))
+    codes = set()
+    for value in values:
+        for code in (value if isinstance(value, list) else [value]):
+            if not code:
+                continue
+            code = normalize_id(code)
+            codes.add(code)
+            if len(code) == 12:
+                codes.add('0' + code)
+            elif len(code) == 13 and code.startswith('0'):
+                codes.add(code[1:])
+            elif len(code) == 10 and code[:9].isdigit():
+                codes.add(isbn10_to_13(code))
+    return codes
+
+
+class CartItems(list):
+
+    """
+    Items of an AmazonCart, a list of item dicts that is also indexed by
+    CartItemId and ASIN, so lookups and quantity changes are O(1), and
+    the subtotal is kept up to date as items change.  Change the items
+    through put, discard, set_quantity, replace and clear, the list
+    methods don't update the indexes.  Removing an item rewrites the
+    list, so remove several at once with discard_many or set_quantities.
+    """
+
+    def __init__(self, items=None):
+        super(CartItems, self).__init__()
+        self._by_id = {}
+        self._asins = {}
+        self._subtotal = 0
+        self.replace(items or [])
+
+    def __contains__(self, item_id):
+        if isinstance(item_id, dict):
+            return super(CartItems, self).__contains__(item_id)
+        return item_id in self._by_id or item_id in self._asins
+
+    def __repr__(self):
+        return 'CartItems(%s)' % super(CartItems, self).__repr__()
+
+    @staticmethod
+    def _cents(item):
+        try:
+            return int(round(float(item['Price']) * 100)) * int(item['Quantity'])
+        except (KeyError, TypeError, ValueError):
+            return 0
+
+    @property
+    def subtotal(self):
+        """sum of Price * Quantity over all items"""
+        return self._subtotal / 100.0
+
+    def get(self, item_id, default=None):
+        """look up an item by CartItemId or ASIN"""
+        item = self._by_id.get(item_id)
+        if item is None and item_id in self._asins:
+            item = self._by_id[self._asins[item_id]]
+        return item if item is not None else default
+
+    def by_asin(self, asin):
+        """return the item with this ASIN, or None"""
+        cart_item_id = self._asins.get(asin)
+        return self._by_id[cart_item_id] if cart_item_id is not None else None
+
+    def by_cart_item_id(self, cart_item_id):
+        """return the item with this CartItemId, or None"""
+        return self._by_id.get(cart_item_id)
+
+    def put(self, item):
+        """insert or replace an item"""
+        self.discard(item['CartItemId'])
+        self.append(item)
+        self._by_id[item['CartItemId']] = item
+        self._asins[item['ASIN']] = item['CartItemId']
+        self._subtotal += self._cents(item)
+
+    def discard(self, cart_item_id):
+        """remove an item if it is present"""
+        removed = self.discard_many([cart_item_id])
+        return removed[0] if removed else None
+
+    def discard_many(self, cart_item_ids):
+        """remove the items present, in one pass over the list, return them"""
+        removed = []
+        for cart_item_id in cart_item_ids:
+            item = self._by_id.pop(cart_item_id, None)
+            if item is None:
+                continue
+            removed.append(item)
+            self._subtotal -= self._cents(item)
+            if self._asins.get(item['ASIN']) == cart_item_id:
+                del self._asins[item['ASIN']]
+        if removed:
+            # by identity, another item dict may compare equal
+            gone = set(id(item) for item in removed)
+            self[:] = [item for item in self if id(item) not in gone]
+        return removed
+
+    def set_quantity(self, cart_item_id, quantity):
+        """change the quantity of an item, a quantity of 0 removes it"""
+        changed = self.set_quantities([(cart_item_id, quantity)])
+        return changed[0] if changed else None
+
+    def set_quantities(self, quantities):
+        """
+        set_quantity for each (CartItemId, quantity), removing the items
+        whose quantity drops to 0 together.  Return the items changed.
+        """
+        changed, removed = [], []
+        for cart_item_id, quantity in quantities:
+            item = self._by_id.get(cart_item_id)
+            if item is None:
+                continue
+            quantity = int(quantity)
+            if quantity <= 0:
+                removed.append(cart_item_id)
+                continue
+            self._subtotal -= self._cents(item)
+            item['Quantity'] = quantity
+            self._subtotal += self._cents(item)
+            changed.append(item)
+        return changed + self.discard_many(removed)
+
+    def replace(self, items):
+        """replace all items"""
+        self.clear()
+        for item in items:
+            self.put(item)
+
+    def clear(self):
+        """remove all items"""
+        del self[:]
+        self._by_id.clear()
+        self._asins.clear()
+        self._subtotal = 0
+
+    def to_list(self):
+        """items as a plain list of dicts"""
+        return list(self)
+
 
 class AmazonCart(ProductAdvertisingAPI):
 
@@ -74,8 +502,10 @@ class AmazonCart(ProductAdvertisingAPI):
         self.cart_id = kwargs.get('CartId')
         self.hmac = kwargs.get('HMAC')
         self.url = kwargs.get('URL')
-        self.items = kwargs.get('CartItems', [])
-        self.subtotal = kwargs.get('SubTotal', 0.0)
+        self.items = CartItems(kwargs.get('CartItems', []))
+        self.subtotal = kwargs.get('SubTotal', self.items.subtotal)
+        self.pending = OrderedDict()
+        self.verify_pending = False
         if not self.cart_id and item_id:
             self.create(ItemId=item_id, Quantity=quantity)
 
@@ -87,6 +517,67 @@ class AmazonCart(ProductAdvertisingAPI):
         if self._response:
             print(json.dumps(self._response, indent=4))
 
+    @classmethod
+    def from_dict(cls, state, AssociateTag, AWSAccessKeyId, AWSAccessKeySecret, **kwargs):
+        """
+        Rebuild a cart saved with to_dict() or dumps() without any API call.
+        If verify='lazy', a CartGet is made before the cart is next changed.
+        """
+        verify = kwargs.pop('verify', False)
+        if not isinstance(state, dict):
+            state = json.loads(state)
+        cart = cls(AssociateTag, AWSAccessKeyId, AWSAccessKeySecret,
+                   CartId=state['CartId'], HMAC=state['HMAC'], URL=state.get('URL'),
+                   CartItems=[dict(zip(CART_ITEM_FIELDS, i)) for i in state.get('CartItems', [])],
+                   SubTotal=state.get('SubTotal', 0.0), **kwargs)
+        cart.verify_pending = verify == 'lazy'
+        return cart
+
+    @classmethod
+    def rehydrate(cls, states, AssociateTag, AWSAccessKeyId, AWSAccessKeySecret, **kwargs):
+        """
+        Rebuild many saved carts at once, without any API call.
+        All carts share one transport, Signer and RateLimiter (if qps is given).
+        Keyword arguments are as for from_dict().
+        """
+        if kwargs.get('transport') is None:
+            kwargs['transport'] = RequestsTransport()
+        if kwargs.get('signer') is None:
+            kwargs['signer'] = Signer(AWSAccessKeySecret)
+        qps = kwargs.pop('qps', None)
+        if kwargs.get('limiter') is None and qps:
+            kwargs['limiter'] = RateLimiter(qps)
+        return [cls.from_dict(state, AssociateTag, AWSAccessKeyId, AWSAccessKeySecret, **kwargs)
+                for state in states]
+
+    def to_dict(self):
+        """
+        Compact, JSON serializable cart state.  Items are stored as lists
+        in the order of CART_ITEM_FIELDS.
+        """
+        return {
+            'AWSAccessKeyId': self.AWSAccessKeyId,
+            'CartId': self.cart_id,
+            'HMAC': self.hmac,
+            'URL': self.url,
+            'SubTotal': self.subtotal,
+            'CartItems': [[item.get(k) for k in CART_ITEM_FIELDS] for item in self.items]
+        }
+
+    def dumps(self):
+        """cart state as a JSON string"""
+        return json.dumps(self.to_dict(), separators=(',', ':'))
+
+    def _verify(self):
+        """refresh a lazily rehydrated cart with CartGet before it is used"""
+        if not self.verify_pending:
+            return self
+        self.verify_pending = False
+        if len(self.items) == 0:
+            LOGGER.debug('Cart %s has no items to verify with CartGet.', self.cart_id)
+            return self
+        return self.get(self.cart_id, self.items[0]['CartItemId'], self.hmac)
+
     def _update(self, response):
         """update instance properties from response"""
         # Update most important properties
@@ -95,61 +586,50 @@ class AmazonCart(ProductAdvertisingAPI):
             self.hmac = response['Cart']['HMAC']
         except KeyError as err:
             raise CartException('%s not in Cart Response!' % err)
-        # Get URL and SubTotal
-        try:
-            self.url = response['Cart'].get('PurchaseURL', self.url)
-            subtotal = response['Cart'].get('SubTotal', {}).get('Amount', self.subtotal)
-            self.subtotal = int(subtotal) / 100.0
-        except (ValueError, TypeError):
-            LOGGER.warn('Error parsing subtotal for response')
-        # update items; Create (and Get?) returns CartItems
+        # update items; Create, Add and Get return CartItems
         # otherwise it will change the Quantity values in self.items
         request = response['Cart']['Request']
         if 'CartClearRequest' in request:
-            self.items = []
+            self.items.clear()
         elif 'CartCreateRequest' in request:
-            self.items = self._parse_cart_items(response)
+            self.items.replace(self._parse_cart_items(response))
         elif 'CartAddRequest' in request:
-            self.items = self._parse_cart_items(response)
+            self.items.replace(self._parse_cart_items(response))
         elif 'CartModifyRequest' in request:
-            self.items = self._parse_modified_items(response)
+            self.items.set_quantities(self._parse_modified_items(response))
         elif 'CartGetRequest' in request:
-            self.items = self._parse_cart_items(response)
+            self.items.replace(self._parse_cart_items(response))
         else:
-            raise CartException('Unknown Request Type!' % str(request))
+            raise CartException('Unknown Request Type: %s' % str(request))
+        # Get URL and SubTotal
+        try:
+            self.url = response['Cart'].get('PurchaseURL', self.url)
+            subtotal = response['Cart'].get('SubTotal', {}).get('Amount')
+            self.subtotal = int(subtotal) / 100.0 if subtotal is not None \
+                            else self.items.subtotal
+        except (ValueError, TypeError):
+            LOGGER.warn('Error parsing subtotal for response')
 
         return self
 
     def _parse_modified_items(self, response):
         """
-        CartModify does not return CartItems, must make relative update
+        CartModify does not return CartItems, must make relative update.
+        Returns a list of (CartItemId, Quantity) pairs.
         """
-        # cart_items = self._parse_cart_items(response)
         mod_items = response['Cart']['Request']['CartModifyRequest']['Items']['Item']
         if mod_items is None:
             items = []
-        elif isinstance(mod_items, OrderedDict):
+        elif isinstance(mod_items, dict):
             items = [dict(mod_items)]
         else:
             items = [dict(ord_dict) for ord_dict in mod_items]
 
-        mod_ids = {i['CartItemId']: i['Quantity'] for i in items}
         parsed_items = []
-        for item in self.items:
+        for item in items:
             try:
-                if item['CartItemId'] not in mod_ids:
-                    parsed_items.append(item)
-                else:
-                    quantity = int(mod_ids[item['CartItemId']])
-                    if quantity > 0:
-                        parsed_items.append({
-                            'ASIN': item['ASIN'],
-                            'CartItemId': item['CartItemId'],
-                            'Title': item['Title'],
-                            'Quantity': quantity,
-                            'Price': int(item['Price'])
-                        })
-            except (KeyError, IndexError):
+                parsed_items.append((item['CartItemId'], int(item['Quantity'])))
+            except (KeyError, TypeError, ValueError):
                 LOGGER.error('Error parsing item: %s', item)
 
         return parsed_items
@@ -163,7 +643,7 @@ class AmazonCart(ProductAdvertisingAPI):
 
         if new_items is None:
             items = []
-        elif isinstance(new_items, OrderedDict):
+        elif isinstance(new_items, dict):
             items = [dict(new_items)]
         else:
             items = [dict(ord_dict) for ord_dict in new_items]
@@ -198,6 +678,7 @@ class AmazonCart(ProductAdvertisingAPI):
         """
         Clears the contents of the Cart
         """
+        self._verify()
         if not self.cart_id or not self.hmac:
             LOGGER.error('Clearing Cart before it has been initialized.  Please create one first')
             return self
@@ -222,19 +703,20 @@ class AmazonCart(ProductAdvertisingAPI):
         remove ItemId from Cart.
         Is really just a modify call with Quantity=0
         """
+        self._verify()
         ItemId = self._parse_multiple_items(ItemId)
         Quantity = self._parse_multiple_items(kwargs.pop('Quantity', 0))
         if len(Quantity) == 1:
             Quantity = Quantity * len(ItemId)
 
-        item_ref = {item['ASIN']: item['Quantity'] for item in self.items}
         rem_items, rem_quantity = [], []
         for item_id, quantity in zip(ItemId, Quantity):
             # sku already in cart, so just want to update itemQuantity -= Quantity
-            if item_id in item_ref:
+            item = self.items.by_asin(item_id)
+            if item is not None:
                 rem_items.append(item_id)
                 if quantity > 0:
-                    rem_quantity.append(max(int(item_ref[item_id] - int(quantity)), 0))
+                    rem_quantity.append(max(int(item['Quantity'] - int(quantity)), 0))
                 else:
                     rem_quantity.append(quantity)
 
@@ -247,17 +729,15 @@ class AmazonCart(ProductAdvertisingAPI):
         or move items to "SaveForLater".  Cannot add new items to the cart.
         If Quantity is not given, it defaults to 0 (remove the item)
         """
-        asin_lookup = {item['ASIN']: item for item in self.items}
-        cartitem_lookup = {item['CartItemId']: item for item in self.items}
+        self._verify()
         ItemId = self._parse_multiple_items(ItemId)
 
         # classify the itemId, ASIN vs CartItemId
-        cart_item_ids = {}
+        cart_item_ids = OrderedDict()
         for i in ItemId:
-            if i in asin_lookup:
-                cart_item_ids[asin_lookup[i]['CartItemId']] = asin_lookup[i]['Quantity']
-            elif i in cartitem_lookup:
-                cart_item_ids[i] = cartitem_lookup[i]['Quantity']
+            item = self.items.get(i)
+            if item is not None:
+                cart_item_ids[item['CartItemId']] = item['Quantity']
             else:
                 LOGGER.warn('%s is not a valid ASIN or CartItemId in the Cart. Ignoring.', i)
 
@@ -266,7 +746,7 @@ class AmazonCart(ProductAdvertisingAPI):
                 Quantity = [Quantity] * len(cart_item_ids)
             
             response = super(AmazonCart, self).CartModify(CartId=self.cart_id, HMAC=self.hmac,
-                                                          CartItemId=cart_item_ids.keys(),
+                                                          CartItemId=list(cart_item_ids.keys()),
                                                           Quantity=Quantity, **kwargs)
 
             self._update(response)
@@ -286,6 +766,7 @@ class AmazonCart(ProductAdvertisingAPI):
         If ItemId already in the Cart, will use CartModify to add to the quantity
         If ItemId not in the Cart, will use CartAdd to add the item
         """
+        self._verify()
         ItemId = kwargs.get('ASIN', ItemId)
         if ItemId is None:
             raise ValueError('Include your ASIN/OfferListingId in '
@@ -302,13 +783,13 @@ class AmazonCart(ProductAdvertisingAPI):
 
         new_items, new_quantity = [], []
         update_items, update_quantity = [], []
-        item_ref = {item['ASIN']: item for item in self.items}
 
         for item_id, quantity in zip(ItemId, Quantity):
             # sku already in cart, so just want to update itemQuantity += Quantity
-            if item_id in item_ref:
+            item = self.items.by_asin(item_id)
+            if item is not None:
                 update_items.append(item_id)
-                update_quantity.append(int(quantity) + int(item_ref[item_id]['Quantity']))
+                update_quantity.append(int(quantity) + int(item['Quantity']))
             else:
                 new_items.append(item_id)
                 new_quantity.append(quantity)
@@ -324,3 +805,81 @@ class AmazonCart(ProductAdvertisingAPI):
             self._update(response)
 
         return self
+
+    def stage(self, ItemId, Quantity=1):
+        """
+        Buffer a change without calling the API.  Quantity is the quantity the
+        item should have after the next flush(), 0 removes it from the Cart.
+        ItemId and Quantity may be lists, as in add().
+        """
+        ItemId = self._parse_multiple_items(ItemId)
+        Quantity = self._parse_multiple_items(Quantity)
+        if len(Quantity) == 1:
+            Quantity *= len(ItemId)
+        self._check_valid_quantity(Quantity)
+        for item_id, quantity in zip(ItemId, Quantity):
+            self.pending[item_id] = int(quantity)
+        return self
+
+    def flush(self, **kwargs):
+        """
+        Apply every staged change with as few requests as possible.
+        """
+        self._verify()
+        desired = OrderedDict((item['ASIN'], item['Quantity']) for item in self.items)
+        desired.update(self.pending)
+        self.sync(desired, **kwargs)
+        self.pending.clear()
+        return self
+
+    def sync(self, desired, **kwargs):
+        """
+        Make the Cart contain exactly the items in desired, a dict of
+        {ASIN: Quantity}.  Items in the Cart but not in desired are removed.
+        The difference from the current items is sent as at most one
+        CartCreate, or one CartClear or CartModify followed by one CartAdd,
+        each request carrying all of its Item.N.* entries.
+        """
+        self._verify()
+        desired = OrderedDict((k, int(v)) for k, v in desired.items())
+        self._check_valid_quantity(list(desired.values()))
+
+        new_items = [(k, v) for k, v in desired.items()
+                     if self.items.by_asin(k) is None and v > 0]
+        if not self.cart_id:
+            if new_items:
+                response = super(AmazonCart, self).CartCreate(
+                    ItemId=[k for k, _ in new_items], Quantity=[v for _, v in new_items],
+                    **kwargs)
+                self._update(response)
+            return self
+
+        changed = [(item['CartItemId'], desired.get(item['ASIN'], 0))
+                   for item in self.items
+                   if desired.get(item['ASIN'], 0) != int(item['Quantity'])]
+
+        if changed and all(quantity == 0 for _, quantity in changed) \
+                and len(changed) == len(self.items):
+            response = super(AmazonCart, self).CartClear(
+                CartId=self.cart_id, HMAC=self.hmac, **kwargs)
+            self._update(response)
+        elif changed:
+            response = super(AmazonCart, self).CartModify(
+                CartId=self.cart_id, HMAC=self.hmac,
+                CartItemId=[k for k, _ in changed],
+                Quantity=[v for _, v in changed], **kwargs)
+            self._update(response)
+
+        if new_items:
+            response = super(AmazonCart, self).CartAdd(
+                CartId=self.cart_id, HMAC=self.hmac,
+                ItemId=[k for k, _ in new_items],
+                Quantity=[v for _, v in new_items], **kwargs)
+            self._update(response)
+
+        return self
+
+
+__all__ = ['Amazon', 'AmazonCart', 'CartItems', 'LookupResult', 'CART_ITEM_FIELDS',
+           'FOUND', 'INVALID', 'NOT_ACCESSIBLE', 'NOT_FOUND', 'THROTTLED',
+           'ITEM_ERROR_STATUS', 'NEGATIVE_TTL', 'is_throttled', 'merge_items']
@@ -0,0 +1,437 @@
+#!/usr/bin/env
+# -*- coding: utf-8 -*-
+
+"""
+Caches.
+A NegativeCache remembers the ItemIds Amazon reported as invalid, not
+accessible or not found, per Region, so lookups can skip them instead of
+spending rate limit capacity on them every refresh.  Each status has its
+own time to live.  An ItemCache keeps the items lookup_fields merges, and
+when each of their ResponseGroups was fetched, so stale groups are fetched
+again.
+
+Lookup results can be kept in a CacheBackend.  MemoryCache is local to
+the process, MemcachedCache speaks the memcached text protocol, so a
+fleet of clients can share one warm cache.  Backends store JSON
+serializable values with a time to live, in bulk, and support
+compare-and-set so one client at a time can own the refresh of a key.
+"""
+
+from abc import ABCMeta, abstractmethod
+from collections import OrderedDict
+from hashlib import sha1
+import itertools
+import json
+import logging
+import socket
+import threading
+import time
+
+from paapy.exceptions import CacheException
+from paapy.fields import merge_items
+
+
+LOGGER = logging.getLogger(__name__)
+
+# memcached reads an exptime over 30 days as a unix timestamp
+MEMCACHED_MAX_TTL = 30 * 24 * 60 * 60
+
+# a base class with ABCMeta on both Python 2 and 3
+_Abstract = ABCMeta('_Abstract', (object,), {})
+
+
+class NegativeCache(object):
+
+    """
+    (Region, ItemId) -> (status, error) until the entry's time to live,
+    which is looked up by status in ttl (seconds), runs out.  Statuses
+    without a ttl are not cached.  At most max_entries are kept, once full
+    the oldest are dropped.  Expired entries are purged first, but at most
+    once per shortest ttl, so a full cache doesn't scan every entry on
+    each put.
+    """
+
+    def __init__(self, ttl, max_entries=100000, clock=time.time):
+        self.ttl = dict(ttl)
+        self.max_entries = int(max_entries)
+        self.clock = clock
+        self._entries = OrderedDict()  # (Region, ItemId) -> (expires, status, error)
+        self._lock = threading.Lock()
+        self._purge_every = min([t for t in self.ttl.values() if t] or [0])
+        self._next_purge = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, Region, item_id):
+        """(status, error) of a cached ItemId, or None"""
+        key = (Region, item_id)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= self.clock():
+                del self._entries[key]
+                return None
+            return entry[1:]
+
+    def put(self, Region, item_id, status, error=None):
+        """cache the status of ItemId, return False if status is not cached"""
+        ttl = self.ttl.get(status)
+        if not ttl:
+            return False
+        key = (Region, item_id)
+        now = self.clock()
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (now + ttl, status, error)
+            full = len(self._entries) > self.max_entries
+            purge = full and now >= self._next_purge
+            if purge:
+                self._next_purge = now + self._purge_every
+        if full:
+            if purge:
+                self.purge()
+            with self._lock:
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return True
+
+    def discard(self, Region, item_id):
+        with self._lock:
+            self._entries.pop((Region, item_id), None)
+
+    def purge(self):
+        """drop expired entries, return how many were dropped"""
+        now = self.clock()
+        with self._lock:
+            expired = [key for key, entry in self._entries.items() if entry[0] <= now]
+            for key in expired:
+                del self._entries[key]
+        return len(expired)
+
+
+class ItemCache(object):
+
+    """
+    Merged items of Amazon.lookup_fields: ASIN -> item, and the time each
+    of its ResponseGroups was fetched.  Groups older than ttl seconds (0
+    never expires) are stale and fetched again.  At most max_items items
+    are kept, the least recently used are dropped first.  Thread-safe.
+    """
+
+    def __init__(self, ttl=3600, max_items=10000, clock=time.time):
+        self.ttl = ttl
+        self.max_items = int(max_items)
+        self.clock = clock
+        self._entries = OrderedDict()  # ASIN -> (item, {ResponseGroup: fetched at})
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, asin):
+        return asin in self._entries
+
+    def _touch(self, asin):
+        entry = self._entries.pop(asin, None)
+        if entry is not None:
+            self._entries[asin] = entry
+        return entry
+
+    def fresh_groups(self, asin):
+        """ResponseGroups of asin fetched less than ttl seconds ago"""
+        with self._lock:
+            entry = self._touch(asin)
+            if entry is None:
+                return []
+            now = self.clock()
+            return [group for group, fetched in entry[1].items()
+                    if not self.ttl or now - fetched < self.ttl]
+
+    def get(self, asin):
+        """merged item of asin, or None"""
+        with self._lock:
+            entry = self._touch(asin)
+            return entry[0] if entry is not None else None
+
+    def merge(self, item, groups):
+        """merge an item fetched with ResponseGroups groups, return the merged item"""
+        with self._lock:
+            entry = self._touch(item['ASIN'])
+            if entry is None:
+                entry = self._entries[item['ASIN']] = (OrderedDict(), {})
+                while len(self._entries) > self.max_items:
+                    self._entries.popitem(last=False)
+            merge_items(entry[0], item)
+            now = self.clock()
+            for group in groups:
+                entry[1][group] = now
+            return entry[0]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class CacheBackend(_Abstract):
+
+    """
+    Interface of lookup result caches.  ttl is in seconds, 0 never expires.
+    Values must be JSON serializable.  Subclasses implement the abstract
+    methods, get, set and close are built on them.
+    """
+
+    @abstractmethod
+    def get_many(self, keys):
+        """dict of key to value for the keys found"""
+
+    @abstractmethod
+    def set_many(self, mapping, ttl=0):
+        """store every key, value of mapping"""
+
+    @abstractmethod
+    def add(self, key, value, ttl=0):
+        """store value only if key is absent, return True if it was stored"""
+
+    @abstractmethod
+    def gets(self, key):
+        """(value, cas token) of key, (None, None) if it is absent"""
+
+    @abstractmethod
+    def cas(self, key, value, token, ttl=0):
+        """store value if key is unchanged since gets returned token"""
+
+    @abstractmethod
+    def delete(self, key):
+        """remove key, if it is present"""
+
+    def get(self, key, default=None):
+        return self.get_many([key]).get(key, default)
+
+    def set(self, key, value, ttl=0):
+        self.set_many({key: value}, ttl)
+
+    def close(self):
+        pass
+
+
+class MemoryCache(CacheBackend):
+
+    """
+    In-process CacheBackend, thread-safe.
+    """
+
+    def __init__(self, clock=time.time):
+        self.clock = clock
+        self._entries = {}  # key -> (expires, cas token, value)
+        self._tokens = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _live(self, key):
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] and entry[0] <= self.clock():
+            del self._entries[key]
+            return None
+        return entry
+
+    def _store(self, key, value, ttl):
+        expires = self.clock() + ttl if ttl else 0
+        self._entries[key] = (expires, next(self._tokens), value)
+
+    def get_many(self, keys):
+        with self._lock:
+            entries = [(key, self._live(key)) for key in keys]
+        return dict((key, entry[2]) for key, entry in entries if entry is not None)
+
+    def set_many(self, mapping, ttl=0):
+        with self._lock:
+            for key, value in mapping.items():
+                self._store(key, value, ttl)
+
+    def add(self, key, value, ttl=0):
+        with self._lock:
+            if self._live(key) is not None:
+                return False
+            self._store(key, value, ttl)
+            return True
+
+    def gets(self, key):
+        with self._lock:
+            entry = self._live(key)
+        return (None, None) if entry is None else (entry[2], entry[1])
+
+    def cas(self, key, value, token, ttl=0):
+        with self._lock:
+            entry = self._live(key)
+            if entry is None or entry[1] != token:
+                return False
+            self._store(key, value, ttl)
+            return True
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+
+class MemcachedCache(CacheBackend):
+
+    """
+    CacheBackend on a memcached server, speaking its text protocol over
+    one connection.  Keys are prefixed, keys memcached can't hold are
+    hashed.  Errors talking to the server raise CacheException, values
+    that aren't valid JSON are logged and read as misses.
+    """
+
+    def __init__(self, host='127.0.0.1', port=11211, prefix='paapy:', timeout=1.0):
+        self.address = (host, int(port))
+        self.prefix = prefix
+        self.timeout = timeout
+        self._sock = None
+        self._file = None
+        self._lock = threading.Lock()
+
+    def _key(self, key):
+        wire_key = (self.prefix + key).encode('utf-8')
+        if len(wire_key) > 250 or any(c in wire_key for c in b' \r\n\t\x00'):
+            wire_key = (self.prefix + sha1(wire_key).hexdigest()).encode('utf-8')
+        return wire_key
+
+    def _connect(self):
+        if self._sock is None:
+            self._sock = socket.create_connection(self.address, self.timeout)
+            self._file = self._sock.makefile('rb')
+        return self._sock
+
+    def _command(self, request, read):
+        """send request bytes, return read(), reconnecting next time on error"""
+        with self._lock:
+            try:
+                self._connect().sendall(request)
+                return read()
+            except (socket.error, ValueError) as err:
+                self._disconnect()
+                raise CacheException('memcached %s:%s: %s' % (self.address + (err,)))
+            except CacheException:
+                self._disconnect()  # replies to the rest of the request are unread
+                raise
+
+    def _disconnect(self):
+        if self._sock is not None:
+            self._file.close()
+            self._sock.close()
+        self._sock = self._file = None
+
+    def _readline(self):
+        line = self._file.readline()
+        if not line.endswith(b'\r\n'):
+            raise ValueError('connection closed')
+        if line.startswith((b'ERROR', b'CLIENT_ERROR', b'SERVER_ERROR')):
+            raise CacheException('memcached error: %s' % line.strip().decode('utf-8'))
+        return line[:-2]
+
+    def _read_values(self):
+        values = {}
+        while True:
+            line = self._readline()
+            if line == b'END':
+                return values
+            _, key, _, length = line.split()[:4]
+            cas = line.split()[4:]
+            data = self._file.read(int(length) + 2)[:-2]
+            values[key] = (data, int(cas[0]) if cas else None)
+
+    @staticmethod
+    def _encode(value):
+        return json.dumps(value, separators=(',', ':')).encode('utf-8')
+
+    @staticmethod
+    def _decode(data):
+        return json.loads(data.decode('utf-8'), object_pairs_hook=OrderedDict)
+
+    def _decoded(self, values):
+        """wire key -> (value, cas token) of values, dropping corrupt values"""
+        decoded = {}
+        for wire_key, (data, token) in values.items():
+            try:
+                decoded[wire_key] = (self._decode(data), token)
+            except ValueError as err:
+                LOGGER.warning('Ignoring corrupt cache value of %s: %s',
+                               wire_key.decode('utf-8'), err)
+        return decoded
+
+    @staticmethod
+    def _exptime(ttl):
+        """memcached exptime of ttl seconds, a timestamp past MEMCACHED_MAX_TTL"""
+        ttl = int(ttl)
+        if ttl > MEMCACHED_MAX_TTL:
+            return int(time.time()) + ttl
+        return ttl
+
+    def _storage(self, command, key, value, ttl, token=None):
+        data = self._encode(value)
+        line = '%s %s 0 %d %d' % (command, key.decode('utf-8'), self._exptime(ttl), len(data))
+        if token is not None:
+            line += ' %d' % token
+        return line.encode('utf-8') + b'\r\n' + data + b'\r\n'
+
+    def get_many(self, keys):
+        keys = list(keys)
+        if not keys:
+            return {}
+        wire_keys = dict((self._key(key), key) for key in keys)
+        values = self._command(b'get ' + b' '.join(wire_keys) + b'\r\n', self._read_values)
+        return dict((wire_keys[k], value) for k, (value, _) in self._decoded(values).items()
+                    if k in wire_keys)
+
+    def set_many(self, mapping, ttl=0):
+        if not mapping:
+            return
+        request = b''.join(self._storage('set', self._key(key), value, ttl)
+                           for key, value in mapping.items())
+        replies = self._command(request, lambda: [self._readline() for _ in mapping])
+        if any(reply != b'STORED' for reply in replies):
+            LOGGER.warning('memcached stored %s of %s values.',
+                           replies.count(b'STORED'), len(replies))
+
+    def add(self, key, value, ttl=0):
+        request = self._storage('add', self._key(key), value, ttl)
+        return self._command(request, self._readline) == b'STORED'
+
+    def gets(self, key):
+        wire_key = self._key(key)
+        values = self._decoded(self._command(b'gets ' + wire_key + b'\r\n', self._read_values))
+        return values.get(wire_key, (None, None))
+
+    def cas(self, key, value, token, ttl=0):
+        request = self._storage('cas', self._key(key), value, ttl, token)
+        return self._command(request, self._readline) == b'STORED'
+
+    def delete(self, key):
+        self._command(b'delete ' + self._key(key) + b'\r\n', self._readline)
+
+    def close(self):
+        with self._lock:
+            self._disconnect()
+
+
+def claim(backend, key, owner, ttl):
+    """
+    Take ownership of refreshing key for ttl seconds.  Only one owner of a
+    shared backend holds a key at a time, the holder renews it by claiming
+    again.  Returns True if owner holds the claim.
+    """
+    claim_key = 'claim:' + key
+    if backend.add(claim_key, owner, ttl):
+        return True
+    value, token = backend.gets(claim_key)
+    if value is None:  # expired in between
+        return backend.add(claim_key, owner, ttl)
+    return value == owner and backend.cas(claim_key, owner, token, ttl)
+
+
+__all__ = ['ItemCache', 'NegativeCache', 'CacheBackend', 'MemoryCache', 'MemcachedCache',
+           'claim']
@@ -0,0 +1,168 @@
+#!/usr/bin/env
+# -*- coding: utf-8 -*-
+
+"""
+Concurrent AmazonCart operations.
+A CartManager runs cart operations for many shoppers on a thread pool.
+All of its carts share one connection pool and one RateLimiter.
+Operations on different carts run concurrently, operations on the same
+cart run one at a time in the order they were submitted, since each
+response updates the CartId and HMAC used by the next request.
+"""
+
+from collections import deque
+import logging
+import threading
+
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from paapy.api import AmazonCart
+from paapy.ratelimit import RateLimiter
+from paapy.transport import RequestsTransport
+
+
+LOGGER = logging.getLogger(__name__)
+
+
+class CartManager(object):
+
+    """
+    Runs AmazonCart operations concurrently, returning a Future per operation.
+    Keyword arguments other than max_workers are passed to every AmazonCart.
+    """
+
+    def __init__(self, AssociateTag, AWSAccessKeyId, AWSAccessKeySecret, **kwargs):
+        if (AssociateTag is None) or (AWSAccessKeyId is None) or (AWSAccessKeySecret is None):
+            raise ValueError('Your Amazon Credentials are required and cannot be None.')
+        max_workers = int(kwargs.pop('max_workers', 8))
+        qps = kwargs.pop('qps', None)
+        if kwargs.get('limiter') is None and qps:
+            kwargs['limiter'] = RateLimiter(qps)
+        self._owns_transport = kwargs.get('transport') is None
+        if self._owns_transport:
+            kwargs['transport'] = RequestsTransport(pool_size=max_workers)
+        self.credentials = (AssociateTag, AWSAccessKeyId, AWSAccessKeySecret)
+        self.cart_kwargs = kwargs
+        self.limiter = kwargs.get('limiter')
+        self.transport = kwargs['transport']
+        self._executor = ThreadPoolExecutor(max_workers)
+        self._queues = {}
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self._closed = False
+        self._cancel_queued = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
+
+    def cart(self, **kwargs):
+        """
+        New AmazonCart sharing the manager's transport and limiter.
+        No request is made, pass the cart to create() or add() to fill it.
+        """
+        options = dict(self.cart_kwargs, **kwargs)
+        options.pop('ItemId', None)
+        options.pop('ASIN', None)
+        return AmazonCart(*self.credentials, **options)
+
+    def rehydrate(self, states, verify=False):
+        """rebuild saved carts (see AmazonCart.to_dict) without any API call"""
+        return AmazonCart.rehydrate(states, *self.credentials, verify=verify,
+                                    **self.cart_kwargs)
+
+    def submit(self, cart, method, *args, **kwargs):
+        """
+        Queue cart.method(*args, **kwargs), return a Future for its result.
+        """
+        future = Future()
+        with self._lock:
+            if self._closed:
+                raise RuntimeError('Cannot submit cart operations after shutdown.')
+            queue = self._queues.get(cart)
+            start = queue is None
+            if start:
+                queue = self._queues[cart] = deque()
+            queue.append((future, method, args, kwargs))
+        if start:
+            self._executor.submit(self._run_next, cart)
+        return future
+
+    def _run_next(self, cart):
+        """run the oldest queued operation of cart, then reschedule the rest"""
+        with self._lock:
+            future, method, args, kwargs = self._queues[cart].popleft()
+            cancelled = self._cancel_queued
+        if cancelled:
+            future.cancel()
+        elif future.set_running_or_notify_cancel():
+            try:
+                result = getattr(cart, method)(*args, **kwargs)
+            except Exception as err:
+                LOGGER.error('Cart %s %s failed: %s', cart.cart_id, method, err)
+                future.set_exception(err)
+            else:
+                future.set_result(result)
+        close = False
+        with self._lock:
+            queue = self._queues[cart]
+            if self._cancel_queued:
+                while queue:
+                    queue.popleft()[0].cancel()
+            # one operation per task, so a busy cart cannot hold a worker
+            if queue:
+                self._executor.submit(self._run_next, cart)
+            else:
+                del self._queues[cart]
+                if not self._queues:
+                    self._idle.notify_all()
+                    close = self._cancel_queued and self._owns_transport
+        if close:
+            # shutdown(wait=False) left the transport to the last operation
+            self.transport.close()
+
+    def create(self, ItemId, Quantity=1, **kwargs):
+        """create a new cart, the Future resolves to the AmazonCart"""
+        return self.submit(self.cart(), 'create', ItemId=ItemId, Quantity=Quantity, **kwargs)
+
+    def add(self, cart, ItemId=None, **kwargs):
+        return self.submit(cart, 'add', ItemId=ItemId, **kwargs)
+
+    def modify(self, cart, ItemId, Quantity, **kwargs):
+        return self.submit(cart, 'modify', ItemId=ItemId, Quantity=Quantity, **kwargs)
+
+    def remove(self, cart, ItemId, **kwargs):
+        return self.submit(cart, 'remove', ItemId=ItemId, **kwargs)
+
+    def clear(self, cart, **kwargs):
+        return self.submit(cart, 'clear', **kwargs)
+
+    def sync(self, cart, desired, **kwargs):
+        return self.submit(cart, 'sync', desired, **kwargs)
+
+    def flush(self, cart, **kwargs):
+        return self.submit(cart, 'flush', **kwargs)
+
+    def get(self, cart, CartId, CartItemId, HMAC, **kwargs):
+        return self.submit(cart, 'get', CartId, CartItemId, HMAC, **kwargs)
+
+    def shutdown(self, wait=True):
+        """
+        Stop accepting work.  With wait, block until every queued operation
+        has run, otherwise operations not yet started are cancelled.  A
+        transport the manager created is closed once no operation is running.
+        """
+        with self._lock:
+            self._closed = True
+            self._cancel_queued = not wait
+            while wait and self._queues:
+                self._idle.wait()
+            idle = not self._queues
+        self._executor.shutdown(wait=wait)
+        if idle and self._owns_transport:
+            self.transport.close()
+
+
+__all__ = ['CartManager']
@@ -0,0 +1,85 @@
+#!/usr/bin/env
+# -*- coding: utf-8 -*-
+
+"""
+Change Detection.
+Keeps a small fingerprint per ASIN (the values of a few fields, such as
+offer prices, availability and sales rank) and compares fresh lookup
+results against it, so only items that changed are passed on.
+"""
+
+from collections import namedtuple
+import logging
+
+from paapy.fields import get_field
+
+
+LOGGER = logging.getLogger(__name__)
+
+DEFAULT_FIELDS = ('LowestNewPrice', 'LowestUsedPrice', 'OfferPrice',
+                  'Availability', 'SalesRank')
+
+# A changed item.  changes maps each changed field to an (old, new) tuple,
+# old values are None for ASINs seen for the first time.
+Delta = namedtuple('Delta', ['asin', 'changes'])
+
+
+class ChangeDetector(object):
+
+    """
+    Emits a Delta for each item whose watched fields changed since it was
+    last seen.  store maps ASIN to fingerprint and may be any dict-like
+    object, e.g. a shelve, to keep fingerprints across runs.
+    """
+
+    def __init__(self, amazon=None, fields=DEFAULT_FIELDS, store=None, emit_new=True):
+        self.amazon = amazon
+        self.fields = tuple(fields)
+        self.store = store if store is not None else {}
+        self.emit_new = emit_new
+        for field in self.fields:
+            get_field({}, field)  # raises ValueError for unknown fields
+
+    def fingerprint(self, item):
+        """tuple of the watched field values of item"""
+        return tuple(get_field(item, field) for field in self.fields)
+
+    def compare(self, items):
+        """
+        Compare items against their stored fingerprints, update the store
+        and yield a Delta for every new or changed item.
+        """
+        for item in items:
+            asin = get_field(item, 'ASIN')
+            if asin is None:
+                LOGGER.error('Item without ASIN: %s', item)
+                continue
+            new = self.fingerprint(item)
+            old = self.store.get(asin)
+            if old is not None:
+                old = tuple(old)
+            if old == new:
+                continue
+            self.store[asin] = new
+            if old is None and not self.emit_new:
+                continue
+            old = old or (None,) * len(self.fields)
+            yield Delta(asin, dict((field, (o, n)) for field, o, n
+                                   in zip(self.fields, old, new) if o != n))
+
+    def poll(self, ItemId, **kwargs):
+        """
+        Look up ItemId in batches and yield the Deltas of each batch as
+        soon as it arrives.  Keyword arguments are passed to Amazon.lookup.
+        """
+        if self.amazon is None:
+            raise ValueError('ChangeDetector needs an Amazon instance to poll.')
+        ItemId = self.amazon._parse_multiple_items(ItemId)
+        kwargs.setdefault('ResponseGroup', 'OfferFull,SalesRank')
+        batch_size = self.amazon.item_lookup_max
+        for i in range(0, len(ItemId), batch_size):
+            for delta in self.compare(self.amazon.lookup(ItemId[i:i + batch_size], **kwargs)):
+                yield delta
+
+
+__all__ = ['Delta', 'ChangeDetector', 'DEFAULT_FIELDS']
@@ -0,0 +1,114 @@
+#!/usr/bin/env
+# -*- coding: utf-8 -*-
+
+"""
+Columnar Results.
+Collects lookup results into typed column buffers, one per field, as each
+batch of items arrives.  Integer fields (prices in cents, sales rank, offer
+counts) are stored in 64-bit array.array buffers with a validity mask, so
+they can be handed to NumPy or Arrow without another pass over the items.
+"""
+
+from array import array
+import logging
+
+from paapy.fields import FIELDS, get_field
+
+
+LOGGER = logging.getLogger(__name__)
+
+DEFAULT_COLUMNS = ('ASIN', 'LowestNewPrice', 'LowestUsedPrice', 'OfferPrice',
+                   'SalesRank', 'TotalNew', 'TotalUsed', 'TotalOffers')
+
+
+def _int64_typecode():
+    """array typecode of a 64-bit integer, 'q' where it exists"""
+    for typecode in ('q', 'l'):
+        try:
+            if array(typecode).itemsize == 8:
+                return typecode
+        except ValueError:  # Python 2 has no 'q'
+            continue
+    # Python 2 on Windows, where 'l' is only 32 bits
+    return 'l'
+
+
+INT64 = _int64_typecode()
+
+
+class ColumnBuilder(object):
+
+    """
+    Typed column buffers filled one item at a time.
+    columns are names from paapy.fields.FIELDS.
+    """
+
+    def __init__(self, columns=DEFAULT_COLUMNS):
+        self.columns = tuple(columns)
+        self.values = {}
+        self.valid = {}
+        for name in self.columns:
+            if name not in FIELDS:
+                raise ValueError('Unknown field: "%s".  Valid fields are: %s' %
+                                 (name, ', '.join(sorted(FIELDS))))
+            self.values[name] = array(INT64) if FIELDS[name].type is int else []
+            self.valid[name] = bytearray()
+        self._length = 0
+
+    def __len__(self):
+        return self._length
+
+    def append(self, item):
+        """add the fields of one item as a new row"""
+        for name in self.columns:
+            value = get_field(item, name)
+            column = self.values[name]
+            if value is None:
+                column.append(0 if isinstance(column, array) else None)
+                self.valid[name].append(0)
+            else:
+                column.append(value)
+                self.valid[name].append(1)
+        self._length += 1
+        return self
+
+    def extend(self, items):
+        """add one row per item"""
+        for item in items:
+            self.append(item)
+        return self
+
+    def to_numpy(self):
+        """
+        dict of column name to NumPy array.  Integer columns are int64
+        masked arrays, missing values masked.  The data is copied, so the
+        builder can keep growing after the export.
+        """
+        import numpy
+        result = {}
+        for name in self.columns:
+            valid = numpy.frombuffer(bytes(self.valid[name]), dtype=numpy.uint8) == 0
+            if isinstance(self.values[name], array):
+                dtype = numpy.dtype('i%d' % self.values[name].itemsize)
+                data = numpy.frombuffer(self.values[name], dtype=dtype).astype(numpy.int64) \
+                    if len(self) else numpy.zeros(0, dtype=numpy.int64)
+                result[name] = numpy.ma.MaskedArray(data, mask=valid)
+            else:
+                result[name] = numpy.array(self.values[name], dtype=object)
+        return result
+
+    def to_arrow(self):
+        """pyarrow Table with one column per field, missing values as nulls"""
+        import pyarrow
+        arrays = []
+        for name in self.columns:
+            mask = [not v for v in self.valid[name]]
+            if isinstance(self.values[name], array):
+                arrays.append(pyarrow.array(self.values[name], type=pyarrow.int64(),
+                                            mask=pyarrow.array(mask, type=pyarrow.bool_())))
+            else:
+                arrays.append(pyarrow.array(self.values[name], type=pyarrow.string()))
+        return pyarrow.Table.from_arrays(arrays, names=list(self.columns))
+
+
+__all__ = ['ColumnBuilder', 'DEFAULT_COLUMNS']
@@ -0,0 +1,253 @@
+#!/usr/bin/env
+# -*- coding: utf-8 -*-
+
+"""
+Search Crawling.
+ItemSearch only returns the first max_pages pages of a query.  A
+SearchCrawler lists every item of a query by partitioning it: a
+partition with more results than the page cap is split into its child
+BrowseNodes, or, once there are none, into halves of its price range,
+until every partition fits.  Pages are fetched concurrently, spaced by
+the client's rate limiter, and items are yielded as they arrive, each
+ASIN once.
+
+The TotalResults of a split partition's parts are added up and compared
+with its own.  Items listed on a BrowseNode but on none of its children
+make up the difference, so the node is crawled again split by price.
+Items without a price are in no price range, only the node's first pages
+can list them, and it is added to truncated.  Items listed on several
+children are counted twice and can hide such a shortfall.  A failed page
+is retried, a page failing every time is skipped and added to failed.
+"""
+
+from collections import namedtuple
+import logging
+import threading
+import time
+
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from paapy.exceptions import AmazonException, QuotaExceeded
+
+
+LOGGER = logging.getLogger(__name__)
+
+NO_MATCHES = 'AWS.ECommerceService.NoExactMatches'
+
+# a slice of the query; MaximumPrice None is open-ended, prices are in cents
+Partition = namedtuple('Partition', ['BrowseNode', 'MinimumPrice', 'MaximumPrice'])
+
+
+class _Split(object):
+
+    """a partition split into parts, and the TotalResults of the parts seen so far"""
+
+    def __init__(self, partition, total, pages, parts, by_node):
+        self.partition = partition
+        self.total = total
+        self.pages = pages
+        self.remaining = parts
+        self.parts_total = 0
+        self.by_node = by_node
+
+
+def _as_list(value):
+    if value is None:
+        return []
+    return value if isinstance(value, list) else [value]
+
+
+class SearchCrawler(object):
+
+    """
+    Crawls ItemSearch queries past the page cap.  amazon is an Amazon
+    client or a CredentialPool.  Up to max_workers pages are requested at
+    once.  An open-ended price range is first split at open_split cents
+    (doubled for each further split), ranges narrower than min_price_step
+    cents are not split.  A failed page is retried up to retries times,
+    retry_delay * 2 ** (attempt - 1) seconds apart.  Extra keyword
+    arguments are passed to every ItemSearch, e.g. ResponseGroup or
+    priority.
+    """
+
+    def __init__(self, amazon, max_workers=4, max_pages=10, page_size=10, **kwargs):
+        self.amazon = amazon
+        self.max_workers = int(max_workers)
+        self.max_pages = int(max_pages)
+        self.page_size = int(page_size)
+        self.min_price_step = int(kwargs.pop('min_price_step', 1))
+        self.open_split = int(kwargs.pop('open_split', 10000))
+        self.retries = int(kwargs.pop('retries', 2))
+        self.retry_delay = float(kwargs.pop('retry_delay', 1))
+        self.search_kwargs = kwargs
+        self.requests = 0
+        self.partitions = 0
+        self.truncated = []  # partitions with more results than their pages hold
+        self.failed = []  # (partition, page, error) of pages that failed every retry
+        self._children = {}
+        self._price_only = set()  # partitions split by price, not by child BrowseNode
+        self._lock = threading.Lock()
+
+    def _search(self, params, partition, page):
+        query = dict(self.search_kwargs, **params)
+        if partition.BrowseNode is not None:
+            query['BrowseNode'] = partition.BrowseNode
+        if partition.MinimumPrice:
+            query['MinimumPrice'] = partition.MinimumPrice
+        if partition.MaximumPrice is not None:
+            query['MaximumPrice'] = partition.MaximumPrice
+        if page > 1:
+            query['ItemPage'] = page
+        with self._lock:
+            self.requests += 1
+        items = self.amazon.ItemSearch(raise_errors=False, **query)['Items']
+        errors = [(err.get('Code'), err.get('Message')) for err in
+                  _as_list((items['Request'].get('Errors') or {}).get('Error'))]
+        if any(code != NO_MATCHES for code, _ in errors):
+            raise AmazonException(' , '.join('%s  -  %s' % err for err in errors))
+        return items
+
+    def _child_nodes(self, node):
+        """ids of the child BrowseNodes of node, looked up once"""
+        with self._lock:
+            if node in self._children:
+                return self._children[node]
+        response = self.amazon.BrowseNodeLookup(BrowseNodeId=node)
+        found = _as_list(response['BrowseNodes'].get('BrowseNode'))
+        children = (found[0].get('Children') or {}) if found else {}
+        children = [child['BrowseNodeId'] for child in _as_list(children.get('BrowseNode'))]
+        with self._lock:
+            return self._children.setdefault(node, children)
+
+    def split(self, partition):
+        """smaller partitions covering partition, [] if it cannot be split"""
+        with self._lock:
+            price_only = partition in self._price_only
+        if partition.BrowseNode is not None and not price_only:
+            children = self._child_nodes(partition.BrowseNode)
+            if children:
+                return [partition._replace(BrowseNode=child) for child in children]
+        low, high = partition.MinimumPrice or 0, partition.MaximumPrice
+        if high is None:
+            cut = max(low * 2, low + self.open_split)
+            parts = [partition._replace(MinimumPrice=low, MaximumPrice=cut),
+                     partition._replace(MinimumPrice=cut + 1)]
+        elif high - low < self.min_price_step:
+            return []
+        else:
+            middle = (low + high) // 2
+            parts = [partition._replace(MaximumPrice=middle),
+                     partition._replace(MinimumPrice=middle + 1)]
+        if price_only:
+            with self._lock:
+                self._price_only.update(parts)
+        return parts
+
+    def _part_counted(self, split, total):
+        """
+        add the TotalResults of one part of split.  Once every part is in,
+        return the tasks for the results the parts missed.
+        """
+        with self._lock:
+            split.remaining -= 1
+            split.parts_total += total
+            if split.remaining or split.parts_total >= split.total:
+                return []
+            missing = split.total - split.parts_total
+            if split.by_node:
+                self._price_only.add(split.partition)
+            else:
+                self.truncated.append(split.partition)
+        if split.by_node:
+            LOGGER.info('%s results of %s are on no child BrowseNode, splitting it by price.',
+                        missing, split.partition)
+            return [(split.partition, 1, None)]
+        LOGGER.warning('%s results of %s have no price, only the first %s pages can be crawled.',
+                       missing, split.partition, self.max_pages)
+        return [(split.partition, p, None)
+                for p in range(2, min(split.pages, self.max_pages) + 1)]
+
+    def _fetch(self, params, partition, page, split=None):
+        """
+        one page of partition: (items, further (partition, page, split)
+        tasks), split is the _Split partition is a part of.  The first page
+        decides whether the partition is split or paged, the items of a
+        split partition's first page are returned all the same.
+        """
+        response = self._search(params, partition, page)
+        items = _as_list(response.get('Item'))
+        if page > 1:
+            return items, []
+        total = int(response.get('TotalResults') or 0)
+        pages = int(response.get('TotalPages') or 0)
+        tasks = self._part_counted(split, total) if split is not None else []
+        if total > self.max_pages * self.page_size:
+            parts = self.split(partition)
+            if parts:
+                LOGGER.debug('Splitting %s, %s results, into %s partitions.',
+                             partition, total, len(parts))
+                split = _Split(partition, total, pages, len(parts),
+                               parts[0].BrowseNode != partition.BrowseNode)
+                return items, tasks + [(part, 1, split) for part in parts]
+            LOGGER.warning('%s has %s results, only the first %s pages can be crawled.',
+                           partition, total, self.max_pages)
+            with self._lock:
+                self.truncated.append(partition)
+        with self._lock:
+            self.partitions += 1
+        return items, tasks + [(partition, p, None)
+                               for p in range(2, min(pages, self.max_pages) + 1)]
+
+    def _fetch_retrying(self, params, partition, page, split=None):
+        """_fetch, retrying a page that fails"""
+        for attempt in range(self.retries + 1):
+            try:
+                return self._fetch(params, partition, page, split)
+            except QuotaExceeded:
+                raise
+            except AmazonException as err:
+                if attempt == self.retries:
+                    raise
+                LOGGER.warning('Page %s of %s failed: %s.  Retrying momentarily...',
+                               page, partition, err)
+                time.sleep(self.retry_delay * 2 ** attempt)
+
+    def crawl(self, BrowseNode=None, MinimumPrice=None, MaximumPrice=None, **params):
+        """
+        Generator of every item matching the ItemSearch params (SearchIndex,
+        Keywords, ...) within BrowseNode and the price range, each ASIN once.
+        """
+        seen = set()
+        executor = ThreadPoolExecutor(self.max_workers)
+        first = (Partition(BrowseNode, MinimumPrice, MaximumPrice), 1, None)
+        pending = {executor.submit(self._fetch_retrying, params, *first): first}
+        try:
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    partition, page, split = pending.pop(future)
+                    try:
+                        items, tasks = future.result()
+                    except QuotaExceeded:
+                        raise
+                    except AmazonException as err:
+                        LOGGER.error('Skipping page %s of %s: %s', page, partition, err)
+                        with self._lock:
+                            self.failed.append((partition, page, err))
+                        # a part that never answered counts as empty, so the
+                        # results it misses are still looked for elsewhere
+                        items = []
+                        tasks = self._part_counted(split, 0) if split is not None else []
+                    for task in tasks:
+                        pending[executor.submit(self._fetch_retrying, params, *task)] = task
+                    for item in items:
+                        if item['ASIN'] not in seen:
+                            seen.add(item['ASIN'])
+                            yield item
+        finally:
+            for future in pending:
+                future.cancel()
+            executor.shutdown(wait=False)
+
+
+__all__ = ['SearchCrawler', 'Partition']
@@ -0,0 +1,58 @@
+#!/usr/bin/env
+# -*- coding: utf-8 -*-
+
+"""
+Deadlines.
+A Deadline bounds the total time of a call: the rate limiter wait, every
+attempt and retry, and parsing the response.  Pass deadline (seconds or
+a Deadline) to any request, or set a default deadline on the client.
+"""
+
+import time
+
+from paapy.exceptions import DeadlineExceeded
+
+
+class Deadline(object):
+
+    """
+    The time a call must finish by, seconds from now.
+    """
+
+    def __init__(self, seconds):
+        try:
+            self.seconds = float(seconds)
+        except (TypeError, ValueError):
+            raise ValueError('deadline must be a number of seconds.')
+        self.expires = time.time() + self.seconds
+
+    def __repr__(self):
+        return 'Deadline(%s secs, %s remaining)' % (self.seconds, round(self.remaining(), 3))
+
+    def remaining(self):
+        """seconds left, 0 once the deadline has passed"""
+        return max(0.0, self.expires - time.time())
+
+    def expired(self):
+        return time.time() >= self.expires
+
+    def timeout(self, timeout=None):
+        """timeout, shortened to the time remaining"""
+        remaining = self.remaining()
+        return remaining if timeout is None else min(float(timeout), remaining)
+
+    def check(self, what='Request'):
+        """raise DeadlineExceeded if the deadline has passed"""
+        if self.expired():
+            raise DeadlineExceeded('%s exceeded its %s sec deadline.' % (what, self.seconds))
+        return self
+
+
+def as_deadline(value):
+    """Deadline from a number of seconds, a Deadline, or None"""
+    if value is None or isinstance(value, Deadline):
+        return value
+    return Deadline(value)
+
+
+__all__ = ['Deadline', 'as_deadline']
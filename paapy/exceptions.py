@@ -22,3 +22,15 @@ class CartException(AmazonException):
 
 class InvalidASIN(AmazonException):
     pass
+
+class TransportException(AmazonException):
+    pass
+
+class DeadlineExceeded(AmazonException):
+    pass
+
+class CacheException(AmazonException):
+    pass
+
+class QuotaExceeded(AmazonException):
+    pass
@@ -0,0 +1,149 @@
+#!/usr/bin/env
+# -*- coding: utf-8 -*-
+
+"""
+Item Fields.
+Named paths into the items returned by ItemLookup and ItemSearch, so
+callers can pull single values out of the nested response dicts, and the
+ResponseGroups that return each field, so a request can ask for only the
+groups it needs.
+"""
+
+from collections import namedtuple
+from itertools import combinations
+
+
+Field = namedtuple('Field', ['name', 'path', 'type'])
+
+FIELDS = dict((field.name, field) for field in [
+    Field('ASIN', ('ASIN',), str),
+    Field('ParentASIN', ('ParentASIN',), str),
+    Field('Title', ('ItemAttributes', 'Title'), str),
+    Field('Brand', ('ItemAttributes', 'Brand'), str),
+    Field('ListPrice', ('ItemAttributes', 'ListPrice', 'Amount'), int),
+    Field('LowestNewPrice', ('OfferSummary', 'LowestNewPrice', 'Amount'), int),
+    Field('LowestUsedPrice', ('OfferSummary', 'LowestUsedPrice', 'Amount'), int),
+    Field('TotalNew', ('OfferSummary', 'TotalNew'), int),
+    Field('TotalUsed', ('OfferSummary', 'TotalUsed'), int),
+    Field('TotalOffers', ('Offers', 'TotalOffers'), int),
+    Field('OfferPrice', ('Offers', 'Offer', 'OfferListing', 'Price', 'Amount'), int),
+    Field('Availability', ('Offers', 'Offer', 'OfferListing', 'AvailabilityAttributes',
+                           'AvailabilityType'), str),
+    Field('IsEligibleForPrime', ('Offers', 'Offer', 'OfferListing', 'IsEligibleForPrime'), str),
+    Field('SalesRank', ('SalesRank',), int),
+    Field('LargeImage', ('LargeImage', 'URL'), str),
+])
+
+
+# ResponseGroups returning each field.  ASIN and ParentASIN come with every group.
+FIELD_GROUPS = {
+    'ASIN': (),
+    'ParentASIN': (),
+    'Title': ('Small', 'ItemAttributes', 'Medium', 'Large'),
+    'Brand': ('ItemAttributes', 'Medium', 'Large'),
+    'ListPrice': ('ItemAttributes', 'Medium', 'Large'),
+    'LowestNewPrice': ('OfferSummary', 'Offers', 'OfferFull', 'Medium', 'Large'),
+    'LowestUsedPrice': ('OfferSummary', 'Offers', 'OfferFull', 'Medium', 'Large'),
+    'TotalNew': ('OfferSummary', 'Offers', 'OfferFull', 'Medium', 'Large'),
+    'TotalUsed': ('OfferSummary', 'Offers', 'OfferFull', 'Medium', 'Large'),
+    'TotalOffers': ('Offers', 'OfferFull', 'Large'),
+    'OfferPrice': ('Offers', 'OfferFull', 'Large'),
+    'Availability': ('Offers', 'OfferFull', 'Large'),
+    'IsEligibleForPrime': ('Offers', 'OfferFull', 'Large'),
+    'SalesRank': ('SalesRank', 'Medium', 'Large'),
+    'LargeImage': ('Images', 'Medium', 'Large'),
+}
+
+# rough relative response size of each ResponseGroup
+GROUP_COST = {
+    'OfferSummary': 1,
+    'SalesRank': 1,
+    'Small': 2,
+    'Images': 3,
+    'Offers': 3,
+    'ItemAttributes': 4,
+    'OfferFull': 4,
+    'Medium': 12,
+    'Large': 25,
+}
+
+
+def fields_covered(groups):
+    """names of the fields returned by the ResponseGroups"""
+    groups = set(groups)
+    return set(name for name, field_groups in FIELD_GROUPS.items()
+               if not field_groups or groups.intersection(field_groups))
+
+
+def plan_response_groups(fields):
+    """
+    Cheapest list of ResponseGroups that returns every field, by GROUP_COST.
+    """
+    for name in fields:
+        if name not in FIELD_GROUPS:
+            raise ValueError('Unknown field: "%s".  Valid fields are: %s' %
+                             (name, ', '.join(sorted(FIELD_GROUPS))))
+    fields = set(fields)
+    candidates = sorted(set(g for name in fields for g in FIELD_GROUPS[name]))
+    if fields <= fields_covered([]):
+        return ['Small']
+    best = None
+    for size in range(1, len(candidates) + 1):
+        for groups in combinations(candidates, size):
+            if fields <= fields_covered(groups):
+                cost = sum(GROUP_COST[g] for g in groups)
+                if best is None or cost < best[0]:
+                    best = (cost, list(groups))
+    return best[1]
+
+
+def get_path(item, path, default=None):
+    """
+    Follow path (a tuple of keys) through item.  Where a level holds a list,
+    the first element is used.  Returns default if any key is missing.
+    """
+    value = item
+    for key in path:
+        if isinstance(value, list):
+            value = value[0] if value else None
+        if not isinstance(value, dict) or key not in value:
+            return default
+        value = value[key]
+    if isinstance(value, list):
+        value = value[0] if value else default
+    return value
+
+
+def get_field(item, name, default=None):
+    """
+    Value of the named field in item, converted to the field's type.
+    Returns default when the field is missing or cannot be converted.
+    """
+    try:
+        field = FIELDS[name]
+    except KeyError:
+        raise ValueError('Unknown field: "%s".  Valid fields are: %s' %
+                         (name, ', '.join(sorted(FIELDS))))
+    value = get_path(item, field.path)
+    if value is None or isinstance(value, dict):
+        return default
+    if field.type is str:
+        return value
+    try:
+        return field.type(value)
+    except (TypeError, ValueError):
+        return default
+
+
+def merge_items(item, other):
+    """recursively merge the keys of item dict other into item"""
+    for key, value in other.items():
+        if isinstance(value, dict) and isinstance(item.get(key), dict):
+            merge_items(item[key], value)
+        else:
+            item[key] = value
+    return item
+
+
+__all__ = ['Field', 'FIELDS', 'FIELD_GROUPS', 'GROUP_COST', 'get_path', 'get_field',
+           'fields_covered', 'plan_response_groups', 'merge_items']
@@ -0,0 +1,158 @@
+#!/usr/bin/env
+# -*- coding: utf-8 -*-
+
+"""
+Hedged Requests.
+A Hedger cuts tail latency.  If a response has not arrived by a
+percentile of the latencies seen so far, the same request is sent again,
+and the first answer wins.  The budget caps the share of requests that
+are hedged, and each hedge has to take a free slot from the client's
+RateLimiter, so hedges stay within qps.  Only idempotent operations are
+hedged, never the Cart operations.  Requests are never queued behind
+each other: a request that may be hedged is sent on one of the Hedger's
+max_pending threads if one is free, and in the calling thread, without
+a hedge, if none is.  The duplicates share another max_workers threads.
+"""
+
+from collections import deque
+import logging
+import threading
+import time
+
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+
+LOGGER = logging.getLogger(__name__)
+
+HEDGED_OPERATIONS = ('ItemLookup', 'ItemSearch', 'BrowseNodeLookup', 'SimilarityLookup')
+
+
+class Hedger(object):
+
+    """
+    Sends a duplicate of a request still pending after the pct percentile
+    of observed latency, once at least min_samples latencies are known.
+    At most budget (a fraction) of requests are hedged, at most
+    max_pending requests can be hedged and max_workers duplicates are in
+    flight at once.  Only the latency of the first send is recorded, so
+    hedges that win don't lower the percentile.
+    """
+
+    def __init__(self, pct=95, budget=0.05, history=1000, min_samples=20, max_workers=16,
+                 max_pending=64):
+        self.pct = float(pct)
+        self.budget = float(budget)
+        self.min_samples = int(min_samples)
+        self.latencies = deque(maxlen=int(history))
+        self.requests = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+        self._lock = threading.Lock()
+        self.max_pending = int(max_pending)
+        self._executor = ThreadPoolExecutor(max_workers)
+        self._primaries = ThreadPoolExecutor(self.max_pending)
+        self._pending = 0
+        self._closed = False
+
+    def delay(self):
+        """seconds to wait before hedging, None until enough latencies are known"""
+        with self._lock:
+            if not self.latencies or len(self.latencies) < self.min_samples:
+                return None
+            latencies = sorted(self.latencies)
+        return latencies[int(round(self.pct / 100.0 * (len(latencies) - 1)))]
+
+    def record(self, latency):
+        with self._lock:
+            self.latencies.append(latency)
+
+    def _can_hedge(self):
+        with self._lock:
+            return not self._closed and self.hedged + 1 <= self.budget * self.requests
+
+    def _take_budget(self):
+        with self._lock:
+            if self._closed or self.hedged + 1 > self.budget * self.requests:
+                return False
+            self.hedged += 1
+            return True
+
+    def _start(self, send, start):
+        """send() on a free primary thread, a Future of its result or None if none is free"""
+        with self._lock:
+            if self._closed or self._pending >= self.max_pending:
+                return None
+            self._pending += 1
+        try:
+            future = self._primaries.submit(send)
+        except RuntimeError:  # closed meanwhile
+            with self._lock:
+                self._pending -= 1
+            return None
+        future.add_done_callback(lambda done: self._sent(done, start))
+        return future
+
+    def _sent(self, future, start):
+        """record the latency of a first send once it answers, even if a hedge won"""
+        latency = time.time() - start
+        with self._lock:
+            self._pending -= 1
+            if future.exception() is None:
+                self.latencies.append(latency)
+
+    def send(self, send, limiter=None):
+        """
+        Call send() and return its response, calling it a second time in
+        parallel if the first is slow and the budget and limiter allow.
+        """
+        with self._lock:
+            self.requests += 1
+        start = time.time()
+        delay = self.delay()
+        first = None
+        if delay is not None and self._can_hedge():
+            first = self._start(send, start)
+        if first is None:
+            response = send()
+            self.record(time.time() - start)
+            return response
+
+        done, _ = wait([first], timeout=delay)
+        if done or not self._take_budget():
+            return first.result()
+        if limiter is not None and not limiter.try_acquire():
+            with self._lock:
+                self.hedged -= 1
+            LOGGER.debug('No free slot to hedge a request.')
+            return first.result()
+
+        LOGGER.debug('Hedging a request pending for %s secs.', round(delay, 3))
+        try:
+            second = self._executor.submit(send)
+        except RuntimeError:  # closed meanwhile
+            return first.result()
+        pending = [first, second]
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                pending.remove(future)
+                if future.exception() is None or not pending:
+                    if future is second and future.exception() is None:
+                        with self._lock:
+                            self.hedge_wins += 1
+                    return future.result()
+
+    def stats(self):
+        with self._lock:
+            return {'requests': self.requests, 'hedged': self.hedged,
+                    'hedge_wins': self.hedge_wins}
+
+    def close(self):
+        """stop hedging, requests sent after close are sent once"""
+        with self._lock:
+            self._closed = True
+        self._executor.shutdown(wait=False)
+        self._primaries.shutdown(wait=False)
+
+
+__all__ = ['Hedger', 'HEDGED_OPERATIONS']
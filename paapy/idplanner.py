@@ -0,0 +1,113 @@
+#!/usr/bin/env
+# -*- coding: utf-8 -*-
+
+"""
+ItemId Planning.
+ItemLookup accepts one ItemIdType (ASIN, UPC, EAN or ISBN) per request,
+and up to 10 ItemIds.  plan_ids normalizes a mixed list of ids in one
+pass, works out the type of each, removes duplicates, and packs each
+type into full batches.  ISBN-10s are converted to ISBN-13, so both
+forms of a book share one lookup.  The plan remembers which original ids map to
+each normalized id, so results can be matched back to the input.
+"""
+
+from collections import OrderedDict
+import logging
+
+
+LOGGER = logging.getLogger(__name__)
+
+ID_TYPES = ('ASIN', 'UPC', 'EAN', 'ISBN')
+
+
+def _gtin_valid(code):
+    """check digit test shared by UPC-A, EAN-8 and EAN-13"""
+    digits = [int(c) for c in code]
+    total = sum(d * (1 if i % 2 else 3) for i, d in enumerate(reversed(digits[:-1])))
+    return (10 - total % 10) % 10 == digits[-1]
+
+
+def _isbn10_valid(code):
+    if not code[:9].isdigit() or not (code[9].isdigit() or code[9] == 'X'):
+        return False
+    digits = [int(c) for c in code[:9]] + [10 if code[9] == 'X' else int(code[9])]
+    return sum((10 - i) * d for i, d in enumerate(digits)) % 11 == 0
+
+
+def isbn10_to_13(code):
+    """ISBN-10 to its 978 prefixed ISBN-13 (EAN) form"""
+    body = '978' + code[:9]
+    total = sum(int(c) * (3 if i % 2 else 1) for i, c in enumerate(body))
+    return body + str((10 - total % 10) % 10)
+
+
+def normalize_id(item_id):
+    """strip whitespace and hyphens, upper case"""
+    return ''.join(('%s' % item_id).split()).replace('-', '').upper()
+
+
+def classify_id(item_id):
+    """
+    Return (normalized id, ItemIdType), the type is None if the id is not
+    a valid ASIN, UPC, EAN or ISBN.  ISBNs are normalized to ISBN-13.
+    """
+    code = normalize_id(item_id)
+    if len(code) == 10 and code.startswith('B') and code.isalnum():
+        return code, 'ASIN'
+    if len(code) == 10 and _isbn10_valid(code):
+        return isbn10_to_13(code), 'ISBN'
+    if code.isdigit() and len(code) in (8, 12, 13) and _gtin_valid(code):
+        if len(code) == 12:
+            return code, 'UPC'
+        if len(code) == 13 and code[:3] in ('978', '979'):
+            return code, 'ISBN'
+        return code, 'EAN'
+    return code, None
+
+
+class IdPlan(object):
+
+    """
+    Result of plan_ids.  groups maps ItemIdType to its unique normalized
+    ids, originals maps each normalized id to the input ids it came from,
+    invalid lists the input ids that are not of any known type.
+    """
+
+    def __init__(self, batch_size=10):
+        self.batch_size = batch_size
+        self.groups = OrderedDict((id_type, []) for id_type in ID_TYPES)
+        self.originals = OrderedDict()
+        self.invalid = []
+
+    def add(self, item_id):
+        code, id_type = classify_id(item_id)
+        if id_type is None:
+            self.invalid.append(item_id)
+            return
+        if code not in self.originals:
+            self.originals[code] = []
+            self.groups[id_type].append(code)
+        self.originals[code].append(item_id)
+
+    def batches(self):
+        """yield (ItemIdType, ids) with up to batch_size ids each"""
+        for id_type, codes in self.groups.items():
+            for i in range(0, len(codes), self.batch_size):
+                yield id_type, codes[i:i + self.batch_size]
+
+    def __len__(self):
+        return sum((len(codes) + self.batch_size - 1) // self.batch_size
+                   for codes in self.groups.values())
+
+
+def plan_ids(ids, batch_size=10):
+    """plan the ItemLookup requests for a mixed list of ids"""
+    plan = IdPlan(batch_size)
+    for item_id in ids:
+        plan.add(item_id)
+    if plan.invalid:
+        LOGGER.warning('%s ids are not a valid ASIN, UPC, EAN or ISBN.', len(plan.invalid))
+    return plan
+
+
+__all__ = ['ID_TYPES', 'IdPlan', 'plan_ids', 'classify_id', 'normalize_id', 'isbn10_to_13']
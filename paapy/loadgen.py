@@ -0,0 +1,237 @@
+#!/usr/bin/env
+# -*- coding: utf-8 -*-
+
+"""
+Load Generator.
+Runs Amazon.lookup and cart workloads from many threads against an
+endpoint and reports throughput and latency histograms.  Without
+--endpoint a local StandInServer is started, with the fault injection
+options applied.
+
+    python -m paapy.loadgen --threads 64 --duration 30 --workload mixed
+"""
+
+from __future__ import print_function
+
+import argparse
+import logging
+import random
+import sys
+import threading
+import time
+
+from paapy.api import Amazon, AmazonCart
+from paapy.exceptions import AmazonException
+from paapy.parsing import ProcessParser
+from paapy.scheduler import percentile
+from paapy.standin import Latency, StandInServer
+from paapy.transport import RequestsTransport, UrllibTransport
+
+
+LOGGER = logging.getLogger(__name__)
+
+WORKLOADS = ('lookup', 'cart', 'mixed')
+
+# upper bounds of the histogram buckets, in seconds
+BUCKETS = (0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1, 2, 5, float('inf'))
+
+
+class LoadResult(object):
+
+    """latencies and errors of each operation of a load run, thread-safe"""
+
+    def __init__(self):
+        self.latencies = {}
+        self.errors = {}
+        self.elapsed = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, operation, latency, error=None):
+        with self._lock:
+            if error is None:
+                self.latencies.setdefault(operation, []).append(latency)
+            else:
+                errors = self.errors.setdefault(operation, {})
+                errors[error] = errors.get(error, 0) + 1
+
+    def completed(self):
+        return sum(len(values) for values in self.latencies.values())
+
+    def failed(self):
+        return sum(sum(errors.values()) for errors in self.errors.values())
+
+
+def histogram(latencies, buckets=BUCKETS):
+    """list of (bucket upper bound, count)"""
+    counts = [0] * len(buckets)
+    for latency in latencies:
+        for i, bound in enumerate(buckets):
+            if latency <= bound:
+                counts[i] += 1
+                break
+    return list(zip(buckets, counts))
+
+
+def _error_name(err):
+    """short name of an AmazonException, e.g. RequestThrottled"""
+    if getattr(err, 'code', None):
+        return err.code
+    message = str(err)
+    for name in ('RequestThrottled', 'InternalError', 'DeadlineExceeded'):
+        if name in message:
+            return name
+    return type(err).__name__
+
+
+def _timed(result, operation, call, *args, **kwargs):
+    start = time.time()
+    try:
+        value = call(*args, **kwargs)
+    except AmazonException as err:
+        result.add(operation, time.time() - start, _error_name(err))
+        return None
+    result.add(operation, time.time() - start)
+    return value
+
+
+def _lookup_workload(amazon, asins, result, batch_size):
+    _timed(result, 'lookup', amazon.lookup, random.sample(asins, batch_size))
+
+
+def _cart_workload(amazon, asins, result, batch_size):
+    first, second = random.sample(asins, 2)
+    cart = _timed(result, 'CartCreate', AmazonCart, amazon.AssociateTag, amazon.AWSAccessKeyId,
+                  amazon.AWSAccessKeySecret, transport=amazon.transport, limiter=amazon.limiter,
+                  Endpoint=amazon.Endpoint, retry_count=amazon.retry_count, ItemId=first)
+    if cart is None or not cart.cart_id:
+        return
+    if _timed(result, 'CartAdd', cart.add, ItemId=second) is None:
+        return
+    if _timed(result, 'CartModify', cart.modify, ItemId=first, Quantity=2) is None:
+        return
+    _timed(result, 'CartClear', cart.clear)
+
+
+def run_load(amazon, asins, workload='lookup', threads=8, duration=10.0, requests=None,
+             batch_size=10):
+    """
+    Run workload from threads threads until duration seconds have passed
+    or requests workload iterations are done, return a LoadResult.
+    """
+    if workload not in WORKLOADS:
+        raise ValueError('workload must be one of: %s' % ', '.join(WORKLOADS))
+    result = LoadResult()
+    remaining = [requests]
+    lock = threading.Lock()
+    stop_time = time.time() + duration if duration else None
+
+    def worker():
+        while stop_time is None or time.time() < stop_time:
+            with lock:
+                if remaining[0] is not None:
+                    if remaining[0] <= 0:
+                        return
+                    remaining[0] -= 1
+            cart = workload == 'cart' or workload == 'mixed' and random.random() < 0.2
+            if cart:
+                _cart_workload(amazon, asins, result, batch_size)
+            else:
+                _lookup_workload(amazon, asins, result, batch_size)
+
+    start = time.time()
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    for thread in workers:
+        thread.daemon = True
+        thread.start()
+    for thread in workers:
+        thread.join()
+    result.elapsed = time.time() - start
+    return result
+
+
+def report(result):
+    """text report of a LoadResult"""
+    elapsed = result.elapsed or 1e-9
+    lines = ['%s operations in %.2f secs: %.1f ops/sec, %s failed' %
+             (result.completed() + result.failed(), elapsed,
+              (result.completed() + result.failed()) / elapsed, result.failed())]
+    for operation in sorted(set(result.latencies) | set(result.errors)):
+        values = result.latencies.get(operation, [])
+        errors = result.errors.get(operation, {})
+        lines.append('')
+        lines.append('%s: %s ok (%.1f/sec), %s' % (
+            operation, len(values), len(values) / elapsed,
+            ', '.join('%s %s' % (n, name) for name, n in sorted(errors.items())) or 'no errors'))
+        if not values:
+            continue
+        lines.append('  p50 %.1f ms  p90 %.1f ms  p99 %.1f ms  max %.1f ms' % tuple(
+            1000 * v for v in (percentile(values, 50), percentile(values, 90),
+                               percentile(values, 99), max(values))))
+        peak = max(count for _, count in histogram(values)) or 1
+        for bound, count in histogram(values):
+            if count:
+                label = '<= %g ms' % (bound * 1000) if bound != float('inf') else '>  5000 ms'
+                lines.append('  %12s %7s %s' % (label, count, '#' * int(40.0 * count / peak)))
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='paapy-loadgen', description=__doc__.split('\n')[2])
+    parser.add_argument('--endpoint', help='host:port to load, default a local stand-in server')
+    parser.add_argument('--workload', choices=WORKLOADS, default='lookup')
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=10.0, help='seconds to run')
+    parser.add_argument('--requests', type=int, help='stop after this many workload iterations')
+    parser.add_argument('--batch-size', type=int, default=10, help='ItemIds per lookup')
+    parser.add_argument('--qps', type=float, help='client rate limit')
+    parser.add_argument('--retry-count', type=int, default=0)
+    parser.add_argument('--transport', choices=('requests', 'urllib'), default='requests')
+    parser.add_argument('--parse-processes', type=int, default=0,
+                        help='parse responses in this many processes, 0 parses in threads')
+    parser.add_argument('--items', type=int, default=5000, help='stand-in catalog size')
+    parser.add_argument('--latency-median', type=float, default=0.0, help='stand-in, secs')
+    parser.add_argument('--latency-p99', type=float, help='stand-in, secs')
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help='stand-in, 0 to 1')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='stand-in, 0 to 1')
+    parser.add_argument('--item-bytes', type=int, default=0, help='stand-in, size of each item')
+    args = parser.parse_args(argv)
+
+    server = None
+    endpoint = args.endpoint
+    if endpoint is None:
+        server = StandInServer(items=args.items, throttle_rate=args.throttle_rate,
+                               error_rate=args.error_rate, item_bytes=args.item_bytes,
+                               latency=Latency(args.latency_median, args.latency_p99)).start()
+        endpoint = server.endpoint
+        asins = list(server.amazon.catalog)
+    else:
+        asins = ['B%09d' % i for i in range(args.items)]
+
+    if args.transport == 'requests':
+        transport = RequestsTransport(pool_size=args.threads)
+    else:
+        transport = UrllibTransport()
+    parser = ProcessParser(args.parse_processes) if args.parse_processes else None
+    amazon = Amazon('loadgen-20', 'LOADGENKEY', 'loadgen-secret', Endpoint=endpoint,
+                    transport=transport, qps=args.qps, retry_count=args.retry_count,
+                    negative_cache=False, parser=parser)
+    print('Running %s workload with %s threads against %s' %
+          (args.workload, args.threads, endpoint))
+    try:
+        result = run_load(amazon, asins, args.workload, args.threads, args.duration,
+                          args.requests, args.batch_size)
+    finally:
+        transport.close()
+        if parser is not None:
+            parser.close()
+        if server is not None:
+            server.stop()
+    print(report(result))
+    return 1 if result.completed() == 0 else 0
+
+
+__all__ = ['LoadResult', 'histogram', 'run_load', 'report', 'main']
+
+
+if __name__ == '__main__':
+    sys.exit(main())
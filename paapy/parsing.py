@@ -0,0 +1,120 @@
+#!/usr/bin/env
+# -*- coding: utf-8 -*-
+
+"""
+Response Parsing.
+Parsing large XML responses holds the GIL, so at high concurrency one
+core parses while the network threads wait.  A ProcessParser moves the
+parsing to a pool of processes: network threads only fetch the raw bytes
+and get the parsed response back.  Workers send back marshalled plain
+dicts, which load far faster than a pickled OrderedDict tree.  Small
+responses are still parsed in the calling thread, where sending them to
+a process would cost more than parsing them.
+"""
+
+import logging
+import marshal
+import multiprocessing
+import threading
+
+from paapy.exceptions import DeadlineExceeded
+
+
+LOGGER = logging.getLogger(__name__)
+
+
+def parse_response(content, operation):
+    """the <operation>Response element of an XML response, as dicts"""
+    import xmltodict
+    return xmltodict.parse(content)[operation + 'Response']
+
+
+def _parse_marshalled(content, operation):
+    """in a worker: (True, marshalled response) or (False, the exception raised)"""
+    import xmltodict
+    try:
+        response = xmltodict.parse(content, dict_constructor=dict)[operation + 'Response']
+        return True, marshal.dumps(response)
+    except Exception as err:  # returned, so the callback runs for every parse
+        return False, err
+
+
+def _context():
+    """spawn workers where possible, so they are never forked from a threaded client"""
+    try:
+        return multiprocessing.get_context('spawn')
+    except AttributeError:  # Python 2 can only fork
+        return multiprocessing
+
+
+class ProcessParser(object):
+
+    """
+    Parses responses of at least min_bytes in a pool of max_workers
+    processes (one per core by default), which are started right away.
+    On Python 2 they are forked, so create the ProcessParser before
+    starting threads.  Elsewhere they are spawned, so a script creating
+    one needs an if __name__ == '__main__' guard.  Responses parsed in a
+    worker are plain dicts.  A parse that runs past its timeout can't be
+    stopped and keeps its worker until it finishes.  While every worker
+    is busy, responses are parsed in the calling thread instead of
+    queueing.
+    """
+
+    def __init__(self, max_workers=None, min_bytes=16384):
+        self.max_workers = int(max_workers or multiprocessing.cpu_count())
+        self.min_bytes = int(min_bytes)
+        self.offloaded = 0
+        self.local = 0
+        self.timeouts = 0
+        self._busy = 0
+        self._lock = threading.Lock()
+        self._pool = _context().Pool(self.max_workers)
+
+    def _parsed(self, result):
+        with self._lock:
+            self._busy -= 1
+
+    def parse(self, content, operation, timeout=None):
+        """
+        Parse content, in a worker process if it is large enough and one is
+        free.  With a timeout, raise DeadlineExceeded if parsing takes longer.
+        """
+        with self._lock:
+            pool = self._pool
+            offload = len(content) >= self.min_bytes and pool is not None and \
+                self._busy < self.max_workers
+            if offload:
+                self._busy += 1
+                self.offloaded += 1
+            else:
+                self.local += 1
+        if not offload:
+            return parse_response(content, operation)
+        result = pool.apply_async(_parse_marshalled, (content, operation),
+                                   callback=self._parsed)
+        try:
+            parsed, data = result.get(timeout)
+        except multiprocessing.TimeoutError:
+            with self._lock:
+                self.timeouts += 1
+            raise DeadlineExceeded('Parsing the %s response did not finish in time.' % operation)
+        if not parsed:
+            raise data
+        return marshal.loads(data)
+
+    def stats(self):
+        with self._lock:
+            return {'offloaded': self.offloaded, 'local': self.local,
+                    'timeouts': self.timeouts, 'busy': self._busy}
+
+    def close(self):
+        """stop the workers once their parses finish, later responses are parsed locally"""
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+
+__all__ = ['ProcessParser', 'parse_response']
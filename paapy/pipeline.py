@@ -0,0 +1,163 @@
+#!/usr/bin/env
+# -*- coding: utf-8 -*-
+
+"""
+Bulk Ingestion.
+Streams ItemIds from a file or iterator through Amazon.lookup_results and
+writes one JSON item per line, and one line per ItemId that could not be
+looked up to a separate file.  After every completed batch a checkpoint
+records how many ItemIds were consumed and how long both files were, so a
+restarted run skips the finished batches and drops any partial output.
+Memory use does not depend on the size of the input.
+"""
+
+from itertools import islice
+import io
+import json
+import logging
+import os
+
+from paapy.api import FOUND, THROTTLED
+from paapy.productadvertising import STRING_TYPES
+from paapy.exceptions import AmazonException
+from paapy.quota import _replace
+
+
+LOGGER = logging.getLogger(__name__)
+
+
+def read_ids(source):
+    """
+    Yield ItemIds one at a time from a file name or an iterable of
+    strings.  Blank lines are skipped and comma separated lines are split.
+    """
+    if isinstance(source, STRING_TYPES):
+        with io.open(source, 'r', encoding='utf-8') as id_file:
+            for item_id in read_ids(id_file):
+                yield item_id
+        return
+    for line in source:
+        for item_id in line.split(','):
+            item_id = item_id.strip()
+            if item_id:
+                yield item_id
+
+
+class IngestPipeline(object):
+
+    """
+    Looks up every ItemId of a source and appends the items to output as
+    JSON lines.  ItemIds that are invalid, not accessible or not found are
+    written to failed with their status, one JSON list per line, it
+    defaults to output + '.failed'.  checkpoint is the path of the
+    checkpoint file, it defaults to output + '.checkpoint'.  Extra keyword
+    arguments are passed to Amazon.lookup_results.
+    """
+
+    def __init__(self, amazon, output, checkpoint=None, failed=None, **kwargs):
+        self.amazon = amazon
+        self.output = output
+        self.checkpoint = checkpoint or output + '.checkpoint'
+        self.failed = failed or output + '.failed'
+        self.batch_size = int(kwargs.pop('batch_size', amazon.item_lookup_max))
+        self.checkpoint_every = int(kwargs.pop('checkpoint_every', 1))
+        self.lookup_kwargs = kwargs
+
+    def load_checkpoint(self):
+        """return the saved checkpoint, or None"""
+        try:
+            with open(self.checkpoint, 'r') as checkpoint_file:
+                return json.load(checkpoint_file)
+        except IOError:
+            return None
+        except ValueError:
+            raise AmazonException('Checkpoint %s is corrupt.  Remove it to start over.'
+                                  % self.checkpoint)
+
+    def save_checkpoint(self, state):
+        """write state to the checkpoint file atomically"""
+        temp_name = self.checkpoint + '.tmp'
+        with open(temp_name, 'w') as checkpoint_file:
+            json.dump(state, checkpoint_file)
+            checkpoint_file.flush()
+            os.fsync(checkpoint_file.fileno())
+        _replace(temp_name, self.checkpoint)
+
+    def _open(self, path, offset):
+        if offset and os.path.exists(path):
+            out = open(path, 'r+b')
+            out.truncate(offset)
+            out.seek(offset)
+            return out
+        return open(path, 'wb')
+
+    def _save(self, out, failed, state):
+        for data in (out, failed):
+            data.flush()
+            os.fsync(data.fileno())
+        state['offset'] = out.tell()
+        state['failed_offset'] = failed.tell()
+        self.save_checkpoint(state)
+
+    def _lookup(self, batch):
+        """
+        the items of batch and the (ItemId, status, error) of those that
+        failed.  Raises if a batch stayed throttled, so the run can resume.
+        """
+        items, failed = [], []
+        for result in self.amazon.lookup_results(batch, **self.lookup_kwargs).values():
+            if result.status == FOUND:
+                items.append(result.item)
+            elif result.status == THROTTLED:
+                raise AmazonException(result.error)
+            else:
+                failed.append([result.item_id, result.status, result.error])
+        return items, failed
+
+    def run(self, source):
+        """
+        Look up every ItemId in source, resuming from the checkpoint if one
+        exists.  Returns the checkpoint state: ItemIds consumed, items
+        written, ItemIds failed, file offsets and whether the run completed.
+        """
+        state = self.load_checkpoint()
+        if state is None:
+            state = {'consumed': 0, 'items': 0, 'offset': 0, 'failed': 0,
+                     'failed_offset': 0, 'complete': False}
+        elif state.get('complete'):
+            LOGGER.info('%s is already complete.', self.output)
+            return state
+        else:
+            LOGGER.info('Resuming %s after %s ItemIds.', self.output, state['consumed'])
+
+        state.setdefault('failed', 0)
+        state.setdefault('failed_offset', 0)
+        ids = islice(read_ids(source), state['consumed'], None)
+        out = self._open(self.output, state['offset'])
+        failed = self._open(self.failed, state['failed_offset'])
+        try:
+            batches = 0
+            while True:
+                batch = list(islice(ids, self.batch_size))
+                if not batch:
+                    break
+                items, errors = self._lookup(batch)
+                for item in items:
+                    out.write(json.dumps(item).encode('utf-8') + b'\n')
+                    state['items'] += 1
+                for error in errors:
+                    failed.write(json.dumps(error).encode('utf-8') + b'\n')
+                    state['failed'] += 1
+                state['consumed'] += len(batch)
+                batches += 1
+                if batches % self.checkpoint_every == 0:
+                    self._save(out, failed, state)
+            state['complete'] = True
+            self._save(out, failed, state)
+        finally:
+            out.close()
+            failed.close()
+        return state
+
+
+__all__ = ['read_ids', 'IngestPipeline']
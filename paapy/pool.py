@@ -0,0 +1,266 @@
+#!/usr/bin/env
+# -*- coding: utf-8 -*-
+
+"""
+Credential Pools.
+A CredentialPool spreads requests over several sets of Amazon credentials,
+each with its own RateLimiter.  Every operation goes to the healthy
+credentials whose next request slot is soonest.  Credentials that are
+throttled or keep failing are rested for a cooldown period.  A cart's
+HMAC is only valid for the credentials that created it, so carts stay on
+those credentials.
+"""
+
+import json
+import logging
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+
+from paapy.api import Amazon, AmazonCart, is_throttled
+from paapy.deadline import as_deadline
+from paapy.exceptions import AmazonException, TransportException
+from paapy.ratelimit import RateLimiter
+from paapy.transport import RequestsTransport
+
+
+LOGGER = logging.getLogger(__name__)
+
+
+class PooledCredentials(object):
+
+    """
+    One set of credentials in a CredentialPool: its Amazon client and
+    health counters.
+    """
+
+    def __init__(self, client):
+        self.client = client
+        self.AWSAccessKeyId = client.AWSAccessKeyId
+        self.requests = 0
+        self.errors = 0
+        self.throttles = 0
+        self.failures = 0  # consecutive, reset by a success
+        self.in_flight = 0
+        self.resting_until = 0
+
+    @property
+    def credentials(self):
+        return (self.client.AssociateTag, self.client.AWSAccessKeyId,
+                self.client.AWSAccessKeySecret)
+
+    def available_at(self, now):
+        """time this set can send its next request"""
+        slot = self.client.limiter.available_at(now) if self.client.limiter else now
+        return max(slot, self.resting_until)
+
+    def expected_start(self, now):
+        """
+        time a request routed here now would be sent, after the requests
+        already in flight on it take their slots
+        """
+        interval = self.client.limiter.interval if self.client.limiter else 0
+        return self.available_at(now) + self.in_flight * interval
+
+    def stats(self):
+        now = time.time()
+        return {
+            'AWSAccessKeyId': self.AWSAccessKeyId,
+            'requests': self.requests,
+            'errors': self.errors,
+            'throttles': self.throttles,
+            'in_flight': self.in_flight,
+            'healthy': self.resting_until <= now,
+            'resting': max(0, self.resting_until - now)
+        }
+
+
+class CredentialPool(object):
+
+    """
+    Routes Amazon operations over several credentials.  credentials is a
+    list of (AssociateTag, AWSAccessKeyId, AWSAccessKeySecret) tuples, or of
+    dicts of Amazon keyword arguments (e.g. with a qps per set).  Other
+    keyword arguments are passed to every client, and all clients share one
+    transport.  A throttled set rests for cooldown seconds, a set failing
+    max_failures times in a row rests as well.  lookup sends its batches
+    of 10 ItemIds concurrently, spread over the sets.
+    """
+
+    def __init__(self, credentials, **kwargs):
+        if not credentials:
+            raise ValueError('At least one set of credentials is required.')
+        self.cooldown = float(kwargs.pop('cooldown', 30))
+        self.max_failures = int(kwargs.pop('max_failures', 3))
+        self._owns_transport = kwargs.get('transport') is None
+        if self._owns_transport:
+            kwargs['transport'] = RequestsTransport(pool_size=len(credentials))
+        self.transport = kwargs['transport']
+        self.client_kwargs = kwargs
+        self.members = []
+        for creds in credentials:
+            options = dict(kwargs)
+            if isinstance(creds, dict):
+                options.update(creds)
+                creds = (options.pop('AssociateTag', None), options.pop('AWSAccessKeyId', None),
+                         options.pop('AWSAccessKeySecret', None))
+            if options.get('limiter') is None and options.get('qps'):
+                options['limiter'] = RateLimiter(options['qps'])
+            self.members.append(PooledCredentials(Amazon(*creds, **options)))
+        self._by_key = dict((m.AWSAccessKeyId, m) for m in self.members)
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def __len__(self):
+        return len(self.members)
+
+    def _acquire(self, exclude=()):
+        """
+        pick the set that would send a request soonest, counting the requests
+        already routed to it, and reserve it by counting this one in flight
+        """
+        with self._lock:
+            members = [m for m in self.members if m not in exclude] or self.members
+            now = time.time()
+            member = min(members, key=lambda m: (m.expected_start(now), m.in_flight, m.requests))
+            member.in_flight += 1
+        return member
+
+    def _release(self, member, err=None):
+        with self._lock:
+            member.in_flight -= 1
+            member.requests += 1
+            if err is None:
+                member.failures = 0
+                return
+            member.errors += 1
+            if is_throttled(err):
+                member.throttles += 1
+                member.resting_until = time.time() + self.cooldown
+                LOGGER.warning('%s was throttled, resting it for %s secs.',
+                               member.AWSAccessKeyId, self.cooldown)
+            elif isinstance(err, TransportException) or \
+                    (getattr(err, 'status_code', None) or 0) >= 500:
+                member.failures += 1
+                if member.failures >= self.max_failures:
+                    member.resting_until = time.time() + self.cooldown
+                    LOGGER.warning('%s failed %s times, resting it for %s secs.',
+                                   member.AWSAccessKeyId, member.failures, self.cooldown)
+
+    def call(self, method, *args, **kwargs):
+        """
+        Run Amazon.method on the best credentials.  A throttled request is
+        retried on each of the other sets before the error is raised.
+        """
+        tried = []
+        while True:
+            member = self._acquire(exclude=tried)
+            try:
+                result = getattr(member.client, method)(*args, **kwargs)
+            except AmazonException as err:
+                self._release(member, err)
+                tried.append(member)
+                if not is_throttled(err) or len(tried) >= len(self.members):
+                    raise
+                LOGGER.info('Retrying %s with other credentials.', method)
+            else:
+                self._release(member)
+                return result
+
+    def ItemSearch(self, **kwargs):
+        return self.call('ItemSearch', **kwargs)
+
+    def ItemLookup(self, ItemId=None, **kwargs):
+        return self.call('ItemLookup', ItemId=ItemId, **kwargs)
+
+    def BrowseNodeLookup(self, BrowseNodeId=None, **kwargs):
+        return self.call('BrowseNodeLookup', BrowseNodeId=BrowseNodeId, **kwargs)
+
+    def SimilarityLookup(self, ItemId=None, **kwargs):
+        return self.call('SimilarityLookup', ItemId=ItemId, **kwargs)
+
+    def lookup(self, ItemId, **kwargs):
+        """
+        Amazon.lookup, with each batch of 10 ItemIds sent on its own
+        credentials, concurrently.  A throttled batch is retried on the
+        other sets, batches that succeeded are not sent again.
+        """
+        ItemId = self.members[0].client._parse_multiple_items(ItemId)
+        size = self.members[0].client.item_lookup_max
+        batches = [ItemId[i:i + size] for i in range(0, len(ItemId), size)]
+        if len(batches) <= 1:
+            return self.call('lookup', ItemId, **kwargs)
+        deadline = as_deadline(kwargs.get('deadline'))
+        if deadline is not None:
+            kwargs['deadline'] = deadline  # shared by every batch
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(len(self.members))
+        futures = [self._executor.submit(self.call, 'lookup', batch, **kwargs)
+                   for batch in batches]
+        items = []
+        try:
+            for future in futures:
+                items.extend(future.result())
+        finally:
+            for future in futures:
+                future.cancel()
+        return items
+
+    def cart(self, **kwargs):
+        """
+        New AmazonCart on the best credentials, using their rate limiter.
+        Keyword arguments are passed to AmazonCart, so ItemId creates the cart.
+        """
+        member = self._acquire()
+        try:
+            cart = AmazonCart(*member.credentials, **self._cart_kwargs(member, kwargs))
+        except AmazonException as err:
+            self._release(member, err)
+            raise
+        self._release(member)
+        return cart
+
+    def rehydrate(self, states, verify=False):
+        """
+        Rebuild saved carts (see AmazonCart.to_dict) on the credentials
+        that created them.
+        """
+        carts = []
+        for state in states:
+            if not isinstance(state, dict):
+                state = json.loads(state)
+            member = self._by_key.get(state.get('AWSAccessKeyId'))
+            if member is None:
+                raise AmazonException('Cart %s was created with credentials %s which are '
+                                      'not in the pool.' % (state.get('CartId'),
+                                                            state.get('AWSAccessKeyId')))
+            carts.append(AmazonCart.from_dict(state, *member.credentials, verify=verify,
+                                              **self._cart_kwargs(member, {})))
+        return carts
+
+    def _cart_kwargs(self, member, kwargs):
+        options = dict(self.client_kwargs, transport=self.transport,
+                       limiter=member.client.limiter, signer=member.client.signer,
+                       Region=member.client.Region)
+        options.pop('qps', None)
+        options.pop('item_cache', None)
+        options.update(kwargs)
+        return options
+
+    def stats(self):
+        """health and request counts of each set of credentials"""
+        with self._lock:
+            return [member.stats() for member in self.members]
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown()
+        for member in self.members:
+            member.client.close()
+        if self._owns_transport:
+            self.transport.close()
+
+
+__all__ = ['CredentialPool', 'PooledCredentials']
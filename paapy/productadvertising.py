@@ -4,24 +4,33 @@
 """Python Product Advertising API"""
 
 from base64 import b64encode
+from functools import partial
 from hashlib import sha256
 
 import time
 import hmac
 import logging
+import threading
 
 try:
     from urllib.parse import quote as quote
 except ImportError:
     from urllib import quote as quote
 
-import xmltodict
-import requests
-
-from paapy.exceptions import AmazonException
+from paapy.deadline import as_deadline
+from paapy.exceptions import AmazonException, DeadlineExceeded, TransportException
+from paapy.hedging import HEDGED_OPERATIONS, Hedger
+from paapy.parsing import ProcessParser
+from paapy.ratelimit import RateLimiter
+from paapy.transport import ACCEPT_ENCODING, RequestsTransport
 
 LOGGER = logging.getLogger(__name__)
 
+try:
+    STRING_TYPES = (str, unicode)
+except NameError:
+    STRING_TYPES = (str,)
+
 NO_RETRY_CODES = [403] # HTTP failure status codes that will not be retried.
 
 DOMAINS = {
@@ -40,6 +49,34 @@ DOMAINS = {
 }
 
 
+def _parse_xml(content):
+    """parse an XML response to dicts, xmltodict is only imported when first needed"""
+    import xmltodict
+    return xmltodict.parse(content)
+
+
+class Signer(object):
+
+    """
+    Signs requests with HMAC-SHA256.  The secret is encoded and keyed once,
+    each signature works on a copy, so one Signer can be shared by threads.
+    """
+
+    def __init__(self, AWSAccessKeySecret):
+        key = AWSAccessKeySecret
+        if not isinstance(key, bytes):
+            key = key.encode('utf-8')
+        self._hmac = hmac.new(key, digestmod=sha256)
+
+    def sign(self, msg):
+        """url encoded base64 signature of msg"""
+        if not isinstance(msg, bytes):
+            msg = msg.encode('utf-8')
+        new_hmac = self._hmac.copy()
+        new_hmac.update(msg)
+        return quote(b64encode(new_hmac.digest()))
+
+
 class ProductAdvertisingAPI(object):
 
     """
@@ -60,19 +97,43 @@ class ProductAdvertisingAPI(object):
         self.Version = kwargs.pop('Version', '2013-08-01')
         self.Service = kwargs.pop('Service', 'AWSECommerceService')
         self.Validate = kwargs.pop('Validate', False)
+        self.Endpoint = kwargs.pop('Endpoint', None)  # host[:port], overrides the Region's domain
         self.ITEM_ID_MAX = 10
-        self._response = None
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.signer = kwargs.pop('signer', None)
+        if self.signer is None:
+            self.signer = Signer(AWSAccessKeySecret)
         self.retry_count = kwargs.pop('retry_count', 3)
         self.qps = kwargs.pop('qps', None)
         self.timeout = kwargs.pop('timeout', None)
-        self._last_time = None
+        pool_size = kwargs.pop('pool_size', None)
+        self.transport = kwargs.pop('transport', None) or RequestsTransport(pool_size=pool_size)
+        self.compression = kwargs.pop('compression', True)
+        self.transfer_stats = {'responses': 0, 'wire_bytes': 0, 'content_bytes': 0}
+        self.limiter = kwargs.pop('limiter', None)
+        self.priority = kwargs.pop('priority', None)
+        self.deadline = kwargs.pop('deadline', None)
+        self.quota = kwargs.pop('quota', None)
+        self.hedger = kwargs.pop('hedge', None)
+        self._owns_hedger = self.hedger is True
+        if self.hedger is True:
+            self.hedger = Hedger()
+        self.parser = kwargs.pop('parser', None)
+        self._owns_parser = self.parser is True
+        if self.parser is True:
+            self.parser = ProcessParser()
         if not isinstance(self.Region, str) or self.Region.upper() not in DOMAINS:
             raise ValueError('Your region is currently unsupported.')
-        if self.qps:
+        if self.limiter is not None:
+            self.qps = self.limiter.qps
+        elif self.qps:
             try:
                 self.qps = float(self.qps)
             except:
                 raise ValueError('qps (query per second) must be a number.')
+            if self.qps > 0:
+                self.limiter = RateLimiter(self.qps)
         if not isinstance(self.retry_count, int):
             try:
                 self.retry_count = int(self.retry_count)
@@ -82,24 +143,65 @@ class ProductAdvertisingAPI(object):
 
     def _make_request(self, name, **kwargs):
 
+        priority = kwargs.pop('priority', None) or self.priority
+        deadline = self._start_deadline(kwargs)
+        kwargs.pop('deadline', None)
+
         request = AmazonRequest(self.AssociateTag, self.AWSAccessKeyId,
                                 self.AWSAccessKeySecret, Operation=name,
                                 Region=self.Region, Service=self.Service,
                                 Version=self.Version, Validate=self.Validate,
-                                timeout=self.timeout, retry_count=self.retry_count)
-
-        if self.qps is not None and self.qps > 0:
-            if self._last_time is not None:
-                wait_time = 1 / self.qps - (time.time() - self._last_time)
-                if wait_time > 0:
-                    LOGGER.warning('Waiting %s secs to send next Request.',
-                                   round(wait_time, 3))
-                    time.sleep(wait_time)
-            self._last_time = time.time()
-
-        self._response = request.execute(**kwargs)
+                                timeout=self.timeout, retry_count=self.retry_count,
+                                transport=self.transport, compression=self.compression,
+                                signer=self.signer, hedger=self.hedger, limiter=self.limiter,
+                                Endpoint=self.Endpoint, parser=self.parser)
+
+        if self.quota is not None:
+            self.quota.wait(priority, deadline)
+        if self.limiter is not None:
+            self.limiter.wait(priority, deadline)
+        if self.quota is not None:
+            # counted only once the limiter lets the request through
+            self.quota.record()
+
+        try:
+            self._response = request.execute(deadline=deadline, **kwargs)
+        finally:
+            if self.quota is not None:
+                # retries and hedges count against the quota as well
+                self.quota.record(request.responses - 1)
+            with self._lock:
+                self.transfer_stats['responses'] += request.responses
+                self.transfer_stats['wire_bytes'] += request.wire_bytes
+                self.transfer_stats['content_bytes'] += request.content_bytes
         return self._response
 
+    def close(self):
+        """stop the Hedger and ProcessParser this client created with hedge=True, parser=True"""
+        if self._owns_hedger:
+            self.hedger.close()
+        if self._owns_parser:
+            self.parser.close()
+
+    @property
+    def _response(self):
+        """the last response received by the calling thread"""
+        return getattr(self._local, 'response', None)
+
+    @_response.setter
+    def _response(self, response):
+        self._local.response = response
+
+    def _start_deadline(self, kwargs):
+        """
+        Start the deadline of a call (the deadline keyword or the client's
+        default) and store it in kwargs, so every request of the call shares it.
+        """
+        deadline = as_deadline(kwargs.get('deadline', self.deadline))
+        if deadline is not None:
+            kwargs['deadline'] = deadline
+        return deadline
+
     def _check_valid_asin(self, asin):
         """
         Strings will be split by commas (,) and lists of strings are OK too
@@ -126,32 +228,37 @@ class ProductAdvertisingAPI(object):
                 raise ValueError('Invalid Quantity "%s": Quantity must be between'
                                  ' 0 and 999, inclusive.' % quant)
 
+    def _parse_errors(self, request):
+        """return the (Code, Message) of each error in the request"""
+        if 'Errors' not in request:
+            return []
+        errors = request['Errors']['Error']
+        errors = [errors] if not isinstance(errors, list) else errors
+        return [(err['Code'], err['Message']) for err in errors]
+
     def _handle_errors(self, request):
         """log request errors, raise if necessary"""
-        if 'Errors' in request:
-            errors = request['Errors']['Error']
-            errors = [errors] if not isinstance(errors, list) else errors
-            error_output = []
-            for err in errors:
-                err_message = err['Message']
-                err_code = err['Code']
-                LOGGER.error('%s  -  %s', err_code, err_message)
-                error_output.append('%s  -  %s' % (err_code, err_message))
-            if len(error_output) > 0:
-                raise AmazonException(' , '.join(error_output))
+        error_output = []
+        for err_code, err_message in self._parse_errors(request):
+            LOGGER.error('%s  -  %s', err_code, err_message)
+            error_output.append('%s  -  %s' % (err_code, err_message))
+        if len(error_output) > 0:
+            raise AmazonException(' , '.join(error_output))
         return self
 
     def _parse_multiple_items(self, data):
         """turn data from string to list"""
-        if isinstance(data, str) and ',' in data:
+        if isinstance(data, STRING_TYPES) and ',' in data:
             data = data.split(',')
         if not isinstance(data, list):
             data = [data]
         return data
 
     def ItemSearch(self, **kwargs):
+        raise_errors = kwargs.pop('raise_errors', True)
         response = self._make_request('ItemSearch', **kwargs)
-        self._handle_errors(response['Items']['Request'])
+        if raise_errors:
+            self._handle_errors(response['Items']['Request'])
         return response
 
     def BrowseNodeLookup(self, BrowseNodeId=None, **kwargs):
@@ -171,14 +278,19 @@ class ProductAdvertisingAPI(object):
     def ItemLookup(self, ItemId=None, **kwargs):
         if ItemId is None:
             raise ValueError('ItemId is required.')
+        raise_errors = kwargs.pop('raise_errors', True)
         ItemId = self._parse_multiple_items(ItemId)
-        self._check_valid_asin(ItemId)
+        if kwargs.get('ItemIdType', 'ASIN') == 'ASIN':
+            self._check_valid_asin(ItemId)
+        elif 'SearchIndex' not in kwargs:
+            raise ValueError('SearchIndex is required when ItemIdType is not ASIN.')
         params = {
             'ItemId': ','.join(ItemId)
         }
         kwargs.update(params)
         response = self._make_request('ItemLookup', **kwargs)
-        self._handle_errors(response['Items']['Request'])
+        if raise_errors:
+            self._handle_errors(response['Items']['Request'])
         return response
 
     def SimilarityLookup(self, ItemId=None, **kwargs):
@@ -338,7 +450,9 @@ class AmazonRequest(object):
     """
 
     def __init__(self, AssociateTag, AWSAccessKeyId, AWSAccessKeySecret,
-                 Operation, Region, Service, Version, Validate, timeout, retry_count):
+                 Operation, Region, Service, Version, Validate, timeout, retry_count,
+                 transport, compression=True, signer=None, hedger=None, limiter=None,
+                 Endpoint=None, parser=None):
         if Operation not in ['BrowseNodeLookup', 'ItemSearch', 'ItemLookup',
                              'SimilarityLookup', 'CartAdd', 'CartClear',
                              'CartCreate', 'CartGet', 'CartModify']:
@@ -354,8 +468,19 @@ class AmazonRequest(object):
         self.Service = Service
         self.Version = Version
         self.Validate = Validate
+        self.Endpoint = Endpoint or DOMAINS[Region]
         self.timeout = timeout
         self.retry_count = retry_count
+        self.transport = transport
+        self.compression = compression
+        self.signer = signer if signer is not None else Signer(AWSAccessKeySecret)
+        # only idempotent operations are hedged, see paapy.hedging
+        self.hedger = hedger if Operation in HEDGED_OPERATIONS else None
+        self.limiter = limiter
+        self.parser = parser
+        self.responses = 0
+        self.wire_bytes = 0
+        self.content_bytes = 0
 
     def _unicode_safe(self, x):
         return quote(unicode(x).encode('utf-8'), safe='~')
@@ -368,18 +493,8 @@ class AmazonRequest(object):
         return query_string
 
     def _get_signature(self, query):
-        msg = 'GET\n%s\n/onca/xml\n%s' % (DOMAINS[self.Region], query)
-
-        if isinstance(msg, unicode):
-            msg = msg.encode('utf-8')
-
-        if isinstance(self.AWSAccessKeySecret, unicode):
-            self.AWSAccessKeySecret = self.AWSAccessKeySecret.encode('utf-8')
-
-        new_hmac = hmac.new(self.AWSAccessKeySecret, msg, sha256).digest()
-        encoded_hmac = b64encode(new_hmac)
-        url_encoded_hmac = quote(encoded_hmac)
-        return url_encoded_hmac
+        msg = 'GET\n%s\n/onca/xml\n%s' % (self.Endpoint, query)
+        return self.signer.sign(msg)
 
     def _get_signed_url(self, **kwargs):
         """Return Signed URL for Request"""
@@ -399,58 +514,111 @@ class AmazonRequest(object):
         signature = self._get_signature(query_string)
 
         return 'http://%s/onca/xml?%s&Signature=%s' % \
-               (DOMAINS[self.Region], query_string, signature)
+               (self.Endpoint, query_string, signature)
 
     def _handle_request_errors(self, response):
         """log errors, raise an AmazonException if a problem occurs"""
         if response.status_code != 200:
 
-            err = xmltodict.parse(response.text)
+            err = _parse_xml(response.content)
             err_code = err[self.Operation + 'ErrorResponse']['Error']['Code']
             err_msg = err[self.Operation + 'ErrorResponse']['Error']['Message']
 
-            LOGGER.debug(response.text)
+            LOGGER.debug(response.content)
             LOGGER.error('Amazon %sRequest STATUS %s: %s - %s',
                          self.Operation, response.status_code, err_code, err_msg)
 
-            raise AmazonException('AmazonRequestError %s: %s - %s' % \
-                                  (response.status_code, err_code, err_msg))
+            error = AmazonException('AmazonRequestError %s: %s - %s' % \
+                                    (response.status_code, err_code, err_msg))
+            # so callers can tell errors apart without parsing the message
+            error.status_code = response.status_code
+            error.code = err_code
+            raise error
+
+    def _record_size(self, response):
+        """count body bytes received on the wire and after decompression"""
+        wire_size = getattr(response, 'wire_size', len(response.content))
+        self.responses += 1
+        self.wire_bytes += wire_size
+        self.content_bytes += len(response.content)
+        LOGGER.debug('%s response: %s bytes, %s bytes on the wire',
+                     self.Operation, len(response.content), wire_size)
 
     def execute(self, **kwargs):
         """execute AmazonRequest, return response as JSON"""
 
         trying, try_num = True, 0
+        attempt_time = 0
+        deadline = kwargs.pop('deadline', None)
         headers = kwargs.pop('headers', None)
+        # requests.Session asks for gzip by default, so ask for identity explicitly
+        headers = dict(headers or {})
+        headers.setdefault('Accept-Encoding', ACCEPT_ENCODING if self.compression else 'identity')
 
         while trying and try_num <= self.retry_count:
 
             try:
 
                 try_num += 1
+                response = None
                 url = self._get_signed_url(**kwargs)
 
-                if headers:
-                    response = requests.get(url, timeout=self.timeout, headers=headers)
+                timeout = self.timeout
+                if deadline is not None:
+                    deadline.check(self.Operation)
+                    timeout = deadline.timeout(timeout)
+
+                start = time.time()
+                if self.hedger is not None:
+                    send = partial(self.transport.send, url, timeout=timeout, headers=headers)
+                    response = self.hedger.send(send, self.limiter)
                 else:
-                    response = requests.get(url, timeout=self.timeout)
+                    response = self.transport.send(url, timeout=timeout, headers=headers)
+                attempt_time = time.time() - start
+                self._record_size(response)
 
                 self._handle_request_errors(response)
                 trying = False
 
-            except (AmazonException, requests.exceptions.ConnectTimeout) as err:
+            except DeadlineExceeded:
+                raise
+
+            # TransportException is an AmazonException, so network errors are
+            # retried too.  A Cart operation changes the cart, so it is only
+            # sent again if the failed attempt never reached Amazon.
+            except AmazonException as err:
 
                 try:
                     short_circuit = response.status_code in NO_RETRY_CODES
                 except (TypeError, NameError, AttributeError):
                     short_circuit = False
+                if self.Operation.startswith('Cart') and isinstance(err, TransportException) \
+                        and getattr(err, 'sent', True):
+                    short_circuit = True
 
                 if try_num > self.retry_count or short_circuit:
                     raise err
 
+                # fail fast if another attempt like the last can't finish in time
+                if deadline is not None and deadline.remaining() < attempt_time:
+                    raise DeadlineExceeded('%s  -  %s retry cannot finish before the deadline, '
+                                           '%s secs left.' % (err, self.Operation,
+                                                              round(deadline.remaining(), 3)))
+
                 sleep_time = 1
                 LOGGER.warning('Error encountered: %s.  Retrying momentarily...', err)
 
-        return xmltodict.parse(response.text)[self.Operation + 'Response']
+        if deadline is not None:
+            deadline.check(self.Operation)
+        if self.parser is not None:
+            timeout = deadline.remaining() if deadline is not None else None
+            result = self.parser.parse(response.content, self.Operation, timeout)
+        else:
+            result = _parse_xml(response.content)[self.Operation + 'Response']
+        if deadline is not None:
+            # parsing is part of the request, a parse that ran past it fails it
+            deadline.check(self.Operation)
+        return result
 
 
-__all__ = ['ProductAdvertisingAPI']
+__all__ = ['ProductAdvertisingAPI', 'Signer']
@@ -0,0 +1,211 @@
+#!/usr/bin/env
+# -*- coding: utf-8 -*-
+
+"""
+Daily Quotas.
+A DailyQuota counts the requests sent over a rolling window (a day by
+default) against the account's allowance.  Part of the allowance is held
+back for the reserved (interactive) lanes, so batch work cannot use it
+all, and batch requests are spaced evenly over the window so a batch job
+doesn't spend its share by noon.  With a path the counts are saved to a
+JSON file and survive restarts.  One DailyQuota can be shared by the
+clients of an account, but not by several processes.
+"""
+
+from collections import deque
+import json
+import logging
+import os
+import threading
+import time
+
+from paapy.exceptions import AmazonException, DeadlineExceeded, QuotaExceeded
+from paapy.ratelimit import INTERACTIVE
+
+
+LOGGER = logging.getLogger(__name__)
+
+DAY = 24 * 60 * 60
+
+
+def _replace(source, target):
+    """rename source over target, also on Windows, where os.rename can't"""
+    replace = getattr(os, 'replace', None)  # not on Python 2
+    if replace is not None:
+        return replace(source, target)
+    if os.name == 'nt' and os.path.exists(target):
+        os.remove(target)
+    os.rename(source, target)
+
+
+class DailyQuota(object):
+
+    """
+    At most limit requests per window seconds.  reserve is the fraction of
+    the limit only the reserved_lanes may use, the other lanes are paced at
+    window / batch_limit seconds per request.  Requests are counted in
+    buckets of window / buckets seconds.  The counts are saved to path
+    every save_every requests, and by save() and close().
+    """
+
+    def __init__(self, limit, window=DAY, reserve=0.1, reserved_lanes=(INTERACTIVE,),
+                 path=None, save_every=10, buckets=1440, clock=time.time, sleep=time.sleep):
+        self.limit = int(limit)
+        if self.limit <= 0:
+            raise ValueError('limit must be a positive number of requests.')
+        if not 0 <= reserve < 1:
+            raise ValueError('reserve must be a fraction of the limit, from 0 up to 1.')
+        self.window = float(window)
+        self.reserve = float(reserve)
+        self.reserved_lanes = frozenset(reserved_lanes)
+        self.batch_limit = max(1, int(self.limit * (1 - self.reserve)))
+        self.path = path
+        self.save_every = int(save_every)
+        self.bucket_size = self.window / int(buckets)
+        self.clock = clock
+        self.sleep = sleep
+        self._lock = threading.Lock()
+        self._buckets = deque()  # [bucket start, count], oldest first
+        self._used = 0
+        self._unsaved = 0
+        self._next_batch = None
+        if path is not None:
+            self.load()
+
+    @property
+    def batch_interval(self):
+        """seconds between two requests of the unreserved lanes"""
+        return self.window / self.batch_limit
+
+    def _expire(self, now):
+        cutoff = now - self.window
+        while self._buckets and self._buckets[0][0] + self.bucket_size <= cutoff:
+            self._used -= self._buckets.popleft()[1]
+
+    def _add(self, now, count):
+        start = now - now % self.bucket_size
+        if self._buckets and self._buckets[-1][0] == start:
+            self._buckets[-1][1] += count
+        else:
+            self._buckets.append([start, count])
+        self._used += count
+        self._unsaved += count
+
+    def _limit_for(self, priority):
+        if (priority or INTERACTIVE) in self.reserved_lanes:
+            return self.limit
+        return self.batch_limit
+
+    def used(self):
+        """requests counted in the current window"""
+        with self._lock:
+            self._expire(self.clock())
+            return self._used
+
+    def remaining(self, priority=None):
+        """requests the priority lane (the reserved lane by default) may still send"""
+        with self._lock:
+            self._expire(self.clock())
+            return max(0, self._limit_for(priority) - self._used)
+
+    def frees_at(self):
+        """time the oldest counted requests drop out of the window"""
+        with self._lock:
+            now = self.clock()
+            self._expire(now)
+            if not self._buckets:
+                return now
+            return self._buckets[0][0] + self.bucket_size + self.window
+
+    def wait(self, priority=None, deadline=None):
+        """
+        Wait for the priority lane's next paced slot, without counting a
+        request, return the seconds waited.  Raise QuotaExceeded if the
+        lane's allowance is used up, and DeadlineExceeded if a paced batch
+        request can't start in time.  Count the request with record() once
+        it is sent.
+        """
+        with self._lock:
+            now = self.clock()
+            self._expire(now)
+            limit = self._limit_for(priority)
+            if self._used >= limit:
+                raise QuotaExceeded('Daily quota used up for %s requests: %s of %s sent in '
+                                    'the last %s secs.' % (priority or INTERACTIVE, self._used,
+                                                           limit, self.window))
+            wait_time = 0
+            if limit != self.limit:
+                slot = now if self._next_batch is None else max(now, self._next_batch)
+                if deadline is not None and slot > deadline.expires:
+                    raise DeadlineExceeded('Next %s request is paced to %s secs from now, past '
+                                           'the deadline.' % (priority, round(slot - now, 3)))
+                self._next_batch = slot + self.batch_interval
+                wait_time = slot - now
+        if wait_time > 0:
+            self.sleep(wait_time)
+        return wait_time
+
+    def acquire(self, priority=None, deadline=None):
+        """wait() for the priority lane and count one request, return the seconds waited"""
+        wait_time = self.wait(priority, deadline)
+        self.record()
+        return wait_time
+
+    def record(self, count=1):
+        """count requests sent, e.g. after wait() or for retries"""
+        if count <= 0:
+            return
+        with self._lock:
+            now = self.clock()
+            self._expire(now)
+            self._add(now, count)
+            save = self.path is not None and self._unsaved >= self.save_every
+        if save:
+            self.save()
+
+    def load(self):
+        """read the saved counts of path, if it exists"""
+        try:
+            with open(self.path, 'r') as quota_file:
+                state = json.load(quota_file)
+        except IOError:
+            return
+        except ValueError:
+            raise AmazonException('Quota file %s is corrupt.  Remove it to start over.'
+                                  % self.path)
+        with self._lock:
+            self._buckets = deque([float(start), int(count)] for start, count in state['buckets'])
+            self._used = sum(count for _, count in self._buckets)
+            self._expire(self.clock())
+            LOGGER.info('Loaded quota from %s, %s requests used.', self.path, self._used)
+
+    def save(self):
+        """write the counts to path atomically"""
+        if self.path is None:
+            return
+        with self._lock:
+            state = {'window': self.window, 'buckets': [list(b) for b in self._buckets]}
+            self._unsaved = 0
+            temp_name = self.path + '.tmp'
+            with open(temp_name, 'w') as quota_file:
+                json.dump(state, quota_file)
+                quota_file.flush()
+                os.fsync(quota_file.fileno())
+            _replace(temp_name, self.path)
+
+    def stats(self):
+        with self._lock:
+            self._expire(self.clock())
+            return {
+                'limit': self.limit,
+                'used': self._used,
+                'remaining': max(0, self.limit - self._used),
+                'batch_remaining': max(0, self.batch_limit - self._used),
+                'window': self.window
+            }
+
+    def close(self):
+        self.save()
+
+
+__all__ = ['DailyQuota', 'DAY']
@@ -0,0 +1,171 @@
+#!/usr/bin/env
+# -*- coding: utf-8 -*-
+
+"""
+Rate Limiting.
+A RateLimiter spaces requests 1 / qps seconds apart.  It is thread-safe,
+so one limiter can be shared by several ProductAdvertisingAPI instances
+that use the same credentials.
+
+Waiting requests queue in priority lanes.  Each free slot goes to the
+highest priority lane with a request waiting, unless a lower lane has
+received less than its minimum share of the recent slots it was waiting
+for, so batch work fills the capacity interactive calls leave over but is
+never starved.  Slots handed out while a lane had nothing queued don't
+count against it, so a new batch backlog can't jump the interactive queue
+to catch up on them.
+"""
+
+from collections import deque, OrderedDict
+import threading
+import time
+import logging
+
+from paapy.exceptions import DeadlineExceeded
+
+
+LOGGER = logging.getLogger(__name__)
+
+INTERACTIVE = 'interactive'
+BATCH = 'batch'
+
+# lanes in priority order, with the minimum share of slots each is guaranteed
+DEFAULT_LANES = ((INTERACTIVE, 0.0), (BATCH, 0.1))
+
+
+class RateLimiter(object):
+
+    """
+    Hands out request slots at most qps per second.
+    lanes is a sequence of (name, minimum share) in priority order, shares
+    are measured over those of the last history slots handed out while the
+    lane had requests waiting.
+    """
+
+    def __init__(self, qps, lanes=DEFAULT_LANES, history=100):
+        try:
+            self.qps = float(qps)
+        except (TypeError, ValueError):
+            raise ValueError('qps (query per second) must be a number.')
+        if self.qps <= 0:
+            raise ValueError('qps (query per second) must be positive.')
+        self.lanes = OrderedDict((name, float(share)) for name, share in lanes)
+        if not self.lanes or sum(self.lanes.values()) > 1:
+            raise ValueError('lanes must be named, with minimum shares adding up to at most 1.')
+        self.default_lane = next(iter(self.lanes))
+        self._lock = threading.Lock()
+        self._ready = threading.Condition(self._lock)
+        self._next_time = None
+        self._queues = OrderedDict((name, deque()) for name in self.lanes)
+        self._recent = deque(maxlen=int(history))  # (lane served, lanes waiting)
+        self.served = dict((name, 0) for name in self.lanes)
+
+    @property
+    def interval(self):
+        """seconds between two requests"""
+        return 1 / self.qps
+
+    def available_at(self, now=None):
+        """time the next free slot starts, without reserving it"""
+        with self._lock:
+            now = time.time() if now is None else now
+            return now if self._next_time is None else max(now, self._next_time)
+
+    def _take_slot(self, now):
+        slot = now if self._next_time is None else max(now, self._next_time)
+        self._next_time = slot + self.interval
+        return slot
+
+    def reserve(self):
+        """reserve the next free slot, ahead of any queue, return the time it starts"""
+        with self._lock:
+            return self._take_slot(time.time())
+
+    def try_acquire(self):
+        """take the next slot if it is free now and nobody is queued, without waiting"""
+        with self._lock:
+            now = time.time()
+            if any(self._queues.values()) or (self._next_time is not None and
+                                              now < self._next_time):
+                return False
+            self._take_slot(now)
+            return True
+
+    def _next_lane(self):
+        """lane whose head gets the next slot"""
+        waiting = [name for name, queue in self._queues.items() if queue]
+        for name in waiting[1:]:
+            share = self.lanes[name]
+            if not share:
+                continue
+            contested = [served for served, lanes in self._recent if name in lanes]
+            if contested.count(name) < share * len(contested):
+                return name
+        return waiting[0]
+
+    @staticmethod
+    def _wait_time(wait_time, deadline, now):
+        return wait_time if deadline is None else min(wait_time, max(0, deadline.expires - now))
+
+    def depth(self):
+        """number of requests waiting in each lane"""
+        with self._lock:
+            return dict((name, len(queue)) for name, queue in self._queues.items())
+
+    def _expected_slot(self, lane, now):
+        """earliest time a request joining lane could be sent"""
+        ahead = 0
+        for name, queue in self._queues.items():
+            ahead += len(queue)
+            if name == lane:
+                break
+        start = now if self._next_time is None else max(now, self._next_time)
+        return start + ahead * self.interval
+
+    def wait(self, priority=None, deadline=None):
+        """
+        block until the next free slot for the priority lane (the first lane
+        by default), return the number of seconds waited.  With a deadline,
+        raise DeadlineExceeded instead of waiting past it, or straight away
+        if the requests queued ahead cannot be sent before it.
+        """
+        lane = priority or self.default_lane
+        if lane not in self._queues:
+            raise ValueError('Unknown priority "%s".  Valid priorities are: %s' %
+                             (lane, ', '.join(self.lanes)))
+        ticket = object()
+        start = time.time()
+        with self._lock:
+            queue = self._queues[lane]
+            if deadline is not None and self._expected_slot(lane, start) > deadline.expires:
+                raise DeadlineExceeded('No %s slot free before the deadline, %s requests '
+                                       'queued.' % (lane, sum(map(len, self._queues.values()))))
+            queue.append(ticket)
+            while True:
+                now = time.time()
+                if deadline is not None and now >= deadline.expires:
+                    queue.remove(ticket)
+                    self._ready.notify_all()
+                    raise DeadlineExceeded('Deadline passed after waiting %s secs in the %s '
+                                           'lane.' % (round(now - start, 3), lane))
+                if self._next_time is not None and now < self._next_time:
+                    self._ready.wait(self._wait_time(self._next_time - now, deadline, now))
+                elif self._next_lane() == lane and queue[0] is ticket:
+                    waiting = frozenset(name for name, q in self._queues.items() if q)
+                    queue.popleft()
+                    self._take_slot(now)
+                    self._recent.append((lane, waiting))
+                    self.served[lane] += 1
+                    self._ready.notify_all()
+                    break
+                else:
+                    # the slot is someone else's, check again once it's taken
+                    self._ready.wait(self._wait_time(self.interval, deadline, now))
+        wait_time = time.time() - start
+        if wait_time > 0.001:
+            LOGGER.debug('Waited %s secs in the %s lane to send next Request.',
+                         round(wait_time, 3), lane)
+        return wait_time
+
+
+__all__ = ['RateLimiter', 'INTERACTIVE', 'BATCH', 'DEFAULT_LANES']
@@ -0,0 +1,215 @@
+#!/usr/bin/env
+# -*- coding: utf-8 -*-
+
+"""
+Refresh Scheduling.
+Refreshes a large set of tracked ASINs through Amazon.lookup at a fixed
+request rate, most urgent first.  An item's urgency is its staleness
+times its importance weight.  Items are kept in a heap ordered by the time
+at which staleness * weight reaches the scheduler's horizon, which keeps
+the order stable between refreshes, so picking a batch is O(log n).
+"""
+
+from collections import deque
+import heapq
+import itertools
+import logging
+import time
+
+from paapy.api import FOUND, INVALID
+from paapy.exceptions import AmazonException
+
+
+LOGGER = logging.getLogger(__name__)
+
+
+def percentile(values, pct):
+    """nearest-rank percentile of a list of numbers, None if it is empty"""
+    if not values:
+        return None
+    values = sorted(values)
+    index = int(round(pct / 100.0 * (len(values) - 1)))
+    return values[index]
+
+
+class RefreshScheduler(object):
+
+    """
+    Refreshes tracked ASINs in batches of up to batch_size ItemIds,
+    sending one batch every 1 / qps seconds.  Each batch of items looked
+    up is passed to callback(items).  An ASIN that fails is retried
+    retry_delay * 2 ** (failures - 1) seconds later, at most
+    max_retry_delay, one Amazon reports as invalid is dropped.  Extra
+    keyword arguments are passed to Amazon.lookup_results.
+    """
+
+    def __init__(self, amazon, qps=None, callback=None, **kwargs):
+        self.amazon = amazon
+        self.qps = float(qps or amazon.qps or 0)
+        if self.qps <= 0:
+            raise ValueError('qps (query per second) must be a positive number.')
+        self.callback = callback
+        self.batch_size = int(kwargs.pop('batch_size', amazon.item_lookup_max))
+        self.horizon = float(kwargs.pop('horizon', 3600))
+        self.retry_delay = float(kwargs.pop('retry_delay', 60))
+        self.max_retry_delay = float(kwargs.pop('max_retry_delay', self.horizon))
+        self.clock = kwargs.pop('clock', time.time)
+        self.sleep = kwargs.pop('sleep', time.sleep)
+        self.latencies = deque(maxlen=int(kwargs.pop('history', 10000)))
+        self.lookup_kwargs = kwargs
+        self.batches = 0
+        self.failures = {}  # ASIN -> consecutive failed refreshes
+        self.dropped = []  # ASINs Amazon reported as invalid
+        self._heap = []
+        self._entries = {}
+        self._counter = itertools.count()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _push(self, asin, weight, last_refreshed, due=None):
+        # never refreshed items are the most urgent, oldest first
+        if due is None:
+            due = (last_refreshed or 0) + self.horizon / weight
+        entry = [due, next(self._counter), asin, weight, last_refreshed]
+        self._entries[asin] = entry
+        heapq.heappush(self._heap, entry)
+
+    def track(self, ItemId, weight=1.0, last_refreshed=None):
+        """
+        Start refreshing ItemId (one ASIN or a list).  weight is its relative
+        importance, last_refreshed the time it was last fetched, if known.
+        Tracking an ASIN again updates its weight.
+        """
+        weight = float(weight)
+        if weight <= 0:
+            raise ValueError('weight must be positive.')
+        for asin in self.amazon._parse_multiple_items(ItemId):
+            last = last_refreshed
+            old = self._entries.pop(asin, None)
+            if old is not None:
+                old[2] = None  # stale heap entry, skipped when popped
+                if last is None:
+                    last = old[4]
+            self._push(asin, weight, last)
+        return self
+
+    def untrack(self, ItemId):
+        """stop refreshing ItemId"""
+        for asin in self.amazon._parse_multiple_items(ItemId):
+            entry = self._entries.pop(asin, None)
+            if entry is not None:
+                entry[2] = None
+            self.failures.pop(asin, None)
+        return self
+
+    def next_batch(self):
+        """
+        remove and return the most urgent entries, up to batch_size.
+        Entries backing off after a failure are skipped until they are due.
+        """
+        now = self.clock()
+        batch, waiting = [], []
+        while self._heap and len(batch) < self.batch_size:
+            entry = heapq.heappop(self._heap)
+            if entry[2] is None:
+                continue
+            if entry[0] > now and entry[2] in self.failures:
+                waiting.append(entry)
+            else:
+                batch.append(entry)
+        for entry in waiting:
+            heapq.heappush(self._heap, entry)
+        return batch
+
+    def step(self):
+        """look up one batch, return the items found"""
+        batch = self.next_batch()
+        if not batch:
+            return []
+        asins = [entry[2] for entry in batch]
+        try:
+            results = self.amazon.lookup_results(asins, **self.lookup_kwargs)
+        except AmazonException as err:
+            LOGGER.error('Refresh of %s failed: %s', ','.join(asins), err)
+            self._retry_later(batch)
+            return []
+        now = self.clock()
+        self.batches += 1
+        items, failed = [], []
+        for entry in batch:
+            _, _, asin, weight, last_refreshed = entry
+            result = results[asin]
+            if result.status == INVALID:
+                LOGGER.warning('No longer refreshing %s: %s', asin, result.error)
+                self._entries.pop(asin, None)
+                self.failures.pop(asin, None)
+                self.dropped.append(asin)
+                continue
+            if result.status != FOUND:
+                failed.append(entry)
+                continue
+            items.append(result.item)
+            if last_refreshed is not None:
+                self.latencies.append(now - last_refreshed)
+            self.failures.pop(asin, None)
+            self._push(asin, weight, now)
+        if failed:
+            LOGGER.error('Refresh of %s failed: %s', ','.join(e[2] for e in failed),
+                         results[failed[0][2]].error)
+            self._retry_later(failed)
+        if self.callback is not None:
+            self.callback(items)
+        return items
+
+    def _retry_later(self, batch):
+        """back off the entries of a failed batch, so other items go first"""
+        now = self.clock()
+        for _, _, asin, weight, last_refreshed in batch:
+            failures = self.failures.get(asin, 0) + 1
+            self.failures[asin] = failures
+            delay = min(self.max_retry_delay, self.retry_delay * 2 ** (failures - 1))
+            self._push(asin, weight, last_refreshed, due=now + delay)
+
+    def run(self, duration=None, max_batches=None):
+        """
+        Send one batch every 1 / qps seconds until duration seconds have
+        passed, max_batches have been sent, or nothing is tracked.
+        """
+        start = next_time = self.clock()
+        sent = 0
+        while self._entries:
+            if max_batches is not None and sent >= max_batches:
+                break
+            if duration is not None and next_time - start >= duration:
+                break
+            wait_time = next_time - self.clock()
+            if wait_time > 0:
+                self.sleep(wait_time)
+            self.step()
+            sent += 1
+            next_time += 1 / self.qps
+        return self
+
+    def coverage(self):
+        """
+        Report how fresh the tracked items are: the staleness of the oldest
+        item, the number never refreshed, and percentiles of the time between
+        two refreshes of an item.  Scans every tracked item.
+        """
+        now = self.clock()
+        refreshed = [e[4] for e in self._entries.values() if e[4] is not None]
+        latencies = list(self.latencies)
+        return {
+            'tracked': len(self._entries),
+            'never_refreshed': len(self._entries) - len(refreshed),
+            'oldest_staleness': now - min(refreshed) if refreshed else None,
+            'refresh_latency_p50': percentile(latencies, 50),
+            'refresh_latency_p90': percentile(latencies, 90),
+            'refresh_latency_p99': percentile(latencies, 99),
+            'failing': len(self.failures),
+            'batches': self.batches
+        }
+
+
+__all__ = ['RefreshScheduler']
@@ -0,0 +1,405 @@
+#!/usr/bin/env
+# -*- coding: utf-8 -*-
+
+"""
+Local Stand-in Server.
+Answers the nine Product Advertising API Operations with realistic XML,
+so clients can be load tested without touching the real endpoint.
+Items come from a generated catalog.  Latency, throttling, error rate
+and response size are configurable.  Point a client at it with
+Endpoint=server.endpoint.
+"""
+
+from collections import OrderedDict
+import logging
+import math
+import random
+import threading
+import time
+
+try:
+    from urllib.parse import urlparse, parse_qs
+except ImportError:
+    from urlparse import urlparse, parse_qs
+
+try:
+    from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+    from SocketServer import ThreadingMixIn
+except ImportError:
+    from http.server import HTTPServer, BaseHTTPRequestHandler
+    from socketserver import ThreadingMixIn
+
+from xml.sax.saxutils import escape
+
+
+LOGGER = logging.getLogger(__name__)
+
+ROOT_NODES = [('1000', 'Books'), ('172282', 'Electronics'), ('1055398', 'Home & Kitchen'),
+              ('165793011', 'Toys & Games'), ('3375251', 'Sports & Outdoors')]
+
+PAGE_SIZE = 10
+MAX_PAGES = 10  # ItemSearch returns at most 10 pages, like the real API
+
+
+class Latency(object):
+
+    """
+    Log-normal response delay with the given median and 99th percentile,
+    in seconds.  Latency(0, 0) adds no delay.
+    """
+
+    def __init__(self, median=0.0, p99=None, rand=None):
+        self.median = float(median)
+        p99 = float(p99 if p99 is not None else median)
+        self.sigma = math.log(p99 / self.median) / 2.326 if self.median > 0 and p99 > 0 else 0
+        self.rand = rand or random.Random()
+
+    def sample(self):
+        if self.median <= 0:
+            return 0.0
+        return self.rand.lognormvariate(math.log(self.median), self.sigma)
+
+
+class CatalogItem(object):
+
+    def __init__(self, index, rand):
+        self.asin = 'B%09d' % index
+        self.node, self.category = ROOT_NODES[index % len(ROOT_NODES)]
+        self.subnode = '%s%02d' % (self.node, index % 7)
+        self.title = '%s item %s' % (self.category, index)
+        self.brand = 'Brand %s' % (index % 50)
+        self.price = int(rand.paretovariate(1.2) * 500)
+        self.list_price = self.price + rand.randint(0, self.price // 3 + 1)
+        self.offers = rand.randint(1, 40)
+        self.sales_rank = rand.randint(1, 2000000)
+        self.upc = '%012d' % (700000000000 + index)
+
+
+class StandInAmazon(object):
+
+    """
+    Request handler behind StandInServer, callable as
+    handler(url, timeout, headers) -> (status, body), so it can also serve
+    a MemoryTransport.
+
+    items is the catalog size.  latency is a Latency.  throttle_rate and
+    error_rate are the chances of a 503 RequestThrottled or a 500
+    InternalError answer.  item_bytes pads every item to about that size.
+    """
+
+    def __init__(self, items=5000, latency=None, throttle_rate=0.0, error_rate=0.0,
+                 item_bytes=0, seed=0):
+        rand = random.Random(seed)
+        self.catalog = OrderedDict()
+        for index in range(items):
+            item = CatalogItem(index, rand)
+            self.catalog[item.asin] = item
+        self.by_upc = dict((item.upc, item) for item in self.catalog.values())
+        self.latency = latency or Latency()
+        self.throttle_rate = float(throttle_rate)
+        self.error_rate = float(error_rate)
+        self.item_bytes = int(item_bytes)
+        self.rand = random.Random(seed + 1)
+        self.carts = {}
+        self.counts = {}
+        self._next_id = 0
+        self._lock = threading.RLock()
+
+    def __call__(self, url, timeout=None, headers=None):
+        params = dict((k, v[0]) for k, v in parse_qs(urlparse(url).query).items())
+        operation = params.get('Operation', '')
+        with self._lock:
+            self.counts[operation] = self.counts.get(operation, 0) + 1
+            chance = self.rand.random()
+            delay = self.latency.sample()
+        if delay:
+            time.sleep(delay)
+        if chance < self.throttle_rate:
+            return 503, self._error(operation, 'RequestThrottled',
+                                    'AWS Access Key ID: %s. You are submitting requests too '
+                                    'quickly. Please retry your requests at a slower rate.' %
+                                    params.get('AWSAccessKeyId'))
+        if chance < self.throttle_rate + self.error_rate:
+            return 500, self._error(operation, 'InternalError',
+                                    'The request processing has failed because of an unknown '
+                                    'error, exception or failure.')
+        handler = getattr(self, '_' + operation, None)
+        if handler is None:
+            return 400, self._error(operation, 'AWS.InvalidOperationParameter',
+                                    'The Operation parameter is invalid.')
+        body = handler(params)
+        return 200, ('<?xml version="1.0" ?><%sResponse xmlns="http://webservices.amazon.com/'
+                     'AWSECommerceService/2013-08-01"><OperationRequest><RequestId>%s</RequestId>'
+                     '</OperationRequest>%s</%sResponse>' %
+                     (operation, self._new_id('req-'), body, operation)).encode('utf-8')
+
+    def _error(self, operation, code, message):
+        return ('<?xml version="1.0" ?><%sErrorResponse><Error><Code>%s</Code>'
+                '<Message>%s</Message></Error><RequestId>%s</RequestId></%sErrorResponse>' %
+                (operation, code, escape(message), self._new_id('req-'), operation)
+                ).encode('utf-8')
+
+    def _new_id(self, prefix):
+        with self._lock:
+            self._next_id += 1
+            return '%s%s' % (prefix, self._next_id)
+
+    def _request_xml(self, operation, params, errors=()):
+        errors = ''.join('<Error><Code>%s</Code><Message>%s</Message></Error>' %
+                         (code, escape(message)) for code, message in errors)
+        args = ''.join('<%s>%s</%s>' % (k, escape(v), k) for k, v in sorted(params.items())
+                       if not k.startswith('Item.') and
+                       k not in ('Signature', 'AWSAccessKeyId', 'Timestamp', 'Operation',
+                                 'Service', 'Version', 'Validate', 'AssociateTag'))
+        items = ''.join('<Item>%s</Item>' % ''.join('<%s>%s</%s>' % (k, escape('%s' % v), k)
+                                                    for k, v in item)
+                        for item in self._cart_items(params))
+        if items:
+            args += '<Items>%s</Items>' % items
+        return ('<Request><IsValid>True</IsValid><%sRequest>%s</%sRequest>%s</Request>' %
+                (operation, args, operation, '<Errors>%s</Errors>' % errors if errors else ''))
+
+    def _item_xml(self, item):
+        xml = ('<Item><ASIN>%(asin)s</ASIN><DetailPageURL>https://www.amazon.com/dp/%(asin)s'
+               '</DetailPageURL><SalesRank>%(rank)s</SalesRank>'
+               '<LargeImage><URL>https://images.example/%(asin)s.jpg</URL>'
+               '<Height Units="pixels">500</Height><Width Units="pixels">500</Width></LargeImage>'
+               '<BrowseNodes><BrowseNode><BrowseNodeId>%(subnode)s</BrowseNodeId>'
+               '<Ancestors><BrowseNode><BrowseNodeId>%(node)s</BrowseNodeId><Name>%(category)s'
+               '</Name></BrowseNode></Ancestors></BrowseNode></BrowseNodes>'
+               '<ItemAttributes><Brand>%(brand)s</Brand><Title>%(title)s</Title>'
+               '<ProductGroup>%(category)s</ProductGroup><UPC>%(upc)s</UPC>'
+               '<UPCList><UPCListElement>%(upc)s</UPCListElement></UPCList>'
+               '<ListPrice><Amount>%(list_price)s</Amount><CurrencyCode>USD</CurrencyCode>'
+               '<FormattedPrice>$%(list_dollars).2f</FormattedPrice></ListPrice></ItemAttributes>'
+               '<OfferSummary><LowestNewPrice><Amount>%(price)s</Amount><CurrencyCode>USD'
+               '</CurrencyCode><FormattedPrice>$%(dollars).2f</FormattedPrice></LowestNewPrice>'
+               '<TotalNew>%(offers)s</TotalNew><TotalUsed>0</TotalUsed></OfferSummary>'
+               '<Offers><TotalOffers>%(offers)s</TotalOffers><TotalOfferPages>1</TotalOfferPages>'
+               '<Offer><OfferListing><OfferListingId>%(asin)s-offer</OfferListingId><Price>'
+               '<Amount>%(price)s</Amount><CurrencyCode>USD</CurrencyCode><FormattedPrice>'
+               '$%(dollars).2f</FormattedPrice></Price><Availability>Usually ships in 24 hours'
+               '</Availability><AvailabilityAttributes><AvailabilityType>now</AvailabilityType>'
+               '</AvailabilityAttributes><IsEligibleForPrime>1</IsEligibleForPrime>'
+               '</OfferListing></Offer></Offers>' %
+               dict(asin=item.asin, rank=item.sales_rank, subnode=item.subnode, node=item.node,
+                    category=escape(item.category), brand=item.brand, title=escape(item.title),
+                    upc=item.upc, list_price=item.list_price, list_dollars=item.list_price / 100.0,
+                    price=item.price, dollars=item.price / 100.0, offers=item.offers))
+        padding = self.item_bytes - len(xml) - 80
+        if padding > 0:
+            xml += ('<EditorialReviews><EditorialReview><Source>Product Description</Source>'
+                    '<Content>%s</Content></EditorialReview></EditorialReviews>' %
+                    ('Lorem ipsum dolor sit amet. ' * (padding // 28 + 1))[:padding])
+        return xml + '</Item>'
+
+    def _ItemLookup(self, params):
+        id_type = params.get('ItemIdType', 'ASIN')
+        ids = [i for i in params.get('ItemId', '').split(',') if i]
+        found, errors = [], []
+        for item_id in ids:
+            item = self.catalog.get(item_id) if id_type == 'ASIN' else self.by_upc.get(item_id)
+            if item is not None:
+                found.append(item)
+            elif id_type == 'ASIN' and (len(item_id) != 10 or not item_id.startswith('B')):
+                errors.append(('AWS.InvalidParameterValue',
+                               '%s is not a valid value for ItemId. Please change this value '
+                               'and retry your request.' % item_id))
+            else:
+                errors.append(('AWS.ECommerceService.NoExactMatches',
+                               'We did not find any matches for your request.'))
+        return '<Items>%s%s</Items>' % (self._request_xml('ItemLookup', params, errors),
+                                        ''.join(self._item_xml(item) for item in found))
+
+    def _search(self, params):
+        node = params.get('BrowseNode')
+        keywords = params.get('Keywords', '').lower().split()
+        low = int(params.get('MinimumPrice', 0))
+        high = int(params.get('MaximumPrice', 0)) or None
+        return [item for item in self.catalog.values()
+                if (node is None or node in (item.node, item.subnode))
+                and all(word in item.title.lower() or word in item.category.lower()
+                        for word in keywords)
+                and item.price >= low and (high is None or item.price <= high)]
+
+    def _ItemSearch(self, params):
+        matches = self._search(params)
+        page = int(params.get('ItemPage', 1))
+        if page < 1 or page > MAX_PAGES:
+            errors = [('AWS.ParameterOutOfRange', 'The value you specified for ItemPage is '
+                       'invalid. Valid values must be between 1 and %s.' % MAX_PAGES)]
+            return '<Items>%s</Items>' % self._request_xml('ItemSearch', params, errors)
+        errors = [] if matches else [('AWS.ECommerceService.NoExactMatches',
+                                      'We did not find any matches for your request.')]
+        pages = (len(matches) + PAGE_SIZE - 1) // PAGE_SIZE
+        items = matches[(page - 1) * PAGE_SIZE:page * PAGE_SIZE]
+        return ('<Items>%s<TotalResults>%s</TotalResults><TotalPages>%s</TotalPages>%s</Items>' %
+                (self._request_xml('ItemSearch', params, errors), len(matches), pages,
+                 ''.join(self._item_xml(item) for item in items)))
+
+    def _SimilarityLookup(self, params):
+        item = self.catalog.get(params.get('ItemId', '').split(',')[0])
+        similar = [i for i in self.catalog.values()
+                   if item is not None and i.node == item.node and i is not item][:PAGE_SIZE]
+        return '<Items>%s%s</Items>' % (self._request_xml('SimilarityLookup', params),
+                                        ''.join(self._item_xml(i) for i in similar))
+
+    def _BrowseNodeLookup(self, params):
+        node_id = params.get('BrowseNodeId')
+        names = dict(ROOT_NODES)
+        if node_id in names:
+            name = names[node_id]
+            children = ''.join('<BrowseNode><BrowseNodeId>%s%02d</BrowseNodeId><Name>%s %s</Name>'
+                               '</BrowseNode>' % (node_id, i, escape(name), i) for i in range(7))
+            node = ('<BrowseNode><BrowseNodeId>%s</BrowseNodeId><Name>%s</Name><IsCategoryRoot>1'
+                    '</IsCategoryRoot><Children>%s</Children></BrowseNode>' %
+                    (node_id, escape(name), children))
+        else:
+            node = ('<BrowseNode><BrowseNodeId>%s</BrowseNodeId><Name>Node %s</Name>'
+                    '</BrowseNode>' % (escape(node_id or ''), escape(node_id or '')))
+        return '<BrowseNodes>%s%s</BrowseNodes>' % (self._request_xml('BrowseNodeLookup', params),
+                                                     node)
+
+    def _cart_items(self, params, key=None):
+        """
+        Item.N.* parameters, as (item[key], Quantity) pairs or, without key,
+        as lists of sorted (name, value) pairs
+        """
+        items = {}
+        for name, value in params.items():
+            parts = name.split('.')
+            if len(parts) == 3 and parts[0] == 'Item' and parts[1].isdigit():
+                items.setdefault(int(parts[1]), {})[parts[2]] = value
+        if key is None:
+            return [sorted(items[i].items()) for i in sorted(items)]
+        return [(items[i].get(key), int(items[i].get('Quantity', 1))) for i in sorted(items)]
+
+    def _cart_xml(self, operation, params, cart_id, cart):
+        if cart is None:
+            errors = [('AWS.ECommerceService.CartInfoMismatch', 'Your request contains an '
+                       'invalid AssociateTag, CartId and HMAC combination.')]
+            return '<Cart>%s</Cart>' % self._request_xml(operation, params, errors)
+        subtotal = sum(self.catalog[asin].price * q for asin, q in cart['items'].values())
+        items = ''.join(
+            '<CartItem><CartItemId>%s</CartItemId><ASIN>%s</ASIN><Quantity>%s</Quantity>'
+            '<Title>%s</Title><Price><Amount>%s</Amount><CurrencyCode>USD</CurrencyCode></Price>'
+            '<ItemTotal><Amount>%s</Amount></ItemTotal></CartItem>' %
+            (cid, asin, q, escape(self.catalog[asin].title), self.catalog[asin].price,
+             self.catalog[asin].price * q) for cid, (asin, q) in cart['items'].items())
+        return ('<Cart>%s<CartId>%s</CartId><HMAC>%s</HMAC><URLEncodedHMAC>%s</URLEncodedHMAC>'
+                '<PurchaseURL>https://www.amazon.com/gp/cart/aws-merge.html?cart-id=%s'
+                '</PurchaseURL><SubTotal><Amount>%s</Amount><CurrencyCode>USD</CurrencyCode>'
+                '</SubTotal>%s</Cart>' %
+                (self._request_xml(operation, params), cart_id, cart['hmac'], cart['hmac'],
+                 cart_id, subtotal, '<CartItems>%s</CartItems>' % items if items else ''))
+
+    def _cart_request(self, operation, params, change=None, create=False):
+        """
+        apply change(cart, params) to the request's cart and render it,
+        all under one hold of the lock.  A CartId and HMAC that don't
+        match a cart render an error and change nothing.
+        """
+        with self._lock:
+            if create:
+                cart_id = self._new_id('cart-')
+                self.carts[cart_id] = {'hmac': 'hmac-%s' % cart_id, 'items': OrderedDict()}
+            else:
+                cart_id = params.get('CartId')
+            cart = self.carts.get(cart_id)
+            if cart is not None and params.get('HMAC', cart['hmac']) != cart['hmac']:
+                cart = None
+            if cart is not None and change is not None:
+                change(cart, params)
+            return self._cart_xml(operation, params, cart_id, cart)
+
+    def _add_items(self, cart, params):
+        for asin, quantity in self._cart_items(params, 'ASIN'):
+            if asin not in self.catalog:
+                continue
+            for cid, (c_asin, c_quantity) in cart['items'].items():
+                if c_asin == asin:
+                    cart['items'][cid] = (asin, c_quantity + quantity)
+                    break
+            else:
+                cart['items'][self._new_id('C')] = (asin, quantity)
+
+    def _modify_items(self, cart, params):
+        for cid, quantity in self._cart_items(params, 'CartItemId'):
+            if quantity == 0:
+                cart['items'].pop(cid, None)
+            elif cid in cart['items']:
+                cart['items'][cid] = (cart['items'][cid][0], quantity)
+
+    @staticmethod
+    def _clear_items(cart, params):
+        cart['items'].clear()
+
+    def _CartCreate(self, params):
+        return self._cart_request('CartCreate', params, self._add_items, create=True)
+
+    def _CartAdd(self, params):
+        return self._cart_request('CartAdd', params, self._add_items)
+
+    def _CartModify(self, params):
+        return self._cart_request('CartModify', params, self._modify_items)
+
+    def _CartClear(self, params):
+        return self._cart_request('CartClear', params, self._clear_items)
+
+    def _CartGet(self, params):
+        return self._cart_request('CartGet', params)
+
+
+class _Handler(BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        if not self.path.startswith('/onca/xml'):
+            status, body = 404, b'Not Found'
+        else:
+            status, body = self.server.amazon(self.path, None, dict(self.headers.items()))
+        self.send_response(status)
+        self.send_header('Content-Type', 'text/xml;charset=UTF-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class StandInServer(ThreadingMixIn, HTTPServer):
+
+    """
+    HTTP server on host:port (port 0 picks a free one) answering like
+    the Product Advertising API.  Keyword arguments go to StandInAmazon.
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host='127.0.0.1', port=0, **kwargs):
+        HTTPServer.__init__(self, (host, port), _Handler)
+        self.amazon = StandInAmazon(**kwargs)
+        self._thread = None
+
+    @property
+    def endpoint(self):
+        """host:port to pass to a client as Endpoint"""
+        return '%s:%s' % self.server_address[:2]
+
+    def start(self):
+        """serve from a background thread"""
+        self._thread = threading.Thread(target=self.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+        LOGGER.info('Stand-in Product Advertising API on %s', self.endpoint)
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+__all__ = ['Latency', 'StandInAmazon', 'StandInServer']
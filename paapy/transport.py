@@ -0,0 +1,185 @@
+#!/usr/bin/env
+# -*- coding: utf-8 -*-
+
+"""
+HTTP Transports.
+A Transport sends a signed URL to Amazon and returns the status code and
+the raw bytes of the body.  ProductAdvertisingAPI accepts any object with
+a `send(url, timeout=None, headers=None)` method returning a TransportResponse,
+so the network layer can be swapped without touching the request logic.
+"""
+
+import logging
+import socket
+import zlib
+
+try:
+    from urllib.request import Request, urlopen
+    from urllib.error import HTTPError, URLError
+except ImportError:
+    from urllib2 import Request, urlopen, HTTPError, URLError
+
+from paapy.exceptions import TransportException
+
+
+LOGGER = logging.getLogger(__name__)
+
+
+ACCEPT_ENCODING = 'gzip, deflate'
+
+
+def decode_content(content, encoding):
+    """decompress a gzip or deflate encoded body, other encodings are returned as is"""
+    encoding = (encoding or '').strip().lower()
+    if encoding in ('gzip', 'x-gzip'):
+        return zlib.decompress(content, 16 + zlib.MAX_WBITS)
+    if encoding == 'deflate':
+        try:
+            return zlib.decompress(content)
+        except zlib.error:
+            # some servers send raw deflate streams without the zlib header
+            return zlib.decompress(content, -zlib.MAX_WBITS)
+    return content
+
+
+class TransportResponse(object):
+
+    """
+    Status code, headers and body bytes of an HTTP response.
+    A compressed body (Content-Encoding gzip or deflate) is decompressed,
+    wire_size is the number of body bytes received before decompression.
+    """
+
+    def __init__(self, status_code, content, headers=None):
+        self.status_code = int(status_code)
+        self.headers = dict(headers or {})
+        self.wire_size = len(content)
+        encoding = [v for k, v in self.headers.items() if k.lower() == 'content-encoding']
+        try:
+            self.content = decode_content(content, encoding[0] if encoding else None)
+        except zlib.error as err:
+            raise TransportException('Could not decompress response body: %s' % err)
+
+    def __repr__(self):
+        return '<TransportResponse [%s] %s bytes (%s on the wire)>' % \
+               (self.status_code, len(self.content), self.wire_size)
+
+
+def _failure(err, sent=True):
+    """
+    TransportException for err.  sent is False if the request never
+    reached the server (e.g. the connection was refused), so it is safe to
+    send again even if it changes state.
+    """
+    error = TransportException('%s: %s' % (type(err).__name__, err))
+    error.sent = sent
+    return error
+
+
+class Transport(object):
+
+    """
+    Base Transport.  Subclasses implement send().
+    """
+
+    def send(self, url, timeout=None, headers=None):
+        """send a GET request for url, return a TransportResponse"""
+        raise NotImplementedError
+
+    def close(self):
+        """release any held connections"""
+        pass
+
+
+class RequestsTransport(Transport):
+
+    """
+    Transport backed by a requests.Session, so connections are pooled
+    and kept alive between requests.  The body is read undecoded so that
+    TransportResponse can report its size on the wire.
+    pool_size is the number of connections kept per host, set it to the
+    number of threads sharing the transport.
+    """
+
+    def __init__(self, session=None, pool_size=None):
+        import requests
+        import urllib3
+        self._exceptions = (requests.exceptions.RequestException,
+                            urllib3.exceptions.HTTPError, socket.error)
+        # the connection was never made, so nothing was sent
+        self._connect_errors = (requests.exceptions.ConnectTimeout,
+                                urllib3.exceptions.NewConnectionError)
+        self.session = session if session is not None else requests.Session()
+        if pool_size:
+            adapter = requests.adapters.HTTPAdapter(pool_maxsize=int(pool_size))
+            self.session.mount('http://', adapter)
+            self.session.mount('https://', adapter)
+
+    def send(self, url, timeout=None, headers=None):
+        try:
+            response = self.session.get(url, timeout=timeout, headers=headers, stream=True)
+            try:
+                content = response.raw.read(decode_content=False)
+            finally:
+                response.raw.release_conn()
+        except self._exceptions as err:
+            raise _failure(err, not self._connect_failed(err))
+        return TransportResponse(response.status_code, content, response.headers)
+
+    def _connect_failed(self, err):
+        # requests wraps urllib3's error in a MaxRetryError, itself in its own
+        reason = getattr(err.args[0], 'reason', None) if err.args else None
+        return isinstance(err, self._connect_errors) or isinstance(reason, self._connect_errors)
+
+    def close(self):
+        self.session.close()
+
+
+class UrllibTransport(Transport):
+
+    """
+    Transport using only the standard library.
+    """
+
+    def send(self, url, timeout=None, headers=None):
+        request = Request(url, headers=headers or {})
+        kwargs = {'timeout': timeout} if timeout is not None else {}
+        try:
+            response = urlopen(request, **kwargs)
+        except HTTPError as err:
+            # Amazon sends an XML error body with non-200 responses
+            return TransportResponse(err.code, err.read(), err.headers)
+        except URLError as err:
+            # urlopen only wraps errors of connecting and sending the request
+            raise _failure(err, sent=False)
+        except socket.error as err:
+            raise _failure(err)
+        try:
+            return TransportResponse(response.getcode(), response.read(), response.info())
+        finally:
+            response.close()
+
+
+class MemoryTransport(Transport):
+
+    """
+    In-memory Transport, for tests and benchmarks.
+    handler is called as handler(url, timeout, headers) and must return
+    a TransportResponse or a (status_code, content) tuple.
+    Every sent URL is recorded in self.requests.
+    """
+
+    def __init__(self, handler):
+        self.handler = handler
+        self.requests = []
+
+    def send(self, url, timeout=None, headers=None):
+        self.requests.append(url)
+        response = self.handler(url, timeout, headers)
+        if not isinstance(response, TransportResponse):
+            response = TransportResponse(*response)
+        return response
+
+
+__all__ = ['ACCEPT_ENCODING', 'decode_content', 'Transport', 'TransportResponse',
+           'RequestsTransport', 'UrllibTransport', 'MemoryTransport']
@@ -0,0 +1,147 @@
+#!/usr/bin/env
+# -*- coding: utf-8 -*-
+"""
+In-memory stand-in for the Product Advertising API, used as a
+MemoryTransport handler: FakeAmazon()(url, timeout, headers) -> (status, xml)
+"""
+import re
+import threading
+
+try:
+    from urllib.parse import urlparse, parse_qs
+except ImportError:
+    from urlparse import urlparse, parse_qs
+
+PRICE = 1999
+
+
+def _item_xml(asin, price=PRICE, attributes=''):
+    return ('<Item><ASIN>%s</ASIN><SalesRank>100</SalesRank>'
+            '<ItemAttributes><Title>Item %s</Title>%s</ItemAttributes>'
+            '<OfferSummary><LowestNewPrice><Amount>%s</Amount></LowestNewPrice>'
+            '</OfferSummary></Item>' % (asin, asin, attributes, price))
+
+
+class FakeAmazon(object):
+
+    def __init__(self):
+        self.carts = {}
+        self.prices = {}
+        self.invalid = set()
+        self.inaccessible = set()
+        self.no_match = set()
+        self.throttle = 0
+        self.calls = []
+        self.params = []
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, url, timeout, headers):
+        params = dict((k, v[0]) for k, v in parse_qs(urlparse(url).query).items())
+        operation = params['Operation']
+        with self._lock:
+            if self.throttle:
+                self.throttle -= 1
+                self.calls.append('throttled')
+                return 503, ('<%sErrorResponse><Error><Code>RequestThrottled</Code><Message>'
+                             'Request rate too high</Message></Error></%sErrorResponse>' %
+                             (operation, operation)).encode('utf-8')
+            self.calls.append(operation)
+            self.params.append(params)
+            body = getattr(self, operation)(params)
+        return 200, ('<?xml version="1.0" ?><%sResponse>%s</%sResponse>' %
+                     (operation, body, operation)).encode('utf-8')
+
+    def _new_id(self, prefix):
+        self._next_id += 1
+        return '%s%s' % (prefix, self._next_id)
+
+    def _items(self, params, key):
+        items = {}
+        for name, value in params.items():
+            match = re.match(r'Item\.(\d+)\.(\w+)', name)
+            if match:
+                items.setdefault(int(match.group(1)), {})[match.group(2)] = value
+        return [(items[i][key], int(items[i].get('Quantity', 1))) for i in sorted(items)]
+
+    def _cart_xml(self, cart_id, request, with_items=True):
+        cart = self.carts[cart_id]
+        subtotal = sum(PRICE * q for _, q in cart['items'].values())
+        items = ''.join(
+            '<CartItem><CartItemId>%s</CartItemId><ASIN>%s</ASIN><Quantity>%s</Quantity>'
+            '<Title>Item %s</Title><Price><Amount>%s</Amount></Price></CartItem>' %
+            (cid, asin, q, asin, PRICE) for cid, (asin, q) in cart['items'].items())
+        items = '<CartItems>%s</CartItems>' % items if with_items and cart['items'] else ''
+        return ('<Cart><Request><IsValid>True</IsValid>%s</Request><CartId>%s</CartId>'
+                '<HMAC>%s</HMAC><URLEncodedHMAC>%s</URLEncodedHMAC>'
+                '<PurchaseURL>https://amazon.example/%s</PurchaseURL>'
+                '<SubTotal><Amount>%s</Amount></SubTotal>%s</Cart>' %
+                (request, cart_id, cart['hmac'], cart['hmac'], cart_id, subtotal, items))
+
+    def _add(self, cart, items):
+        for asin, quantity in items:
+            for cid, (c_asin, c_quantity) in cart['items'].items():
+                if c_asin == asin:
+                    cart['items'][cid] = (asin, c_quantity + quantity)
+                    break
+            else:
+                cart['items'][self._new_id('C')] = (asin, quantity)
+
+    def CartCreate(self, params):
+        cart_id = self._new_id('cart')
+        self.carts[cart_id] = {'hmac': self._new_id('hmac'), 'items': {}}
+        self._add(self.carts[cart_id], self._items(params, 'ASIN'))
+        return self._cart_xml(cart_id, '<CartCreateRequest/>')
+
+    def CartAdd(self, params):
+        self._add(self.carts[params['CartId']], self._items(params, 'ASIN'))
+        return self._cart_xml(params['CartId'], '<CartAddRequest/>')
+
+    def CartModify(self, params):
+        cart = self.carts[params['CartId']]
+        mods = self._items(params, 'CartItemId')
+        for cid, quantity in mods:
+            if quantity == 0:
+                cart['items'].pop(cid, None)
+            elif cid in cart['items']:
+                cart['items'][cid] = (cart['items'][cid][0], quantity)
+        request = ''.join('<Item><CartItemId>%s</CartItemId><Quantity>%s</Quantity></Item>' % m
+                          for m in mods)
+        return self._cart_xml(params['CartId'],
+                              '<CartModifyRequest><Items>%s</Items></CartModifyRequest>' % request)
+
+    def CartClear(self, params):
+        self.carts[params['CartId']]['items'] = {}
+        return self._cart_xml(params['CartId'], '<CartClearRequest/>', with_items=False)
+
+    def CartGet(self, params):
+        return self._cart_xml(params['CartId'], '<CartGetRequest/>')
+
+    def ItemLookup(self, params):
+        id_type = params.get('ItemIdType', 'ASIN')
+        errors = ''
+        if id_type == 'ASIN':
+            asins = params['ItemId'].split(',')
+            items = ''.join(_item_xml(asin, self.prices.get(asin, PRICE)) for asin in asins
+                            if asin not in self.invalid | self.inaccessible | self.no_match)
+            errors = ''.join(
+                '<Error><Code>AWS.InvalidParameterValue</Code><Message>%s is not a valid value '
+                'for ItemId.</Message></Error>' % asin for asin in asins if asin in self.invalid)
+            errors += ''.join(
+                '<Error><Code>AWS.ECommerceService.ItemNotAccessible</Code><Message>This item '
+                'is not accessible.</Message></Error>' for a in asins if a in self.inaccessible)
+            errors += ''.join(
+                '<Error><Code>AWS.ECommerceService.NoExactMatches</Code><Message>We did not '
+                'find any matches.</Message></Error>' for a in asins if a in self.no_match)
+            errors = '<Errors>%s</Errors>' % errors if errors else ''
+        else:
+            tag = 'UPC' if id_type == 'UPC' else 'EAN'
+            items = ''.join(_item_xml('B' + code[-9:], attributes='<%sList><%sListElement>%s'
+                                      '</%sListElement></%sList>' % (tag, tag, code, tag, tag))
+                            for code in params['ItemId'].split(',') if code not in self.no_match)
+            errors = ''.join(
+                '<Error><Code>AWS.InvalidParameterValue</Code><Message>%s is not a valid value '
+                'for ItemId.</Message></Error>' % code for code in params['ItemId'].split(',')
+                if code in self.no_match)
+            errors = '<Errors>%s</Errors>' % errors if errors else ''
+        return ('<Items><Request><IsValid>True</IsValid>%s</Request>%s</Items>' % (errors, items))
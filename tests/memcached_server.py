@@ -0,0 +1,105 @@
+#!/usr/bin/env
+# -*- coding: utf-8 -*-
+"""
+Minimal memcached stand-in for tests: get, gets, set, add, cas and delete
+of the text protocol, held in memory.  MemcachedServer().start() serves on
+a free local port.
+"""
+import itertools
+import threading
+import time
+
+try:
+    from SocketServer import StreamRequestHandler, ThreadingTCPServer
+except ImportError:
+    from socketserver import StreamRequestHandler, ThreadingTCPServer
+
+
+class _Handler(StreamRequestHandler):
+
+    def handle(self):
+        store = self.server.store
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            parts = line.split()
+            command = parts[0].decode('utf-8') if parts else ''
+            with store.lock:
+                store.commands.append(command)
+            if command in ('get', 'gets'):
+                out = []
+                for key in parts[1:]:
+                    entry = store.live(key)
+                    if entry is not None:
+                        head = b'VALUE ' + key + b' 0 ' + str(len(entry[2])).encode('utf-8')
+                        if command == 'gets':
+                            head += b' ' + str(entry[1]).encode('utf-8')
+                        out.append(head + b'\r\n' + entry[2] + b'\r\n')
+                self.wfile.write(b''.join(out) + b'END\r\n')
+            elif command in ('set', 'add', 'cas'):
+                key, ttl, length = parts[1], int(parts[3]), int(parts[4])
+                data = self.rfile.read(length + 2)[:-2]
+                self.wfile.write(store.store(command, key, data, ttl, parts[5:]) + b'\r\n')
+            elif command == 'delete':
+                with store.lock:
+                    found = store.entries.pop(parts[1], None) is not None
+                self.wfile.write(b'DELETED\r\n' if found else b'NOT_FOUND\r\n')
+            else:
+                self.wfile.write(b'ERROR\r\n')
+
+
+class _Store(object):
+
+    def __init__(self):
+        self.entries = {}
+        self.commands = []
+        self.tokens = itertools.count(1)
+        self.lock = threading.Lock()
+
+    def live(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] and entry[0] <= time.time():
+                del self.entries[key]
+                return None
+            return entry
+
+    def store(self, command, key, data, ttl, extra):
+        entry = self.live(key)
+        with self.lock:
+            if command == 'add' and entry is not None:
+                return b'NOT_STORED'
+            if command == 'cas':
+                if entry is None:
+                    return b'NOT_FOUND'
+                if entry[1] != int(extra[0]):
+                    return b'EXISTS'
+            # like memcached, an exptime over 30 days is a unix timestamp
+            expires = ttl if ttl > 30 * 24 * 3600 else time.time() + ttl if ttl else 0
+            self.entries[key] = (expires, next(self.tokens), data)
+        return b'STORED'
+
+
+class MemcachedServer(ThreadingTCPServer):
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        ThreadingTCPServer.__init__(self, ('127.0.0.1', 0), _Handler)
+        self.store = _Store()
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def start(self):
+        thread = threading.Thread(target=self.serve_forever)
+        thread.daemon = True
+        thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
@@ -0,0 +1,146 @@
+#!/usr/bin/env
+# -*- coding: utf-8 -*-
+import json
+import sys
+import os.path
+sys.path.append(os.path.dirname(os.path.realpath(__file__)) + "/../")
+
+from paapy.api import AmazonCart, CartItems
+from paapy.transport import MemoryTransport
+
+from fake_amazon import FakeAmazon
+
+TEST_ASIN = 'B00JM5GW10'
+TEST_ASIN_2 = 'B00WI0QCAM'
+TEST_ASIN_3 = 'B018HB2QFU'
+
+
+def make_cart(**kwargs):
+    fake = FakeAmazon()
+    cart = AmazonCart('tag', 'key', 'secret', transport=MemoryTransport(fake), **kwargs)
+    return fake, cart
+
+
+def quantities(cart):
+    return {item['ASIN']: item['Quantity'] for item in cart.items}
+
+
+class TestAmazonCartSync:
+
+    def test_sync_creates_cart_in_one_call(self):
+        fake, cart = make_cart()
+        cart.sync({TEST_ASIN: 1, TEST_ASIN_2: 3, TEST_ASIN_3: 0})
+        assert fake.calls == ['CartCreate']
+        assert quantities(cart) == {TEST_ASIN: 1, TEST_ASIN_2: 3}
+
+    def test_sync_modifies_and_adds(self):
+        fake, cart = make_cart(ItemId=[TEST_ASIN, TEST_ASIN_2], Quantity=1)
+        cart.sync({TEST_ASIN: 4, TEST_ASIN_3: 2})
+        assert fake.calls == ['CartCreate', 'CartModify', 'CartAdd']
+        assert quantities(cart) == {TEST_ASIN: 4, TEST_ASIN_3: 2}
+
+    def test_sync_no_changes_makes_no_calls(self):
+        fake, cart = make_cart(ItemId=TEST_ASIN, Quantity=2)
+        cart.sync({TEST_ASIN: 2})
+        assert fake.calls == ['CartCreate']
+
+    def test_sync_clears_when_everything_removed(self):
+        fake, cart = make_cart(ItemId=[TEST_ASIN, TEST_ASIN_2], Quantity=1)
+        cart.sync({TEST_ASIN_3: 1})
+        assert fake.calls == ['CartCreate', 'CartClear', 'CartAdd']
+        assert quantities(cart) == {TEST_ASIN_3: 1}
+
+    def test_stage_and_flush(self):
+        fake, cart = make_cart(ItemId=[TEST_ASIN, TEST_ASIN_2], Quantity=1)
+        cart.stage(TEST_ASIN, 0).stage([TEST_ASIN_2, TEST_ASIN_3], 5)
+        assert fake.calls == ['CartCreate']
+        cart.flush()
+        assert fake.calls == ['CartCreate', 'CartModify', 'CartAdd']
+        assert quantities(cart) == {TEST_ASIN_2: 5, TEST_ASIN_3: 5}
+        assert len(cart.pending) == 0
+
+
+class TestCartItems:
+
+    def test_indexes_and_subtotal(self):
+        items = CartItems([
+            {'ASIN': TEST_ASIN, 'CartItemId': 'C1', 'Title': 'a', 'Quantity': 2, 'Price': 19.99},
+            {'ASIN': TEST_ASIN_2, 'CartItemId': 'C2', 'Title': 'b', 'Quantity': 1, 'Price': 5.0},
+        ])
+        assert len(items) == 2 and items[1]['CartItemId'] == 'C2'
+        assert items.by_asin(TEST_ASIN)['CartItemId'] == 'C1'
+        assert items.get('C2')['ASIN'] == TEST_ASIN_2 and TEST_ASIN_2 in items
+        assert items.subtotal == 44.98
+        items.set_quantity('C1', 1)
+        assert items.subtotal == 24.99
+        items.set_quantity('C2', 0)
+        assert len(items) == 1 and items.by_asin(TEST_ASIN_2) is None
+        assert items.subtotal == 19.99
+        items.clear()
+        assert len(items) == 0 and items.subtotal == 0
+
+    def test_batch_removal(self):
+        items = CartItems([{'ASIN': 'B%09d' % i, 'CartItemId': 'C%s' % i, 'Quantity': 1,
+                            'Price': 1.0} for i in range(5000)])
+        changed = items.set_quantities([('C%s' % i, 0 if i % 2 else 2) for i in range(5000)])
+        assert len(changed) == 5000 and len(items) == 2500
+        assert [item['CartItemId'] for item in items[:3]] == ['C0', 'C2', 'C4']
+        assert items.subtotal == 5000.0 and items.by_asin('B000000001') is None
+        assert [item['CartItemId'] for item in items.discard_many(['C0', 'C1', 'C4'])] == \
+            ['C0', 'C4']
+        assert items[0]['CartItemId'] == 'C2' and len(items) == 2498
+
+    def test_still_a_list(self):
+        fake, cart = make_cart(ItemId=TEST_ASIN, Quantity=1)
+        assert cart.items == [cart.items.by_asin(TEST_ASIN)]
+        assert json.loads(json.dumps(cart.items))[0]['ASIN'] == TEST_ASIN
+        cart.clear()
+        assert cart.items == []
+
+    def test_cart_operations_keep_index_current(self):
+        fake, cart = make_cart(ItemId=[TEST_ASIN, TEST_ASIN_2], Quantity=1)
+        cart.add(ItemId=TEST_ASIN, Quantity=2)
+        cart.remove(TEST_ASIN_2)
+        assert quantities(cart) == {TEST_ASIN: 3}
+        assert cart.items.by_asin(TEST_ASIN)['Price'] == 19.99
+        assert cart.items.subtotal == cart.subtotal == 59.97
+
+
+class TestCartSerialization:
+
+    def test_round_trip_without_api_calls(self):
+        fake, cart = make_cart(ItemId=[TEST_ASIN, TEST_ASIN_2], Quantity=[1, 2])
+        saved = cart.dumps()
+        restored = AmazonCart.from_dict(saved, 'tag', 'key', 'secret',
+                                        transport=MemoryTransport(fake))
+        assert fake.calls == ['CartCreate']
+        assert restored.to_dict() == cart.to_dict()
+        assert restored.items.by_asin(TEST_ASIN_2)['Quantity'] == 2
+        restored.add(ItemId=TEST_ASIN_3)
+        assert quantities(restored) == {TEST_ASIN: 1, TEST_ASIN_2: 2, TEST_ASIN_3: 1}
+
+    def test_rehydrate_with_lazy_verify(self):
+        fake = FakeAmazon()
+        transport = MemoryTransport(fake)
+        carts = [AmazonCart('tag', 'key', 'secret', ItemId=asin, transport=transport)
+                 for asin in (TEST_ASIN, TEST_ASIN_2)]
+        states = [cart.to_dict() for cart in carts]
+        fake.carts[carts[0].cart_id]['items']['C99'] = (TEST_ASIN_3, 4)
+        restored = AmazonCart.rehydrate(states, 'tag', 'key', 'secret',
+                                        transport=transport, verify='lazy')
+        assert fake.calls == ['CartCreate', 'CartCreate']
+        restored[0].stage(TEST_ASIN, 2).flush()
+        assert fake.calls == ['CartCreate', 'CartCreate', 'CartGet', 'CartModify']
+        assert quantities(restored[0]) == {TEST_ASIN: 2, TEST_ASIN_3: 4}
+        assert restored[1].verify_pending
+
+    def test_rehydrated_carts_share_limiter_and_signer(self):
+        fake, cart = make_cart(ItemId=TEST_ASIN)
+        states = [cart.to_dict(), cart.to_dict()]
+        restored = AmazonCart.rehydrate(states, 'tag', 'key', 'secret',
+                                        transport=MemoryTransport(fake), qps=5)
+        assert restored[0].limiter is not None
+        assert restored[0].limiter is restored[1].limiter
+        assert restored[0].signer is restored[1].signer
+        restored[0].add(ItemId=TEST_ASIN_2)
+        assert fake.calls == ['CartCreate', 'CartAdd']
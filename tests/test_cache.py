@@ -0,0 +1,111 @@
+#!/usr/bin/env
+# -*- coding: utf-8 -*-
+import time
+import pytest
+import sys
+import os.path
+sys.path.append(os.path.dirname(os.path.realpath(__file__)) + "/../")
+
+from paapy.api import Amazon
+from paapy.cache import CacheBackend, MemcachedCache, MemoryCache, claim
+from paapy.exceptions import CacheException
+from paapy.transport import MemoryTransport
+
+from fake_amazon import FakeAmazon
+from memcached_server import MemcachedServer
+
+ASINS = ['B%09d' % i for i in range(12)]
+
+
+@pytest.fixture(scope='module')
+def server():
+    server = MemcachedServer().start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture(params=['memory', 'memcached'])
+def backend(request, server):
+    if request.param == 'memory':
+        yield MemoryCache()
+    else:
+        cache = MemcachedCache(port=server.port, prefix='test%s:' % time.time())
+        yield cache
+        cache.close()
+
+
+class TestCacheBackends:
+
+    def test_bulk_get_and_set(self, backend):
+        backend.set_many({'a': {'ASIN': 'B1'}, 'b': [1, 2], u'k\xe9y with spaces': 'x'})
+        assert backend.get_many(['a', 'b', 'missing', u'k\xe9y with spaces']) == \
+            {'a': {'ASIN': 'B1'}, 'b': [1, 2], u'k\xe9y with spaces': 'x'}
+        backend.delete('a')
+        assert backend.get('a') is None
+
+    def test_ttl(self, backend):
+        backend.set('short', 1, ttl=1)
+        assert backend.get('short') == 1
+        if isinstance(backend, MemoryCache):
+            backend.clock = lambda: time.time() + 2
+        else:
+            time.sleep(1.1)
+        assert backend.get('short') is None
+
+    def test_add_and_cas(self, backend):
+        assert backend.add('owner', 'one')
+        assert not backend.add('owner', 'two')
+        value, token = backend.gets('owner')
+        assert value == 'one'
+        assert backend.cas('owner', 'two', token)
+        assert not backend.cas('owner', 'three', token)
+        assert backend.get('owner') == 'two'
+        assert backend.gets('nobody') == (None, None)
+
+    def test_ttl_over_thirty_days(self, backend):
+        backend.set('long', 1, ttl=40 * 24 * 3600)
+        assert backend.get('long') == 1
+
+    def test_claim(self, backend):
+        assert claim(backend, 'B1', 'worker-1', 60)
+        assert not claim(backend, 'B1', 'worker-2', 60)
+        assert claim(backend, 'B1', 'worker-1', 60)
+
+    def test_abstract_base(self):
+        with pytest.raises(TypeError):
+            CacheBackend()
+
+
+def test_corrupt_value_is_a_miss(server):
+    cache = MemcachedCache(port=server.port, prefix='corrupt%s:' % time.time())
+    cache.set_many({'good': 1, 'bad': 2})
+    expires, token, _ = server.store.entries[cache._key('bad')]
+    server.store.entries[cache._key('bad')] = (expires, token, b'{not json')
+    assert cache.get_many(['good', 'bad']) == {'good': 1}
+    assert cache.gets('bad') == (None, None)
+    cache.close()
+
+
+class TestSharedLookupCache:
+
+    def test_clients_share_warm_cache(self, server):
+        cache = MemcachedCache(port=server.port, prefix='shared%s:' % time.time())
+        fake = FakeAmazon()
+        first = Amazon('tag', 'key', 'secret', transport=MemoryTransport(fake), cache=cache)
+        second = Amazon('tag', 'key', 'secret', transport=MemoryTransport(fake), cache=cache)
+        assert len(first.lookup(ASINS[:10])) == 10
+        items = second.lookup(list(reversed(ASINS)))
+        assert [item['ASIN'] for item in items] == list(reversed(ASINS))
+        # only the two items the first client didn't fetch are looked up
+        assert fake.params[-1]['ItemId'] == ','.join(reversed(ASINS[10:]))
+        assert len(fake.calls) == 2
+        second.lookup(ASINS[0], ResponseGroup='SalesRank')
+        assert len(fake.calls) == 3
+
+    def test_cache_failure_is_a_miss(self):
+        fake = FakeAmazon()
+        amazon = Amazon('tag', 'key', 'secret', transport=MemoryTransport(fake),
+                        cache=MemcachedCache(port=1, timeout=0.1))
+        with pytest.raises(CacheException):
+            amazon.cache.get('a')
+        assert len(amazon.lookup(ASINS[:2])) == 2
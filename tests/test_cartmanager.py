@@ -0,0 +1,118 @@
+#!/usr/bin/env
+# -*- coding: utf-8 -*-
+import pytest
+import threading
+import time
+import sys
+import os.path
+sys.path.append(os.path.dirname(os.path.realpath(__file__)) + "/../")
+
+from concurrent.futures import CancelledError
+
+from paapy.cartmanager import CartManager
+from paapy.transport import MemoryTransport
+
+from fake_amazon import FakeAmazon
+
+TEST_ASIN = 'B00JM5GW10'
+TEST_ASIN_2 = 'B00WI0QCAM'
+TEST_ASIN_3 = 'B018HB2QFU'
+
+
+class SlowFake(FakeAmazon):
+
+    def __init__(self):
+        super(SlowFake, self).__init__()
+        self.active = 0
+        self.max_active = 0
+
+    def __call__(self, url, timeout, headers):
+        with self._lock:
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        time.sleep(0.02)
+        try:
+            return super(SlowFake, self).__call__(url, timeout, headers)
+        finally:
+            with self._lock:
+                self.active -= 1
+
+
+class BlockingFake(FakeAmazon):
+
+    def __init__(self):
+        super(BlockingFake, self).__init__()
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def __call__(self, url, timeout, headers):
+        self.started.set()
+        self.release.wait(5)
+        return super(BlockingFake, self).__call__(url, timeout, headers)
+
+
+def quantities(cart):
+    return {item['ASIN']: item['Quantity'] for item in cart.items}
+
+
+class TestCartManager:
+
+    def test_operations_on_one_cart_run_in_order(self):
+        fake = SlowFake()
+        with CartManager('tag', 'key', 'secret', max_workers=4,
+                         transport=MemoryTransport(fake)) as manager:
+            cart = manager.cart()
+            futures = [manager.submit(cart, 'create', ItemId=TEST_ASIN, Quantity=1),
+                       manager.add(cart, ItemId=TEST_ASIN_2, Quantity=2),
+                       manager.add(cart, ItemId=TEST_ASIN, Quantity=1),
+                       manager.remove(cart, TEST_ASIN_2)]
+            assert [f.result() for f in futures] == [cart] * 4
+        assert fake.max_active == 1
+        assert fake.calls == ['CartCreate', 'CartAdd', 'CartModify', 'CartModify']
+        assert quantities(cart) == {TEST_ASIN: 2}
+
+    def test_carts_run_concurrently_with_shared_limiter(self):
+        fake = SlowFake()
+        manager = CartManager('tag', 'key', 'secret', max_workers=4, qps=1000,
+                              transport=MemoryTransport(fake))
+        futures = [manager.create(ItemId=TEST_ASIN_3, Quantity=i) for i in range(1, 9)]
+        carts = [f.result() for f in futures]
+        manager.shutdown()
+        assert fake.max_active > 1
+        assert len(set(cart.cart_id for cart in carts)) == 8
+        assert all(cart.limiter is manager.limiter for cart in carts)
+        assert sorted(quantities(c)[TEST_ASIN_3] for c in carts) == list(range(1, 9))
+
+    def test_errors_set_on_future(self):
+        manager = CartManager('tag', 'key', 'secret', transport=MemoryTransport(FakeAmazon()))
+        future = manager.add(manager.cart(), ItemId='ABC123')
+        assert isinstance(future.exception(), ValueError)
+        manager.shutdown()
+
+    def test_shutdown_without_wait_skips_queued_operations(self):
+        fake = BlockingFake()
+        manager = CartManager('tag', 'key', 'secret', max_workers=1,
+                              transport=MemoryTransport(fake))
+        cart = manager.cart()
+        futures = [manager.submit(cart, 'create', ItemId=TEST_ASIN, Quantity=1),
+                   manager.add(cart, ItemId=TEST_ASIN_2),
+                   manager.create(ItemId=TEST_ASIN_3)]
+        assert fake.started.wait(5)
+        manager.shutdown(wait=False)
+        fake.release.set()
+        assert futures[0].result(5) is cart
+        for future in futures[1:]:
+            with pytest.raises(CancelledError):
+                future.result(5)
+        assert fake.calls == ['CartCreate']
+
+    def test_shutdown_closes_own_transport(self):
+        closed = []
+        manager = CartManager('tag', 'key', 'secret')
+        manager.transport.close = lambda: closed.append(True)
+        manager.shutdown(wait=False)
+        assert closed == [True]
+        shared = CartManager('tag', 'key', 'secret', transport=MemoryTransport(FakeAmazon()))
+        shared.transport.close = lambda: closed.append(False)
+        shared.shutdown()
+        assert closed == [True]
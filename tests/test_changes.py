@@ -0,0 +1,48 @@
+#!/usr/bin/env
+# -*- coding: utf-8 -*-
+import sys
+import os.path
+sys.path.append(os.path.dirname(os.path.realpath(__file__)) + "/../")
+
+from paapy.api import Amazon
+from paapy.changes import ChangeDetector, Delta
+from paapy.transport import MemoryTransport
+
+from fake_amazon import FakeAmazon
+
+TEST_ASIN = 'B00JM5GW10'
+TEST_ASIN_2 = 'B00WI0QCAM'
+
+
+def item(asin, price, rank='10'):
+    return {'ASIN': asin, 'SalesRank': rank,
+            'OfferSummary': {'LowestNewPrice': {'Amount': price}}}
+
+
+class TestChangeDetector:
+
+    def test_compare_emits_only_changes(self):
+        detector = ChangeDetector(fields=['LowestNewPrice', 'SalesRank'])
+        first = list(detector.compare([item(TEST_ASIN, '100'), item(TEST_ASIN_2, '200')]))
+        assert first == [Delta(TEST_ASIN, {'LowestNewPrice': (None, 100), 'SalesRank': (None, 10)}),
+                         Delta(TEST_ASIN_2, {'LowestNewPrice': (None, 200), 'SalesRank': (None, 10)})]
+        second = list(detector.compare([item(TEST_ASIN, '100'), item(TEST_ASIN_2, '150')]))
+        assert second == [Delta(TEST_ASIN_2, {'LowestNewPrice': (200, 150)})]
+        assert detector.store[TEST_ASIN_2] == (150, 10)
+
+    def test_emit_new_disabled(self):
+        detector = ChangeDetector(fields=['LowestNewPrice'], emit_new=False)
+        assert list(detector.compare([item(TEST_ASIN, '100')])) == []
+        assert list(detector.compare([item(TEST_ASIN, '90')])) == \
+            [Delta(TEST_ASIN, {'LowestNewPrice': (100, 90)})]
+
+    def test_poll(self):
+        fake = FakeAmazon()
+        amazon = Amazon('tag', 'key', 'secret', transport=MemoryTransport(fake))
+        detector = ChangeDetector(amazon, emit_new=False)
+        asins = [TEST_ASIN, TEST_ASIN_2] * 6
+        assert list(detector.poll(asins)) == []
+        fake.prices[TEST_ASIN_2] = 1500
+        deltas = list(detector.poll(asins))
+        assert deltas == [Delta(TEST_ASIN_2, {'LowestNewPrice': (1999, 1500)})]
+        assert fake.calls == ['ItemLookup'] * 4
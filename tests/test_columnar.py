@@ -0,0 +1,62 @@
+#!/usr/bin/env
+# -*- coding: utf-8 -*-
+import pytest
+import sys
+import os.path
+sys.path.append(os.path.dirname(os.path.realpath(__file__)) + "/../")
+
+from paapy.api import Amazon
+from paapy.columnar import ColumnBuilder
+from paapy.transport import MemoryTransport
+
+from fake_amazon import FakeAmazon
+
+ITEMS = [
+    {'ASIN': 'B00JM5GW10', 'SalesRank': '12',
+     'OfferSummary': {'LowestNewPrice': {'Amount': '1999'}, 'TotalNew': '3'}},
+    {'ASIN': 'B00WI0QCAM', 'OfferSummary': {'LowestUsedPrice': {'Amount': '500'}}},
+]
+
+
+class TestColumnBuilder:
+
+    def test_typed_columns_and_validity(self):
+        builder = ColumnBuilder(['ASIN', 'LowestNewPrice', 'SalesRank']).extend(ITEMS)
+        assert len(builder) == 2
+        assert builder.values['ASIN'] == ['B00JM5GW10', 'B00WI0QCAM']
+        assert list(builder.values['LowestNewPrice']) == [1999, 0]
+        assert list(builder.valid['LowestNewPrice']) == [1, 0]
+        assert builder.values['SalesRank'].itemsize == 8
+
+    def test_unknown_column(self):
+        with pytest.raises(ValueError):
+            ColumnBuilder(['Colour'])
+
+    def test_to_numpy(self):
+        numpy = pytest.importorskip('numpy')
+        columns = ColumnBuilder().extend(ITEMS).to_numpy()
+        assert columns['LowestNewPrice'].dtype == numpy.int64
+        assert columns['LowestNewPrice'].tolist() == [1999, None]
+        assert columns['LowestUsedPrice'].tolist() == [None, 500]
+
+    def test_builder_grows_after_to_numpy(self):
+        pytest.importorskip('numpy')
+        builder = ColumnBuilder().extend(ITEMS)
+        columns = builder.to_numpy()
+        builder.extend(ITEMS)
+        assert len(columns['LowestNewPrice']) == 2 and len(builder) == 4
+
+    def test_to_arrow(self):
+        pytest.importorskip('pyarrow')
+        table = ColumnBuilder(['ASIN', 'TotalNew']).extend(ITEMS).to_arrow()
+        assert table.column_names == ['ASIN', 'TotalNew']
+        assert table.to_pydict()['TotalNew'] == [3, None]
+
+    def test_lookup_columns(self):
+        fake = FakeAmazon()
+        amazon = Amazon('tag', 'key', 'secret', transport=MemoryTransport(fake))
+        asins = ['B%09d' % i for i in range(25)]
+        builder = amazon.lookup_columns(asins, columns=['ASIN', 'LowestNewPrice'])
+        assert builder.values['ASIN'] == asins
+        assert set(builder.values['LowestNewPrice']) == set([1999])
+        assert fake.calls == ['ItemLookup'] * 3
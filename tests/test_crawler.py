@@ -0,0 +1,137 @@
+#!/usr/bin/env
+# -*- coding: utf-8 -*-
+import pytest
+import sys
+import os.path
+sys.path.append(os.path.dirname(os.path.realpath(__file__)) + "/../")
+
+from paapy.api import Amazon
+from paapy.crawler import Partition, SearchCrawler
+from paapy.exceptions import AmazonException
+from paapy.standin import StandInAmazon
+from paapy.transport import MemoryTransport
+
+
+class Unpriced(StandInAmazon):
+
+    """every fifth item has no price, so no price range matches it"""
+
+    def __init__(self, **kwargs):
+        super(Unpriced, self).__init__(**kwargs)
+        self.unpriced = set(list(self.catalog)[::5])
+
+    def _search(self, params):
+        matches = super(Unpriced, self)._search(params)
+        if 'MinimumPrice' in params or 'MaximumPrice' in params:
+            matches = [item for item in matches if item.asin not in self.unpriced]
+        return matches
+
+
+@pytest.fixture
+def fake():
+    return StandInAmazon(items=2000)
+
+
+def client(fake):
+    return Amazon('tag', 'key', 'secret', transport=MemoryTransport(fake))
+
+
+class TestSearchCrawler:
+
+    def test_crawls_past_page_cap(self):
+        fake = StandInAmazon(items=5000)
+        crawler = SearchCrawler(client(fake), max_workers=4)
+        asins = [item['ASIN'] for item in crawler.crawl(SearchIndex='Books', BrowseNode='1000')]
+        expected = [item.asin for item in fake.catalog.values() if item.node == '1000']
+        assert len(expected) > 7 * 100  # so the child BrowseNodes need price splits too
+        assert len(asins) == len(set(asins))
+        assert set(asins) == set(expected)
+        assert crawler.partitions > 7 and not crawler.truncated
+        assert fake.counts['BrowseNodeLookup'] == 1 + 7  # the root and its children
+
+    def test_price_range_split(self, fake):
+        crawler = SearchCrawler(client(fake))
+        items = list(crawler.crawl(SearchIndex='All', MinimumPrice=600, MaximumPrice=5000))
+        expected = [i.asin for i in fake.catalog.values() if 600 <= i.price <= 5000]
+        assert len(expected) > 100
+        assert sorted(item['ASIN'] for item in items) == sorted(expected)
+
+    def test_unsplittable_partition_truncated(self):
+        fake = StandInAmazon(items=200)
+        price = list(fake.catalog.values())[0].price
+        for item in fake.catalog.values():
+            item.price = price
+        crawler = SearchCrawler(client(fake))
+        items = list(crawler.crawl(SearchIndex='All', MinimumPrice=price, MaximumPrice=price))
+        assert len(items) == 100
+        assert crawler.truncated == [Partition(None, price, price)]
+
+    def test_split(self, fake):
+        crawler = SearchCrawler(client(fake), open_split=1000)
+        assert crawler.split(Partition(None, 100, None)) == [Partition(None, 100, 1100),
+                                                             Partition(None, 1101, None)]
+        assert crawler.split(Partition('1000', 0, 50)) == [
+            Partition('1000%02d' % i, 0, 50) for i in range(7)]
+        assert crawler.split(Partition('100000', 0, 50)) == [Partition('100000', 0, 25),
+                                                             Partition('100000', 26, 50)]
+
+    def test_no_matches_and_errors(self, fake):
+        crawler = SearchCrawler(client(fake))
+        assert list(crawler.crawl(SearchIndex='All', Keywords='nothing matches this')) == []
+        crawler = SearchCrawler(client(fake), max_pages=20, retry_delay=0)
+        items = list(crawler.crawl(SearchIndex='All', MinimumPrice=600, MaximumPrice=700))
+        assert items and crawler.failed
+        assert all(page > 10 and isinstance(err, AmazonException)
+                   for _, page, err in crawler.failed)
+
+    def test_failed_page_retried(self, fake):
+        fails = [2]
+
+        def flaky(url, timeout=None, headers=None):
+            if 'ItemPage=3' in url and fails[0]:
+                fails[0] -= 1
+                return 500, b'<ItemSearchErrorResponse><Error><Code>InternalError</Code>' \
+                    b'<Message>failed</Message></Error></ItemSearchErrorResponse>'
+            return fake(url, timeout, headers)
+
+        amazon = Amazon('tag', 'key', 'secret', transport=MemoryTransport(flaky), retry_count=0)
+        crawler = SearchCrawler(amazon, retry_delay=0)
+        items = list(crawler.crawl(SearchIndex='All', MinimumPrice=600, MaximumPrice=700))
+        expected = [i.asin for i in fake.catalog.values() if 600 <= i.price <= 700]
+        assert sorted(item['ASIN'] for item in items) == sorted(expected)
+        assert not crawler.failed and fails == [0]
+
+    def test_failed_part_crawled_through_parent(self):
+        fake = StandInAmazon(items=3000)
+
+        def child_fails(url, timeout=None, headers=None):
+            if 'BrowseNode=100003' in url and 'ItemPage' not in url and 'Price' not in url:
+                return 500, b'<ItemSearchErrorResponse><Error><Code>InternalError</Code>' \
+                    b'<Message>failed</Message></Error></ItemSearchErrorResponse>'
+            return fake(url, timeout, headers)
+
+        amazon = Amazon('tag', 'key', 'secret', transport=MemoryTransport(child_fails),
+                        retry_count=0)
+        crawler = SearchCrawler(amazon, retry_delay=0)
+        asins = set(item['ASIN'] for item in crawler.crawl(SearchIndex='All', BrowseNode='1000'))
+        assert [(p.BrowseNode, page) for p, page, _ in crawler.failed] == [('100003', 1)]
+        assert asins == set(i.asin for i in fake.catalog.values() if i.node == '1000')
+
+    def test_items_on_parent_node_crawled(self):
+        fake = StandInAmazon(items=3000)
+        on_parent = [item for item in fake.catalog.values() if item.node == '1000'][::10]
+        for item in on_parent:
+            item.subnode = item.node
+        crawler = SearchCrawler(client(fake))
+        asins = set(item['ASIN'] for item in crawler.crawl(SearchIndex='All', BrowseNode='1000'))
+        assert set(item.asin for item in on_parent) <= asins
+        assert asins == set(i.asin for i in fake.catalog.values() if i.node == '1000')
+
+    def test_unpriced_items_reported(self):
+        fake = Unpriced(items=2000)
+        crawler = SearchCrawler(client(fake))
+        asins = set(item['ASIN'] for item in crawler.crawl(SearchIndex='All'))
+        assert crawler.truncated == [Partition(None, None, None)]
+        assert len(asins) == len(fake.catalog) - len(fake.unpriced) + \
+            len([a for a in asins if a in fake.unpriced])
+        assert any(asin in fake.unpriced for asin in asins)
@@ -0,0 +1,80 @@
+#!/usr/bin/env
+# -*- coding: utf-8 -*-
+import time
+import pytest
+import sys
+import os.path
+sys.path.append(os.path.dirname(os.path.realpath(__file__)) + "/../")
+
+from paapy.api import Amazon
+from paapy.deadline import Deadline
+from paapy.exceptions import DeadlineExceeded
+from paapy.parsing import parse_response
+from paapy.ratelimit import RateLimiter
+from paapy.transport import MemoryTransport
+
+from fake_amazon import FakeAmazon
+
+TEST_ASINS = ['B00JM5GW%02d' % i for i in range(20)]
+
+
+class SlowFake(FakeAmazon):
+
+    def __call__(self, url, timeout, headers):
+        time.sleep(0.05)
+        return super(SlowFake, self).__call__(url, timeout, headers)
+
+
+class SlowParser(object):
+
+    def parse(self, content, operation, timeout=None):
+        time.sleep(0.05)
+        return parse_response(content, operation)
+
+
+class DeadlineTransport(MemoryTransport):
+
+    def send(self, url, timeout=None, headers=None):
+        self.sent = getattr(self, 'sent', 0) + 1
+        raise DeadlineExceeded('transport gave up')
+
+
+class TestDeadline:
+
+    def test_limiter_fails_fast(self):
+        limiter = RateLimiter(1)
+        limiter.wait()
+        start = time.time()
+        with pytest.raises(DeadlineExceeded):
+            limiter.wait(deadline=Deadline(0.1))
+        assert time.time() - start < 0.05
+        assert limiter.depth() == {'interactive': 0, 'batch': 0}
+
+    def test_no_retry_past_deadline(self):
+        fake = SlowFake()
+        fake.throttle = 3
+        amazon = Amazon('tag', 'key', 'secret', transport=MemoryTransport(fake), retry_count=3)
+        with pytest.raises(DeadlineExceeded):
+            amazon.lookup(TEST_ASINS[0], deadline=0.08)
+        assert fake.calls == ['throttled']
+
+    def test_deadline_covers_every_batch(self):
+        fake = SlowFake()
+        amazon = Amazon('tag', 'key', 'secret', transport=MemoryTransport(fake), deadline=0.07)
+        assert len(amazon.lookup(TEST_ASINS[:10])) == 10
+        with pytest.raises(DeadlineExceeded):
+            amazon.lookup(TEST_ASINS)
+        assert 'deadline' not in fake.params[0]
+
+    def test_deadline_exceeded_not_retried(self):
+        transport = DeadlineTransport(FakeAmazon())
+        amazon = Amazon('tag', 'key', 'secret', transport=transport, retry_count=3)
+        with pytest.raises(DeadlineExceeded):
+            amazon.ItemLookup(ItemId=TEST_ASINS[0], deadline=10)
+        assert transport.sent == 1
+
+    def test_parse_time_counts(self):
+        amazon = Amazon('tag', 'key', 'secret', transport=MemoryTransport(FakeAmazon()),
+                        parser=SlowParser())
+        with pytest.raises(DeadlineExceeded):
+            amazon.ItemLookup(ItemId=TEST_ASINS[0], deadline=0.03)
@@ -0,0 +1,82 @@
+#!/usr/bin/env
+# -*- coding: utf-8 -*-
+import pytest
+import sys
+import os.path
+sys.path.append(os.path.dirname(os.path.realpath(__file__)) + "/../")
+
+from paapy.api import Amazon
+from paapy.cache import ItemCache
+from paapy.fields import get_field, get_path, plan_response_groups
+from paapy.transport import MemoryTransport
+
+from fake_amazon import FakeAmazon
+
+TEST_ASIN = 'B00JM5GW10'
+TEST_ASIN_2 = 'B00WI0QCAM'
+
+ITEM = {
+    'ASIN': 'B00JM5GW10',
+    'SalesRank': '1234',
+    'OfferSummary': {'LowestNewPrice': {'Amount': '1999'}},
+    'Offers': {'TotalOffers': '2', 'Offer': [
+        {'OfferListing': {'Price': {'Amount': '2099'},
+                          'AvailabilityAttributes': {'AvailabilityType': 'now'}}},
+        {'OfferListing': {'Price': {'Amount': '2500'}}}]}
+}
+
+
+class TestFields:
+
+    def test_get_path_follows_first_list_element(self):
+        assert get_path(ITEM, ('Offers', 'Offer', 'OfferListing', 'Price', 'Amount')) == '2099'
+        assert get_path(ITEM, ('Offers', 'Missing'), 'default') == 'default'
+
+    def test_get_field_converts_type(self):
+        assert get_field(ITEM, 'LowestNewPrice') == 1999
+        assert get_field(ITEM, 'SalesRank') == 1234
+        assert get_field(ITEM, 'Availability') == 'now'
+        assert get_field(ITEM, 'LowestUsedPrice') is None
+
+    def test_unknown_field(self):
+        with pytest.raises(ValueError) as err:
+            get_field(ITEM, 'Colour')
+        assert 'Unknown field' in str(err)
+
+
+class TestResponseGroupPlanner:
+
+    def test_smallest_groups(self):
+        assert plan_response_groups(['LowestNewPrice']) == ['OfferSummary']
+        assert plan_response_groups(['ASIN']) == ['Small']
+        assert sorted(plan_response_groups(['Title', 'Brand', 'SalesRank', 'OfferPrice'])) == \
+            ['ItemAttributes', 'Offers', 'SalesRank']
+        with pytest.raises(ValueError):
+            plan_response_groups(['Colour'])
+
+    def test_lookup_fields_fetches_only_missing_groups(self):
+        fake = FakeAmazon()
+        amazon = Amazon('tag', 'key', 'secret', transport=MemoryTransport(fake))
+        items = amazon.lookup_fields([TEST_ASIN, TEST_ASIN_2], ['LowestNewPrice'])
+        assert [get_field(item, 'LowestNewPrice') for item in items] == [1999, 1999]
+        amazon.lookup_fields(TEST_ASIN, ['LowestNewPrice'])
+        items = amazon.lookup_fields([TEST_ASIN, TEST_ASIN_2], ['LowestNewPrice', 'SalesRank'])
+        assert [get_field(item, 'SalesRank') for item in items] == [100, 100]
+        assert get_field(items[0], 'LowestNewPrice') == 1999
+        assert [p['ResponseGroup'] for p in fake.params] == ['OfferSummary', 'SalesRank']
+
+    def test_stale_groups_fetched_again(self):
+        fake = FakeAmazon()
+        clock = [1000.0]
+        cache = ItemCache(ttl=60, max_items=2, clock=lambda: clock[0])
+        amazon = Amazon('tag', 'key', 'secret', transport=MemoryTransport(fake), item_cache=cache)
+        amazon.lookup_fields(TEST_ASIN, ['LowestNewPrice'])
+        clock[0] += 30
+        amazon.lookup_fields(TEST_ASIN, ['LowestNewPrice', 'SalesRank'])
+        clock[0] += 40
+        items = amazon.lookup_fields(TEST_ASIN, ['LowestNewPrice', 'SalesRank'])
+        assert get_field(items[0], 'SalesRank') == 100
+        assert [p['ResponseGroup'] for p in fake.params] == ['OfferSummary', 'SalesRank',
+                                                             'OfferSummary']
+        amazon.lookup_fields(['B000000001', 'B000000002'], ['SalesRank'])
+        assert len(cache) == 2 and TEST_ASIN not in cache
@@ -0,0 +1,125 @@
+#!/usr/bin/env
+# -*- coding: utf-8 -*-
+import threading
+import time
+import sys
+import os.path
+sys.path.append(os.path.dirname(os.path.realpath(__file__)) + "/../")
+
+from paapy.api import Amazon, AmazonCart
+from paapy.hedging import Hedger
+from paapy.ratelimit import RateLimiter
+from paapy.transport import MemoryTransport
+
+from fake_amazon import FakeAmazon
+
+TEST_ASIN = 'B00JM5GW10'
+
+
+class StallOnce(FakeAmazon):
+
+    """the first request after stall() takes 0.5 secs, the rest answer at once"""
+
+    def __init__(self):
+        super(StallOnce, self).__init__()
+        self.stalled = False
+        self.sent = 0
+
+    def __call__(self, url, timeout, headers):
+        with self._lock:
+            self.sent += 1
+            slow, self.stalled = self.stalled, False
+        if slow:
+            time.sleep(0.5)
+        return super(StallOnce, self).__call__(url, timeout, headers)
+
+
+def warm_hedger(**kwargs):
+    hedger = Hedger(min_samples=5, budget=0.5, **kwargs)
+    for _ in range(5):
+        hedger.record(0.01)
+    hedger.requests = 10
+    return hedger
+
+
+class TestHedging:
+
+    def test_slow_request_hedged(self):
+        fake = StallOnce()
+        amazon = Amazon('tag', 'key', 'secret', transport=MemoryTransport(fake),
+                        hedge=warm_hedger())
+        fake.stalled = True
+        start = time.time()
+        items = amazon.lookup(TEST_ASIN)
+        assert time.time() - start < 0.3
+        assert items[0]['ASIN'] == TEST_ASIN
+        assert fake.sent == 2
+        assert amazon.hedger.stats()['hedge_wins'] == 1
+        time.sleep(0.6)
+        # the stalled first send is recorded, not the hedge that won
+        assert len(amazon.hedger.latencies) == 6 and amazon.hedger.latencies[-1] >= 0.5
+
+    def test_budget_and_limiter_respected(self):
+        fake = StallOnce()
+        hedger = warm_hedger()
+        hedger.budget = 0
+        amazon = Amazon('tag', 'key', 'secret', transport=MemoryTransport(fake), hedge=hedger)
+        fake.stalled = True
+        amazon.lookup(TEST_ASIN)
+        assert fake.sent == 1
+
+        limiter = RateLimiter(1)
+        amazon = Amazon('tag', 'key', 'secret', transport=MemoryTransport(fake),
+                        hedge=warm_hedger(), limiter=limiter)
+        fake.stalled = True
+        amazon.lookup(TEST_ASIN)
+        assert fake.sent == 2  # the slot for a hedge was taken by the request itself
+
+    def test_carts_not_hedged(self):
+        fake = StallOnce()
+        hedger = warm_hedger()
+        fake.stalled = True
+        cart = AmazonCart('tag', 'key', 'secret', transport=MemoryTransport(fake),
+                          hedge=hedger, ItemId=TEST_ASIN)
+        assert cart.cart_id and fake.sent == 1
+        assert hedger.stats()['requests'] == 10
+
+    def test_requests_not_queued_behind_each_other(self):
+        fake = StallOnce()
+        hedger = warm_hedger(max_workers=1)
+        hedger.pct = 0  # any request still pending after 0.01 secs may be hedged
+        hedger.budget = 0
+        amazon = Amazon('tag', 'key', 'secret', transport=MemoryTransport(fake), hedge=hedger)
+        fake.stalled = True
+        stalled = threading.Thread(target=amazon.lookup, args=(TEST_ASIN,))
+        stalled.start()
+        time.sleep(0.05)
+        start = time.time()
+        hedger.budget = 1
+        amazon.lookup(TEST_ASIN)
+        assert time.time() - start < 0.3
+        stalled.join()
+
+    def test_first_sends_bounded(self):
+        fake = StallOnce()
+        hedger = warm_hedger(max_pending=1)
+        hedger.pct = 0
+        amazon = Amazon('tag', 'key', 'secret', transport=MemoryTransport(fake), hedge=hedger)
+        hedger._pending = 1  # the only primary thread is busy
+        fake.stalled = True
+        amazon.lookup(TEST_ASIN)
+        assert fake.sent == 1 and hedger.stats()['hedged'] == 0
+        hedger._pending = 0
+        fake.stalled = True
+        amazon.lookup(TEST_ASIN)
+        assert fake.sent == 3 and hedger.stats()['hedged'] == 1
+
+    def test_close_stops_hedging(self):
+        fake = StallOnce()
+        amazon = Amazon('tag', 'key', 'secret', transport=MemoryTransport(fake), hedge=True)
+        amazon.hedger.min_samples = 0
+        amazon.hedger.budget = 1
+        amazon.close()
+        fake.stalled = True
+        amazon.lookup(TEST_ASIN)
+        assert fake.sent == 1
@@ -0,0 +1,70 @@
+#!/usr/bin/env
+# -*- coding: utf-8 -*-
+import pytest
+import sys
+import os.path
+sys.path.append(os.path.dirname(os.path.realpath(__file__)) + "/../")
+
+from paapy.api import Amazon
+from paapy.idplanner import classify_id, plan_ids
+from paapy.transport import MemoryTransport
+
+from fake_amazon import FakeAmazon
+
+UPC = '036000291452'
+EAN = '4006381333931'
+ISBN_10 = '0-306-40615-2'
+ISBN_13 = '9780306406157'
+
+
+class TestIdPlanner:
+
+    def test_classify(self):
+        assert classify_id(' b00jm5gw10 ') == ('B00JM5GW10', 'ASIN')
+        assert classify_id(UPC) == (UPC, 'UPC')
+        assert classify_id(EAN) == (EAN, 'EAN')
+        assert classify_id(ISBN_10) == (ISBN_13, 'ISBN')
+        assert classify_id(ISBN_13) == (ISBN_13, 'ISBN')
+        assert classify_id('036000291453')[1] is None
+
+    def test_plan_groups_dedupes_and_packs(self):
+        asins = ['B%09d' % i for i in range(12)]
+        plan = plan_ids(asins + [UPC, ' 0360-0029-1452', EAN, 'junk', asins[0].lower()])
+        assert plan.invalid == ['junk']
+        assert plan.originals[UPC] == [UPC, ' 0360-0029-1452']
+        assert list(plan.batches()) == [('ASIN', asins[:10]), ('ASIN', asins[10:]),
+                                        ('UPC', [UPC]), ('EAN', [EAN])]
+        assert len(plan) == 4
+
+
+class TestLookupIds:
+
+    def test_item_lookup_requires_search_index(self):
+        amazon = Amazon('tag', 'key', 'secret', transport=MemoryTransport(FakeAmazon()))
+        with pytest.raises(ValueError) as err:
+            amazon.ItemLookup(UPC, ItemIdType='UPC')
+        assert 'SearchIndex' in str(err)
+
+    def test_lookup_ids_maps_results_to_inputs(self):
+        fake = FakeAmazon()
+        amazon = Amazon('tag', 'key', 'secret', transport=MemoryTransport(fake))
+        ids = ['B00JM5GW10', UPC, '0360-0029-1452', EAN, ISBN_13, ISBN_10, 'junk']
+        results = amazon.lookup_ids(ids)
+        assert list(results) == ids
+        assert results['B00JM5GW10'][0]['ASIN'] == 'B00JM5GW10'
+        assert results[UPC] == results['0360-0029-1452'] and len(results[UPC]) == 1
+        assert len(results[EAN]) == 1 and len(results[ISBN_13]) == 1
+        assert results[ISBN_10] == results[ISBN_13]
+        assert results['junk'] == []
+        assert [(p.get('ItemIdType'), p.get('SearchIndex')) for p in fake.params] == \
+            [(None, None), ('UPC', 'All'), ('EAN', 'All'), ('ISBN', 'Books')]
+        assert fake.params[-1]['ItemId'] == ISBN_13
+
+    def test_lookup_ids_unknown_code_maps_to_empty(self):
+        fake = FakeAmazon()
+        fake.no_match.add('012345678905')
+        amazon = Amazon('tag', 'key', 'secret', transport=MemoryTransport(fake))
+        results = amazon.lookup_ids([UPC, '012345678905', EAN])
+        assert results['012345678905'] == []
+        assert len(results[UPC]) == 1 and len(results[EAN]) == 1
+        assert fake.params[0]['ItemId'] == UPC + ',012345678905'
@@ -0,0 +1,46 @@
+#!/usr/bin/env
+# -*- coding: utf-8 -*-
+import json
+import subprocess
+import sys
+import os.path
+sys.path.append(os.path.dirname(os.path.realpath(__file__)) + "/../")
+
+ROOT = os.path.dirname(os.path.realpath(__file__)) + "/../"
+
+# generous, a cold "import paapy" takes a few milliseconds
+IMPORT_BUDGET = 0.25
+
+PROBE = """
+import sys, time, json
+start = time.time()
+import paapy
+from paapy.exceptions import AmazonException
+elapsed = time.time() - start
+print(json.dumps({'elapsed': elapsed, 'modules': sorted(sys.modules)}))
+"""
+
+
+def probe():
+    output = subprocess.check_output([sys.executable, '-c', PROBE], cwd=ROOT)
+    return json.loads(output.decode('utf-8').strip().splitlines()[-1])
+
+
+class TestImports:
+
+    def test_heavy_dependencies_load_lazily(self):
+        modules = probe()['modules']
+        assert 'xmltodict' not in modules
+        assert 'requests' not in modules
+        assert 'paapy.standin' not in modules and 'paapy.loadgen' not in modules
+        assert 'paapy.api' not in modules
+
+    def test_import_time(self):
+        assert min(probe()['elapsed'] for _ in range(3)) < IMPORT_BUDGET
+
+    def test_lazy_names_match_modules(self):
+        import paapy
+        from paapy import api, productadvertising
+        names = set(api.__all__) | set(productadvertising.__all__)
+        assert set(paapy._LAZY_NAMES) == names
+        assert paapy.Amazon is api.Amazon
@@ -0,0 +1,137 @@
+#!/usr/bin/env
+# -*- coding: utf-8 -*-
+import pytest
+import sys
+import os.path
+sys.path.append(os.path.dirname(os.path.realpath(__file__)) + "/../")
+
+from paapy.api import (Amazon, FOUND, INVALID, NOT_ACCESSIBLE, NOT_FOUND, THROTTLED,
+                       is_throttled)
+from paapy.cache import NegativeCache
+from paapy.exceptions import AmazonException
+from paapy.transport import MemoryTransport
+
+from fake_amazon import FakeAmazon
+
+ASINS = ['B%09d' % i for i in range(10)]
+
+
+def make_amazon(**kwargs):
+    fake = FakeAmazon()
+    return fake, Amazon('tag', 'key', 'secret', retry_count=0, transport=MemoryTransport(fake),
+                        **kwargs)
+
+
+def statuses(results):
+    return dict((item_id, result.status) for item_id, result in results.items())
+
+
+class TestLookupResults:
+
+    def test_named_and_unnamed_errors_without_extra_requests(self):
+        fake, amazon = make_amazon()
+        fake.invalid.add(ASINS[1])
+        fake.inaccessible.update([ASINS[4], ASINS[7]])
+        results = amazon.lookup_results(ASINS + ['ABC123'])
+        assert fake.calls == ['ItemLookup']
+        assert statuses(results)[ASINS[0]] == FOUND and results[ASINS[0]].item['ASIN'] == ASINS[0]
+        assert statuses(results)[ASINS[1]] == INVALID
+        assert statuses(results)[ASINS[4]] == statuses(results)[ASINS[7]] == NOT_ACCESSIBLE
+        assert statuses(results)['ABC123'] == INVALID
+        with pytest.raises(AmazonException):
+            amazon.lookup(ASINS)
+
+    def test_ambiguous_errors_bisect(self):
+        fake, amazon = make_amazon()
+        fake.inaccessible.add(ASINS[2])
+        fake.no_match.add(ASINS[8])
+        results = amazon.lookup_results(ASINS)
+        assert statuses(results)[ASINS[2]] == NOT_ACCESSIBLE
+        assert statuses(results)[ASINS[8]] == NOT_FOUND
+        assert fake.calls == ['ItemLookup'] * 3
+
+    def test_throttled_batch(self):
+        fake, amazon = make_amazon()
+        fake.throttle = 1
+        results = amazon.lookup_results(ASINS + ['B000000099'])
+        assert [r.status for r in results.values()] == [THROTTLED] * 10 + [FOUND]
+
+    def test_throttle_detected_by_code(self):
+        fake, amazon = make_amazon()
+        fake.throttle = 1
+        with pytest.raises(AmazonException) as err:
+            amazon.ItemLookup(ASINS[0])
+        assert is_throttled(err.value) and err.value.code == 'RequestThrottled'
+        assert not is_throttled(AmazonException('No RequestThrottled in Keywords'))
+
+
+class TestNegativeCache:
+
+    def test_known_missing_skipped_without_request(self):
+        fake, amazon = make_amazon(negative_cache=True)
+        fake.invalid.add(ASINS[1])
+        fake.no_match.add(ASINS[2])
+        amazon.lookup_results(ASINS[:4])
+        assert len(fake.calls) == 1
+        results = amazon.lookup_results(ASINS[1:3])
+        assert len(fake.calls) == 1
+        assert statuses(results) == {ASINS[1]: INVALID, ASINS[2]: NOT_FOUND}
+        assert 'AWS.InvalidParameterValue' in results[ASINS[1]].error
+        with pytest.raises(AmazonException) as err:
+            amazon.lookup(ASINS[:4])
+        assert 'AWS.InvalidParameterValue' in str(err.value) and len(fake.calls) == 1
+        items = amazon.lookup(ASINS[:4], raise_errors=False)
+        assert [item['ASIN'] for item in items] == [ASINS[0], ASINS[3]]
+        assert fake.params[-1]['ItemId'] == ','.join([ASINS[0], ASINS[3]])
+
+    def test_lookup_remembers_named_errors(self):
+        fake, amazon = make_amazon(negative_cache=True)
+        fake.invalid.add(ASINS[1])
+        with pytest.raises(AmazonException):
+            amazon.lookup(ASINS[:3])
+        assert amazon.negative_cache.get('US', ASINS[1])[0] == INVALID
+        assert len(amazon.lookup(ASINS[:3], raise_errors=False)) == 2
+
+    def test_entries_expire_per_status(self):
+        now = [1000.0]
+        fake, amazon = make_amazon(negative_cache=True, negative_ttl={NOT_FOUND: 60})
+        amazon.negative_cache.clock = lambda: now[0]
+        fake.invalid.add(ASINS[1])
+        fake.no_match.add(ASINS[2])
+        amazon.lookup_results(ASINS[1:3])
+        now[0] += 61
+        assert amazon.negative_cache.get('US', ASINS[2]) is None
+        assert amazon.negative_cache.get('US', ASINS[1])[0] == INVALID
+        assert amazon.negative_cache.get('UK', ASINS[1]) is None
+
+    def test_disabled_by_default(self):
+        fake, amazon = make_amazon()
+        fake.invalid.add(ASINS[1])
+        amazon.lookup_results(ASINS[:2])
+        amazon.lookup_results(ASINS[:2])
+        assert len(fake.calls) == 2
+
+    def test_bounded(self):
+        now = [1000.0]
+        cache = NegativeCache({INVALID: 60, NOT_FOUND: 10}, max_entries=3, clock=lambda: now[0])
+        cache.put('US', ASINS[0], NOT_FOUND)
+        cache.put('US', ASINS[1], INVALID)
+        cache.put('US', ASINS[2], INVALID)
+        now[0] += 30
+        cache.put('US', ASINS[3], INVALID)
+        assert len(cache) == 3 and cache.get('US', ASINS[1])[0] == INVALID
+        cache.put('US', ASINS[4], INVALID)
+        assert len(cache) == 3 and cache.get('US', ASINS[1]) is None
+        assert cache.get('US', ASINS[4])[0] == INVALID
+
+    def test_full_cache_purges_periodically(self):
+        now = [1000.0]
+        purges = []
+        cache = NegativeCache({INVALID: 60, NOT_FOUND: 10}, max_entries=2, clock=lambda: now[0])
+        cache.purge = lambda: purges.append(now[0]) or 0
+        for i in range(6):
+            cache.put('US', 'B%09d' % i, INVALID)
+        now[0] += 10
+        cache.put('US', ASINS[0], INVALID)
+        assert purges == [1000.0, 1010.0]
+        assert list(cache._entries) == [('US', 'B000000005'), ('US', ASINS[0])]
@@ -0,0 +1,80 @@
+#!/usr/bin/env
+# -*- coding: utf-8 -*-
+import time
+import pytest
+import sys
+import os.path
+sys.path.append(os.path.dirname(os.path.realpath(__file__)) + "/../")
+
+from paapy.api import Amazon, AmazonCart
+from paapy.exceptions import DeadlineExceeded
+from paapy.parsing import ProcessParser, parse_response
+from paapy.standin import StandInAmazon
+from paapy.transport import MemoryTransport
+
+ASINS = ['B%09d' % i for i in range(10)]
+
+
+@pytest.fixture
+def parser():
+    parser = ProcessParser(max_workers=2, min_bytes=2000)
+    yield parser
+    parser.close()
+
+
+class TestProcessParser:
+
+    def test_large_responses_parsed_in_processes(self, parser):
+        fake = StandInAmazon(items=20, item_bytes=4000)
+        amazon = Amazon('tag', 'key', 'secret', transport=MemoryTransport(fake), parser=parser)
+        plain = Amazon('tag', 'key', 'secret', transport=MemoryTransport(fake))
+        items = amazon.lookup(ASINS)
+        assert items == plain.lookup(ASINS)
+        assert parser.offloaded == 1
+
+    def test_small_responses_parsed_locally(self, parser):
+        fake = StandInAmazon(items=20)
+        cart = AmazonCart('tag', 'key', 'secret', transport=MemoryTransport(fake), parser=parser,
+                          ItemId=ASINS[0])
+        assert cart.cart_id
+        assert parser.local == 1 and parser.offloaded == 0
+
+    def test_large_cart_responses_parsed_in_processes(self, parser):
+        asins = ['B%09d' % i for i in range(40)]
+        fake = StandInAmazon(items=40)
+        cart = AmazonCart('tag', 'key', 'secret', transport=MemoryTransport(fake), parser=parser,
+                          ItemId=asins[:10], Quantity=[1] * 10)
+        for i in range(10, 40, 10):
+            cart.add(ItemId=asins[i:i + 10], Quantity=[1] * 10)
+        cart.modify(ItemId=asins[5], Quantity=3)
+        assert parser.offloaded == 5
+        assert len(cart.items) == 40 and cart.items.by_asin(asins[5])['Quantity'] == 3
+
+    def test_parse_response(self):
+        _, body = StandInAmazon(items=2)('/onca/xml?Operation=ItemLookup&ItemId=B000000001')
+        assert parse_response(body, 'ItemLookup')['Items']['Item']['ASIN'] == 'B000000001'
+
+    def test_busy_workers_not_queued_behind(self, parser):
+        _, body = StandInAmazon(items=2, item_bytes=4000)(
+            '/onca/xml?Operation=ItemLookup&ItemId=B000000001')
+        parser._busy = parser.max_workers
+        assert parser.parse(body, 'ItemLookup')['Items']['Item']['ASIN'] == 'B000000001'
+        assert parser.stats()['local'] == 1 and parser.offloaded == 0
+
+    def test_timed_out_parse_frees_its_worker(self, parser):
+        _, body = StandInAmazon(items=20, item_bytes=20000)(
+            '/onca/xml?Operation=ItemLookup&ItemId=' + ','.join(ASINS))
+        with pytest.raises(DeadlineExceeded):
+            parser.parse(body, 'ItemLookup', timeout=0.0001)
+        for _ in range(100):
+            if parser.stats()['busy'] == 0:
+                break
+            time.sleep(0.05)
+        assert parser.stats() == {'offloaded': 1, 'local': 0, 'timeouts': 1, 'busy': 0}
+
+    def test_client_closes_its_parser(self):
+        amazon = Amazon('tag', 'key', 'secret', transport=MemoryTransport(StandInAmazon(items=2)),
+                        parser=True)
+        amazon.close()
+        assert amazon.parser._pool is None
+        assert amazon.lookup(ASINS[1])[0]['ASIN'] == ASINS[1]
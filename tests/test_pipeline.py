@@ -0,0 +1,76 @@
+#!/usr/bin/env
+# -*- coding: utf-8 -*-
+import json
+import pytest
+import sys
+import os.path
+sys.path.append(os.path.dirname(os.path.realpath(__file__)) + "/../")
+
+from paapy.api import Amazon
+from paapy.exceptions import AmazonException
+from paapy.pipeline import IngestPipeline, read_ids
+from paapy.transport import MemoryTransport
+
+from fake_amazon import FakeAmazon
+
+
+class CrashingFake(FakeAmazon):
+
+    def __init__(self, crash_at):
+        super(CrashingFake, self).__init__()
+        self.crash_at = crash_at
+
+    def __call__(self, url, timeout, headers):
+        if len(self.calls) == self.crash_at:
+            self.calls.append('crash')
+            return 403, (b'<ItemLookupErrorResponse><Error><Code>Crash</Code>'
+                         b'<Message>crash</Message></Error></ItemLookupErrorResponse>')
+        return super(CrashingFake, self).__call__(url, timeout, headers)
+
+
+def write_ids(tmpdir, count):
+    path = str(tmpdir.join('ids.txt'))
+    with open(path, 'w') as id_file:
+        for i in range(count):
+            id_file.write('B%09d\n' % i)
+        id_file.write('\n')
+    return path
+
+
+class TestIngestPipeline:
+
+    def test_read_ids(self):
+        assert list(read_ids(['B000000001, B000000002\n', '\n', 'B000000003'])) == \
+            ['B000000001', 'B000000002', 'B000000003']
+
+    def test_resume_after_crash(self, tmpdir):
+        source = write_ids(tmpdir, 45)
+        output = str(tmpdir.join('items.jsonl'))
+        fake = CrashingFake(crash_at=3)
+        amazon = Amazon('tag', 'key', 'secret', retry_count=0,
+                        transport=MemoryTransport(fake))
+        pipeline = IngestPipeline(amazon, output)
+        with pytest.raises(AmazonException):
+            pipeline.run(source)
+        assert pipeline.load_checkpoint()['consumed'] == 30
+
+        state = pipeline.run(source)
+        assert state['complete'] and state['consumed'] == 45 and state['items'] == 45
+        assert fake.calls == ['ItemLookup'] * 3 + ['crash'] + ['ItemLookup'] * 2
+        with open(output) as out:
+            asins = [json.loads(line)['ASIN'] for line in out]
+        assert asins == ['B%09d' % i for i in range(45)]
+        assert pipeline.run(source)['complete'] and len(fake.calls) == 6
+
+    def test_failed_ids_recorded(self, tmpdir):
+        source = write_ids(tmpdir, 25)
+        output = str(tmpdir.join('items.jsonl'))
+        fake = FakeAmazon()
+        fake.invalid.add('B000000003')
+        fake.no_match.add('B000000017')
+        amazon = Amazon('tag', 'key', 'secret', transport=MemoryTransport(fake))
+        state = IngestPipeline(amazon, output).run(source)
+        assert state['complete'] and state['items'] == 23 and state['failed'] == 2
+        with open(output + '.failed') as failed:
+            assert [json.loads(line)[:2] for line in failed] == \
+                [['B000000003', 'Invalid'], ['B000000017', 'NotFound']]
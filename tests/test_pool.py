@@ -0,0 +1,87 @@
+#!/usr/bin/env
+# -*- coding: utf-8 -*-
+import pytest
+import sys
+import os.path
+sys.path.append(os.path.dirname(os.path.realpath(__file__)) + "/../")
+
+from paapy.pool import CredentialPool
+from paapy.exceptions import AmazonException
+from paapy.transport import MemoryTransport
+
+from fake_amazon import FakeAmazon
+
+TEST_ASIN = 'B00JM5GW10'
+TEST_ASIN_2 = 'B00WI0QCAM'
+
+CREDENTIALS = [('tag', 'key-1', 'secret-1'), ('tag', 'key-2', 'secret-2')]
+
+
+def make_pool(fake, **kwargs):
+    return CredentialPool(CREDENTIALS, transport=MemoryTransport(fake), qps=1000, **kwargs)
+
+
+class TestCredentialPool:
+
+    def test_routes_to_free_credentials(self):
+        fake = FakeAmazon()
+        pool = make_pool(fake)
+        for _ in range(4):
+            pool.lookup(TEST_ASIN)
+        keys = [p['AWSAccessKeyId'] for p in fake.params]
+        assert sorted(keys) == ['key-1', 'key-1', 'key-2', 'key-2']
+        assert [s['requests'] for s in pool.stats()] == [2, 2]
+
+    def test_throttled_credentials_rest(self):
+        fake = FakeAmazon()
+        pool = make_pool(fake, retry_count=0, cooldown=60)
+        fake.throttle = 1
+        items = pool.lookup(TEST_ASIN)
+        assert items[0]['ASIN'] == TEST_ASIN
+        throttled, other = pool.stats()
+        assert throttled['throttles'] == 1 and not throttled['healthy']
+        assert other['healthy'] and other['throttles'] == 0
+        pool.lookup(TEST_ASIN_2)
+        assert [p['AWSAccessKeyId'] for p in fake.params] == ['key-2', 'key-2']
+
+    def test_bulk_lookup_spread_over_credentials(self):
+        fake = FakeAmazon()
+        pool = make_pool(fake, retry_count=0)
+        asins = ['B%09d' % i for i in range(40)]
+        assert [item['ASIN'] for item in pool.lookup(asins)] == asins
+        assert len(fake.params) == 4
+        assert set(p['AWSAccessKeyId'] for p in fake.params) == set(['key-1', 'key-2'])
+        del fake.calls[:]
+        fake.throttle = 1
+        assert [item['ASIN'] for item in pool.lookup(asins)] == asins
+        # only the throttled batch is sent again
+        assert sorted(fake.calls) == ['ItemLookup'] * 4 + ['throttled']
+        pool.close()
+
+    def test_acquire_reserves_credentials(self):
+        pool = make_pool(FakeAmazon())
+        first, second = pool._acquire(), pool._acquire()
+        assert first is not second
+
+    def test_throttled_everywhere_raises(self):
+        fake = FakeAmazon()
+        pool = make_pool(fake, retry_count=0)
+        fake.throttle = 2
+        with pytest.raises(AmazonException):
+            pool.lookup(TEST_ASIN)
+        assert fake.calls == ['throttled', 'throttled']
+
+    def test_carts_stay_on_their_credentials(self):
+        fake = FakeAmazon()
+        pool = make_pool(fake)
+        pool.lookup(TEST_ASIN)
+        cart = pool.cart(ItemId=TEST_ASIN)
+        assert cart.AWSAccessKeyId == 'key-2'
+        state = cart.to_dict()
+        assert state['AWSAccessKeyId'] == 'key-2'
+        rehydrated = pool.rehydrate([state])[0]
+        rehydrated.add(ItemId=TEST_ASIN_2)
+        assert fake.params[-1]['AWSAccessKeyId'] == 'key-2'
+        state['AWSAccessKeyId'] = 'unknown'
+        with pytest.raises(AmazonException):
+            pool.rehydrate([state])
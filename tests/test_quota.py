@@ -0,0 +1,119 @@
+#!/usr/bin/env
+# -*- coding: utf-8 -*-
+import time
+import pytest
+import sys
+import os.path
+sys.path.append(os.path.dirname(os.path.realpath(__file__)) + "/../")
+
+from paapy.api import Amazon
+from paapy.deadline import Deadline
+from paapy.exceptions import DeadlineExceeded, QuotaExceeded
+from paapy.quota import DailyQuota
+from paapy.ratelimit import RateLimiter
+from paapy.transport import MemoryTransport
+
+from fake_amazon import FakeAmazon
+
+
+class Clock(object):
+
+    def __init__(self, now=1000000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+class TestDailyQuota:
+
+    def test_reserve_held_back_from_batch(self):
+        clock = Clock()
+        quota = DailyQuota(10, window=1000, reserve=0.2, buckets=100, clock=clock,
+                           sleep=clock.sleep)
+        for _ in range(8):
+            quota.acquire('batch')
+        # paced 125 secs apart, all inside the window
+        assert clock.now == 1000875.0
+        assert quota.remaining('batch') == 0
+        assert quota.remaining() == 2
+        with pytest.raises(QuotaExceeded):
+            quota.acquire('batch')
+        quota.acquire('interactive')
+        quota.acquire()
+        with pytest.raises(QuotaExceeded):
+            quota.acquire()
+
+    def test_rolling_window(self):
+        clock = Clock()
+        quota = DailyQuota(3, window=100, reserve=0, buckets=10, clock=clock)
+        quota.acquire()
+        clock.now += 50
+        quota.acquire()
+        quota.acquire()
+        assert quota.remaining() == 0
+        assert quota.frees_at() == 1000110.0
+        clock.now += 60
+        assert quota.remaining() == 1
+        assert quota.used() == 2
+
+    def test_batch_paced_over_window(self):
+        quota = DailyQuota(20, window=1, reserve=0.5)
+        assert quota.batch_interval == 0.1
+        start = time.time()
+        for _ in range(4):
+            quota.acquire('batch')
+        # first request is immediate, the other three 1/10 sec apart
+        assert time.time() - start >= 0.29
+        start = time.time()
+        quota.acquire('interactive')
+        assert time.time() - start < 0.05
+        with pytest.raises(DeadlineExceeded):
+            quota.acquire('batch', Deadline(0.01))
+
+    def test_persisted(self, tmpdir):
+        path = str(tmpdir.join('quota.json'))
+        clock = Clock()
+        quota = DailyQuota(100, path=path, save_every=2, clock=clock)
+        quota.acquire()
+        assert not os.path.exists(path)
+        quota.record(2)
+        assert DailyQuota(100, path=path, clock=clock).used() == 3
+        quota.acquire()
+        quota.close()
+        assert DailyQuota(100, path=path, clock=clock).used() == 4
+        clock.now += 24 * 60 * 60 + 60
+        assert DailyQuota(100, path=path, clock=clock).remaining() == 100
+
+    def test_client_counts_requests(self):
+        quota = DailyQuota(2, reserve=0)
+        amazon = Amazon('tag', 'key', 'secret', transport=MemoryTransport(FakeAmazon()),
+                        quota=quota)
+        amazon.ItemLookup(ItemId='B000000001')
+        amazon.ItemLookup(ItemId='B000000002')
+        assert quota.stats()['remaining'] == 0
+        with pytest.raises(QuotaExceeded):
+            amazon.ItemLookup(ItemId='B000000003')
+
+    def test_request_counted_after_limiter(self):
+        limiter = RateLimiter(1)
+        limiter.wait()
+        quota = DailyQuota(10, reserve=0)
+        amazon = Amazon('tag', 'key', 'secret', transport=MemoryTransport(FakeAmazon()),
+                        quota=quota, limiter=limiter)
+        with pytest.raises(DeadlineExceeded):
+            amazon.ItemLookup(ItemId='B000000001', deadline=0.1)
+        assert quota.used() == 0
+
+    def test_saved_over_existing_file(self, tmpdir):
+        path = str(tmpdir.join('quota.json'))
+        quota = DailyQuota(100, path=path)
+        quota.acquire()
+        quota.save()
+        quota.acquire()
+        quota.save()
+        assert DailyQuota(100, path=path).used() == 2
+        assert not os.path.exists(path + '.tmp')
@@ -0,0 +1,100 @@
+#!/usr/bin/env
+# -*- coding: utf-8 -*-
+import threading
+import time
+import pytest
+import sys
+import os.path
+sys.path.append(os.path.dirname(os.path.realpath(__file__)) + "/../")
+
+from paapy.api import Amazon
+from paapy.ratelimit import RateLimiter
+from paapy.transport import MemoryTransport
+
+from fake_amazon import FakeAmazon
+
+
+class TestRateLimiter:
+
+    def test_bad_qps(self):
+        with pytest.raises(ValueError) as err:
+            RateLimiter('fast')
+        assert 'qps' in str(err)
+
+    def test_threads_share_spacing(self):
+        limiter = RateLimiter(50)
+        start = time.time()
+        threads = [threading.Thread(target=limiter.wait) for _ in range(10)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        # first slot is immediate, the other nine are 1/50 sec apart
+        assert time.time() - start >= 9 / 50.0 - 0.01
+
+    def test_interactive_goes_first(self):
+        limiter = RateLimiter(50, lanes=(('interactive', 0), ('batch', 0)))
+        limiter.wait()  # the next slot is 1/50 sec away
+        order = []
+
+        def send(priority):
+            limiter.wait(priority)
+            order.append(priority)
+
+        threads = [threading.Thread(target=send, args=('batch',)) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        while limiter.depth()['batch'] < 3:
+            time.sleep(0.001)
+        late = threading.Thread(target=send, args=('interactive',))
+        late.start()
+        for thread in threads + [late]:
+            thread.join()
+        assert order[0] == 'interactive'
+        assert limiter.served == {'interactive': 2, 'batch': 3}
+
+    def queue_and_run(self, limiter, priorities):
+        """queue one waiting thread per priority before a slot is free, return the order served"""
+        order = []
+
+        def send(priority):
+            limiter.wait(priority)
+            order.append(priority)
+
+        for _ in range(5):
+            limiter.reserve()  # hold the next few slots
+        threads = [threading.Thread(target=send, args=(p,)) for p in priorities]
+        for thread in threads:
+            thread.start()
+        while sum(limiter.depth().values()) < len(priorities):
+            time.sleep(0.001)
+        for thread in threads:
+            thread.join()
+        return order
+
+    def test_minimum_share(self):
+        limiter = RateLimiter(50, lanes=(('interactive', 0), ('batch', 0.5)), history=10)
+        order = self.queue_and_run(limiter, ['interactive'] * 4 + ['batch'] * 4)
+        # batch has half the slots it waits for, whatever the interactive queue
+        assert order[:4].count('batch') == 2
+
+    def test_no_catching_up_on_uncontested_slots(self):
+        limiter = RateLimiter(100, history=30)
+        for _ in range(30):
+            limiter.wait()  # interactive only, batch has nothing queued
+        order = self.queue_and_run(limiter, ['interactive'] * 5 + ['batch'] * 5)
+        assert order[:6].count('batch') == 1
+
+    def test_unknown_priority(self):
+        with pytest.raises(ValueError):
+            RateLimiter(1).wait('urgent')
+
+    def test_client_priority(self):
+        fake = FakeAmazon()
+        limiter = RateLimiter(1000)
+        amazon = Amazon('tag', 'key', 'secret', transport=MemoryTransport(fake),
+                        limiter=limiter, priority='batch')
+        amazon.lookup('B00JM5GW10')
+        amazon.lookup('B00JM5GW10', priority='interactive')
+        assert limiter.served == {'interactive': 1, 'batch': 1}
+        assert 'priority' not in fake.params[0]
@@ -0,0 +1,102 @@
+#!/usr/bin/env
+# -*- coding: utf-8 -*-
+import sys
+import os.path
+sys.path.append(os.path.dirname(os.path.realpath(__file__)) + "/../")
+
+from paapy.api import Amazon
+from paapy.scheduler import RefreshScheduler, percentile
+from paapy.transport import MemoryTransport
+
+from fake_amazon import FakeAmazon
+
+
+class FakeClock(object):
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+def asin(i):
+    return 'B%09d' % i
+
+
+def make_scheduler(**kwargs):
+    fake = FakeAmazon()
+    amazon = Amazon('tag', 'key', 'secret', transport=MemoryTransport(fake))
+    clock = FakeClock()
+    scheduler = RefreshScheduler(amazon, clock=clock, sleep=clock.sleep, **kwargs)
+    return fake, clock, scheduler
+
+
+class TestRefreshScheduler:
+
+    def test_percentile(self):
+        assert percentile([], 50) is None
+        assert percentile(list(range(101)), 90) == 90
+
+    def test_batches_most_urgent_first(self):
+        fake, clock, scheduler = make_scheduler(qps=1, horizon=100)
+        scheduler.track([asin(i) for i in range(25)], last_refreshed=900)
+        scheduler.track(asin(30), weight=10, last_refreshed=950)
+        scheduler.track(asin(31))
+        batch = [entry[2] for entry in scheduler.next_batch()]
+        assert batch[:2] == [asin(31), asin(30)] and len(batch) == 10
+
+    def test_run_paces_at_qps_and_reports_coverage(self):
+        seen = []
+        fake, clock, scheduler = make_scheduler(qps=2, callback=seen.extend)
+        scheduler.track([asin(i) for i in range(30)])
+        scheduler.run(max_batches=6)
+        assert fake.calls == ['ItemLookup'] * 6 and len(seen) == 60
+        assert clock.now == 1002.5
+        report = scheduler.coverage()
+        assert report['tracked'] == 30 and report['never_refreshed'] == 0
+        assert report['oldest_staleness'] == 1.0
+        assert report['refresh_latency_p50'] == 1.5
+
+    def test_untrack(self):
+        fake, clock, scheduler = make_scheduler(qps=1)
+        scheduler.track([asin(1), asin(2)]).untrack(asin(1))
+        assert [entry[2] for entry in scheduler.next_batch()] == [asin(2)]
+
+    def test_failed_batch_backs_off(self):
+        fake, clock, scheduler = make_scheduler(qps=1, retry_delay=10, horizon=1000)
+        scheduler.amazon.retry_count = 0
+        scheduler.track([asin(i) for i in range(10)], last_refreshed=0)
+        fake.throttle = 1
+        assert scheduler.step() == []
+        assert scheduler.failures == dict((asin(i), 1) for i in range(10))
+        # the failed batch waits, other items go first
+        scheduler.track(asin(20), last_refreshed=500)
+        assert [entry[2] for entry in scheduler.next_batch()] == [asin(20)]
+        clock.now += 10
+        fake.throttle = 1
+        assert scheduler.step() == []
+        assert scheduler.failures[asin(0)] == 2
+        clock.now += 19
+        assert scheduler.next_batch() == []
+        clock.now += 1
+        assert len(scheduler.step()) == 10
+        assert scheduler.coverage()['failing'] == 0
+
+    def test_mixed_batch_fails_only_bad_items(self):
+        fake, clock, scheduler = make_scheduler(qps=1, retry_delay=10, horizon=1000)
+        scheduler.track([asin(i) for i in range(10)], last_refreshed=0)
+        fake.invalid.add(asin(3))
+        fake.no_match.add(asin(5))
+        items = scheduler.step()
+        assert sorted(i['ASIN'] for i in items) == [asin(i) for i in range(10) if i not in (3, 5)]
+        assert scheduler.dropped == [asin(3)]
+        assert scheduler.failures == {asin(5): 1}
+        assert len(scheduler) == 9
+        clock.now += 10
+        fake.no_match.clear()
+        assert scheduler.step()[0]['ASIN'] == asin(5)
+        assert scheduler.failures == {}
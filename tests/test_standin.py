@@ -0,0 +1,90 @@
+#!/usr/bin/env
+# -*- coding: utf-8 -*-
+import pytest
+import sys
+import os.path
+sys.path.append(os.path.dirname(os.path.realpath(__file__)) + "/../")
+
+from paapy.api import Amazon, AmazonCart
+from paapy.exceptions import AmazonException
+from paapy.loadgen import histogram, main, run_load
+from paapy.standin import StandInAmazon, StandInServer
+from paapy.transport import MemoryTransport, UrllibTransport
+
+
+@pytest.fixture(scope='module')
+def server():
+    server = StandInServer(items=200).start()
+    yield server
+    server.stop()
+
+
+def client(server, **kwargs):
+    return Amazon('tag', 'key', 'secret', Endpoint=server.endpoint,
+                  transport=UrllibTransport(), **kwargs)
+
+
+class TestStandInServer:
+
+    def test_lookup_over_http(self, server):
+        amazon = client(server)
+        asins = list(server.amazon.catalog)[:12]
+        items = amazon.lookup(asins)
+        assert [item['ASIN'] for item in items] == asins
+        assert int(items[0]['OfferSummary']['LowestNewPrice']['Amount']) > 0
+        results = amazon.lookup_results(['B999999999', asins[0]])
+        assert results['B999999999'].status == 'NotFound'
+
+    def test_search_browse_and_similar(self, server):
+        amazon = client(server)
+        response = amazon.ItemSearch(SearchIndex='All', Keywords='books', ItemPage=2)
+        assert int(response['Items']['TotalResults']) == 40
+        assert len(response['Items']['Item']) == 10
+        node = amazon.BrowseNodeLookup(BrowseNodeId='1000')['BrowseNodes']['BrowseNode']
+        assert node['Name'] == 'Books' and len(node['Children']['BrowseNode']) == 7
+        similar = amazon.SimilarityLookup(ItemId='B000000000')['Items']['Item']
+        assert all(item['ASIN'] != 'B000000000' for item in similar)
+
+    def test_cart_operations(self, server):
+        cart = AmazonCart('tag', 'key', 'secret', Endpoint=server.endpoint,
+                          transport=UrllibTransport(), ItemId='B000000001')
+        cart.add(ItemId='B000000002')
+        cart.modify(ItemId='B000000001', Quantity=3)
+        assert sorted((i['ASIN'], i['Quantity']) for i in cart.items) == \
+            [('B000000001', 3), ('B000000002', 1)]
+        cart.clear()
+        assert len(cart.items) == 0
+
+    def test_cart_hmac_mismatch_changes_nothing(self):
+        fake = StandInAmazon(items=20)
+        fake('/onca/xml?Operation=CartCreate&Item.1.ASIN=B000000001&Item.1.Quantity=1')
+        cart_id = list(fake.carts)[0]
+        _, body = fake('/onca/xml?Operation=CartClear&CartId=%s&HMAC=wrong' % cart_id)
+        assert b'CartInfoMismatch' in body
+        assert len(fake.carts[cart_id]['items']) == 1
+
+    def test_fault_injection(self):
+        fake = StandInAmazon(items=20, throttle_rate=1.0)
+        amazon = Amazon('tag', 'key', 'secret', transport=MemoryTransport(fake), retry_count=1)
+        with pytest.raises(AmazonException) as err:
+            amazon.lookup('B000000001')
+        assert 'RequestThrottled' in str(err) and fake.counts['ItemLookup'] == 2
+        padded = StandInAmazon(items=2, item_bytes=5000)
+        _, body = padded('/onca/xml?Operation=ItemLookup&ItemId=B000000001')
+        assert len(body) > 5000
+
+
+class TestLoadGenerator:
+
+    def test_run_load(self, server):
+        result = run_load(client(server), list(server.amazon.catalog), workload='mixed',
+                          threads=4, duration=None, requests=20, batch_size=5)
+        assert result.completed() >= 20 and result.failed() == 0
+        assert sum(count for _, count in histogram(result.latencies['lookup'])) == \
+            len(result.latencies['lookup'])
+
+    def test_main(self, capsys):
+        assert main(['--transport', 'urllib', '--threads', '2', '--requests', '10',
+                     '--items', '50', '--throttle-rate', '0.2']) == 0
+        out = capsys.readouterr()[0]
+        assert 'lookup:' in out and 'p99' in out
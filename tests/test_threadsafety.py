@@ -0,0 +1,52 @@
+#!/usr/bin/env
+# -*- coding: utf-8 -*-
+from base64 import b64encode
+from hashlib import sha256
+import hmac
+import threading
+import sys
+import os.path
+sys.path.append(os.path.dirname(os.path.realpath(__file__)) + "/../")
+
+from paapy.api import Amazon
+from paapy.productadvertising import Signer, quote
+from paapy.transport import MemoryTransport
+
+from fake_amazon import FakeAmazon
+
+THREADS = 64
+
+
+class TestSharedClient:
+
+    def test_signer_matches_hmac(self):
+        msg = 'GET\nwebservices.amazon.com\n/onca/xml\nItemId=B00JM5GW10'
+        expected = quote(b64encode(hmac.new(b'secret', msg.encode('utf-8'), sha256).digest()))
+        signer = Signer(u'secret')
+        assert signer.sign(msg) == expected
+        assert signer.sign(msg) == expected
+
+    def test_one_client_many_threads(self):
+        fake = FakeAmazon()
+        amazon = Amazon('tag', 'key', u'secret', transport=MemoryTransport(fake))
+        errors = []
+
+        def worker(n):
+            asin = 'B00JM5GW%02d' % n
+            try:
+                for _ in range(5):
+                    items = amazon.lookup(asin)
+                    assert [item['ASIN'] for item in items] == [asin]
+                    # each thread sees its own last response
+                    assert amazon._response['Items']['Item']['ASIN'] == asin
+            except Exception as err:
+                errors.append(err)
+
+        threads = [threading.Thread(target=worker, args=(n,)) for n in range(THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert errors == []
+        assert amazon.transfer_stats['responses'] == THREADS * 5
+        assert amazon.AWSAccessKeySecret == u'secret'
@@ -0,0 +1,160 @@
+#!/usr/bin/env
+# -*- coding: utf-8 -*-
+import gzip
+import io
+import threading
+import zlib
+import pytest
+import sys
+import os.path
+sys.path.append(os.path.dirname(os.path.realpath(__file__)) + "/../")
+
+try:
+    from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+except ImportError:
+    from http.server import HTTPServer, BaseHTTPRequestHandler
+
+from paapy.productadvertising import ProductAdvertisingAPI
+from paapy.transport import (MemoryTransport, RequestsTransport,
+                             TransportResponse, UrllibTransport, decode_content)
+from paapy.exceptions import AmazonException, TransportException
+
+TEST_ASIN = 'B00JM5GW10'
+
+LOOKUP_XML = (b'<?xml version="1.0" ?><ItemLookupResponse><Items>'
+              b'<Request><IsValid>True</IsValid></Request>'
+              b'<Item><ASIN>B00JM5GW10</ASIN></Item></Items></ItemLookupResponse>')
+
+ERROR_XML = (b'<?xml version="1.0" ?><ItemLookupErrorResponse><Error>'
+             b'<Code>RequestThrottled</Code><Message>Slow down</Message>'
+             b'</Error></ItemLookupErrorResponse>')
+
+
+def gzip_bytes(data):
+    buf = io.BytesIO()
+    with gzip.GzipFile(fileobj=buf, mode='wb') as gz_file:
+        gz_file.write(data)
+    return buf.getvalue()
+
+
+class _Handler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        status, body = (503, ERROR_XML) if 'Fail' in self.path else (200, LOOKUP_XML)
+        self.send_response(status)
+        if 'gzip' in self.headers.get('Accept-Encoding', ''):
+            body = gzip_bytes(body)
+            self.send_header('Content-Encoding', 'gzip')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture(scope='module')
+def server_url():
+    server = HTTPServer(('127.0.0.1', 0), _Handler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    yield 'http://127.0.0.1:%s/onca/xml' % server.server_address[1]
+    server.shutdown()
+
+
+class TestTransports:
+
+    def test_memory_transport_used_by_api(self):
+        transport = MemoryTransport(lambda url, timeout, headers: (200, LOOKUP_XML))
+        api = ProductAdvertisingAPI('tag', 'key', 'secret', transport=transport)
+        response = api.ItemLookup(TEST_ASIN)
+        assert response['Items']['Item']['ASIN'] == TEST_ASIN
+        assert len(transport.requests) == 1 and 'Signature=' in transport.requests[0]
+
+    def test_memory_transport_error_status_retried(self):
+        transport = MemoryTransport(lambda url, timeout, headers: (503, ERROR_XML))
+        api = ProductAdvertisingAPI('tag', 'key', 'secret', transport=transport, retry_count=2)
+        with pytest.raises(AmazonException) as err:
+            api.ItemLookup(TEST_ASIN)
+        assert 'RequestThrottled' in str(err) and len(transport.requests) == 3
+
+    def test_transport_exception_retried(self):
+        calls = []
+        def handler(url, timeout, headers):
+            calls.append(url)
+            if len(calls) == 1:
+                raise TransportException('ConnectTimeout')
+            return TransportResponse(200, LOOKUP_XML)
+        api = ProductAdvertisingAPI('tag', 'key', 'secret', retry_count=1,
+                                    transport=MemoryTransport(handler))
+        assert api.ItemLookup(TEST_ASIN)['Items']['Item']['ASIN'] == TEST_ASIN
+        assert len(calls) == 2
+
+    @pytest.mark.parametrize('transport_class', [UrllibTransport, RequestsTransport])
+    def test_network_transports(self, server_url, transport_class):
+        transport = transport_class()
+        response = transport.send(server_url, timeout=5)
+        assert response.status_code == 200 and response.content == LOOKUP_XML
+        response = transport.send(server_url + '?Fail=1', timeout=5)
+        assert response.status_code == 503 and response.content == ERROR_XML
+        transport.close()
+
+    @pytest.mark.parametrize('transport_class', [UrllibTransport, RequestsTransport])
+    def test_network_transports_connection_error(self, transport_class):
+        with pytest.raises(TransportException) as err:
+            transport_class().send('http://127.0.0.1:1/onca/xml', timeout=1)
+        assert err.value.sent is False
+
+    def test_cart_operation_retried_only_if_not_sent(self):
+        calls = []
+        def handler(url, timeout, headers):
+            calls.append(url)
+            error = TransportException('ReadTimeout')
+            error.sent = len(calls) > 1
+            raise error
+        api = ProductAdvertisingAPI('tag', 'key', 'secret', retry_count=3,
+                                    transport=MemoryTransport(handler))
+        with pytest.raises(TransportException):
+            api.CartCreate(ItemId=TEST_ASIN)
+        # refused, then sent but unanswered: the second attempt is not repeated
+        assert len(calls) == 2
+
+    @pytest.mark.parametrize('transport_class', [UrllibTransport, RequestsTransport])
+    def test_network_transports_gzip(self, server_url, transport_class):
+        response = transport_class().send(server_url, timeout=5,
+                                          headers={'Accept-Encoding': 'gzip'})
+        assert response.content == LOOKUP_XML
+        assert response.wire_size == len(gzip_bytes(LOOKUP_XML))
+
+
+class TestCompression:
+
+    def test_decode_content(self):
+        assert decode_content(gzip_bytes(LOOKUP_XML), 'gzip') == LOOKUP_XML
+        assert decode_content(zlib.compress(LOOKUP_XML), 'deflate') == LOOKUP_XML
+        assert decode_content(zlib.compress(LOOKUP_XML)[2:-4], 'deflate') == LOOKUP_XML
+        assert decode_content(LOOKUP_XML, None) == LOOKUP_XML
+
+    def test_accept_encoding_sent_and_sizes_reported(self):
+        seen = []
+        compressed = gzip_bytes(LOOKUP_XML)
+        def handler(url, timeout, headers):
+            seen.append(headers)
+            return TransportResponse(200, compressed, {'content-encoding': 'gzip'})
+        api = ProductAdvertisingAPI('tag', 'key', 'secret', transport=MemoryTransport(handler))
+        response = api.ItemLookup(TEST_ASIN)
+        assert response['Items']['Item']['ASIN'] == TEST_ASIN
+        assert seen[0]['Accept-Encoding'] == 'gzip, deflate'
+        assert api.transfer_stats == {'responses': 1, 'wire_bytes': len(compressed),
+                                      'content_bytes': len(LOOKUP_XML)}
+
+    def test_compression_disabled(self):
+        seen = []
+        def handler(url, timeout, headers):
+            seen.append(headers)
+            return (200, LOOKUP_XML)
+        api = ProductAdvertisingAPI('tag', 'key', 'secret', compression=False,
+                                    transport=MemoryTransport(handler))
+        api.ItemLookup(TEST_ASIN)
+        assert seen == [{'Accept-Encoding': 'identity'}]